@@ -0,0 +1,429 @@
+# analysis.py
+# Vectorized session results: a growable answer matrix with a parallel key vector.
+
+import bisect
+import numpy as np
+from config import LETTERS
+
+NO_KEY = -9   # key-vector filler for unkeyed items; never equals an answer (blank is -1)
+LETTER_LUT = np.array(LETTERS + ['-'])   # LETTER_LUT[answer]; -1 wraps to '-'
+
+
+def key_vector(key, n_items):
+    """{item(1-based): choice} -> int8 vector of length n_items (NO_KEY where unkeyed)."""
+    kv = np.full(n_items, NO_KEY, np.int8)
+    for q, a in (key or {}).items():
+        if 1 <= q <= n_items:
+            kv[q-1] = a
+    return kv
+
+
+class KeyMatrix:
+    """
+    Answer-key versions (exam sets A/B/C...) as versions × items int8 arrays. `K` is each version in
+    its own (printed) item order; `canon` is the same key moved to canonical item order via
+    `to_canon` (version item index -> canonical index). Stored answers are canonical, so
+    `canon[versions]` is one gather that keys a whole batch of mixed versions.
+    """
+    def __init__(self, sets, n_items=None):
+        # sets: {name: (key_dict, item_map)} as returned by files_io.parse_answer_key_sets (maps one-to-one)
+        self.names = list(sets) or ["A"]
+        n = n_items or max([max(k, default=0) for k, _ in sets.values()] + [max(m.values(), default=0)
+                                                                           for _, m in sets.values()] + [1])
+        V = len(self.names)
+        self.K = np.full((V, n), NO_KEY, np.int8)
+        self.to_canon = np.tile(np.arange(n), (V, 1))
+        for v, name in enumerate(self.names):
+            key, item_map = sets.get(name, ({}, {}))
+            self.K[v] = key_vector(key, n)
+            for q, c in item_map.items():
+                if 1 <= q <= n and 1 <= c <= n:
+                    self.to_canon[v, q-1] = c - 1
+            if len(np.unique(self.to_canon[v])) != n:
+                # Two printed items on one canonical slot would overwrite each other's answers
+                raise ValueError(f"Set {name}: item map is not one-to-one (see files_io.complete_item_map)")
+        self.canon = np.full((V, n), NO_KEY, np.int8)
+        self.canon[np.arange(V)[:, None], self.to_canon] = self.K
+
+    @classmethod
+    def single(cls, key):
+        return cls({"A": (dict(key or {}), {})})
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def n_items(self):
+        return self.K.shape[1]
+
+    def index(self, name):
+        """Version index of a set name ('' or unknown -> the first set)."""
+        try:
+            return self.names.index(name)
+        except ValueError:
+            return 0
+
+    def indices(self, names):
+        lut = {n: v for v, n in enumerate(self.names)}
+        return np.array([lut.get(n, 0) for n in names], np.intp)
+
+    def key(self, v):
+        """Version v as a {item: choice} dict in its printed order (what grade/annotate expect)."""
+        return {q+1: int(a) for q, a in enumerate(self.K[v].tolist()) if a != NO_KEY}
+
+    def to_canonical(self, answers, v):
+        """Printed-order answers of version v -> canonical order (-1 where nothing maps)."""
+        idx = np.arange(len(answers))
+        k = min(len(idx), self.n_items)
+        idx[:k] = self.to_canon[v, :k]
+        out = np.full(max(len(idx), int(idx.max(initial=-1)) + 1), -1, np.int8)
+        out[idx] = answers
+        return out.tolist()
+
+    def grade(self, answers, versions, limits):
+        """
+        Scores of canonical answer rows (rows × items) keyed per row by `versions`; only the first
+        `limits[i]` printed items of each row's version count. Vectorized over the whole batch.
+        """
+        versions = np.asarray(versions, np.intp)
+        n = self.n_items
+        A = np.full((len(versions), n), -1, np.int8)
+        w = min(n, answers.shape[1])
+        A[:, :w] = answers[:, :w]
+        active = np.zeros((len(versions), n), bool)
+        printed = np.arange(n)[None, :] < np.asarray(limits)[:, None]
+        active[np.arange(len(versions))[:, None], self.to_canon[versions]] = printed
+        return ((A == self.canon[versions]) & active).sum(axis=1)
+
+
+class AnswerMatrix:
+    """
+    Session results as a students × items int8 matrix (-1 = blank), grown by doubling.
+    Scores, per-sheet max and the text fields (name, ID, filename...) are kept in parallel.
+    """
+    def __init__(self, n_items=50, capacity=64):
+        self._data = np.full((capacity, n_items), -1, np.int8)
+        self._scores = np.zeros(capacity, np.int32)
+        self._max = np.zeros(capacity, np.int32)
+        self.meta = []    # per row: timestamp, filename, exam, section, student_name, student_id, score, max
+        self.n = 0
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def n_items(self):
+        return self._data.shape[1]
+
+    @property
+    def answers(self):
+        return self._data[:self.n]
+
+    @property
+    def scores(self):
+        return self._scores[:self.n]
+
+    @property
+    def max_items(self):
+        return self._max[:self.n]
+
+    def _reserve(self, rows, cols):
+        cap, width = self._data.shape
+        if rows <= cap and cols <= width:
+            return
+        new_cap = max(cap, 1)
+        while new_cap < rows:
+            new_cap *= 2
+        data = np.full((new_cap, max(width, cols)), -1, np.int8)
+        data[:self.n, :width] = self._data[:self.n]
+        self._data = data
+        if new_cap != cap:
+            self._scores = np.resize(self._scores, new_cap)
+            self._max = np.resize(self._max, new_cap)
+
+    def append(self, answers, meta):
+        """Add one sheet; `meta` needs at least 'score' and 'max'. Returns the row index."""
+        self._reserve(self.n + 1, len(answers))
+        row = self._data[self.n]
+        row[:] = -1
+        row[:len(answers)] = answers
+        self._scores[self.n] = int(meta['score'])
+        self._max[self.n] = int(meta['max'])
+        self.meta.append(meta)
+        self.n += 1
+        return self.n - 1
+
+    @classmethod
+    def from_arrays(cls, answers, scores, max_items, meta):
+        """Adopt already-built arrays (e.g. from a checkpoint) without per-row appends."""
+        m = cls(answers.shape[1] if answers.ndim == 2 else 50, capacity=max(64, len(meta)))
+        n = len(meta)
+        m._data[:n, :answers.shape[1]] = answers
+        m._scores[:n] = scores
+        m._max[:n] = max_items
+        m.meta = list(meta)
+        m.n = n
+        return m
+
+    def clear(self):
+        self.__init__(self.n_items, 64)
+
+    def _row_width(self, row, max_items):
+        marked = np.flatnonzero(row >= 0)
+        return max(int(max_items), int(marked[-1]) + 1 if marked.size else 0)
+
+    def row_answers(self, i):
+        """Answers of row i: its first `max` items, or further when canonical answers of a key set reach past it."""
+        return self._data[i, :self._row_width(self._data[i], self._max[i])].tolist()
+
+    @property
+    def width(self):
+        """Item columns in use: the largest `max`, or the last marked column when that is further."""
+        if not self.n:
+            return 0
+        marked = np.flatnonzero((self._data[:self.n] >= 0).any(axis=0))
+        return max(int(self._max[:self.n].max()), int(marked[-1]) + 1 if marked.size else 0)
+
+    def correct(self, kv, n_items=None):
+        """Boolean students × items matrix of matches against key vector `kv`."""
+        n_items = len(kv) if n_items is None else n_items
+        self._reserve(self.n, n_items)
+        return self._data[:self.n, :n_items] == kv[:n_items]
+
+    def row_correct(self, i, kv):
+        """Correctness of one sheet against `kv` (O(items))."""
+        self._reserve(self.n, len(kv))
+        return self._data[i, :len(kv)] == kv
+
+    def item_counts(self, kv, n_items=None):
+        return self.correct(kv, n_items).sum(axis=0)
+
+    def grade_all(self, kv):
+        """Recompute every score against `kv`, honouring each sheet's own item count."""
+        C = self.correct(kv)
+        cols = np.arange(C.shape[1])
+        return (C & (cols[None, :] < self._max[:self.n, None])).sum(axis=1)
+
+    def set_answers(self, i, answers):
+        """Replace one row's answers (re-detection)."""
+        k = len(answers)
+        self._reserve(self.n, k)
+        self._data[i] = -1
+        self._data[i, :k] = answers
+
+    def set_scores(self, rows, scores):
+        """Overwrite the scores of `rows` (array and meta) after a re-grade."""
+        for i, sc in zip(np.asarray(rows).tolist(), np.asarray(scores).tolist()):
+            self._scores[i] = sc
+            self.meta[i]['score'] = sc
+
+    def letters(self, n_items):
+        """students × n_items array of answer letters ('-' for blank)."""
+        self._reserve(self.n, n_items)
+        return LETTER_LUT[self._data[:self.n, :n_items]]
+
+
+class RunningStats:
+    """
+    Session statistics maintained in O(1) per confirmed sheet: score histogram (median/mode), running
+    sum and per-score name buckets (lowest/highest names). `remove` undoes an `add`, so re-detected
+    rows are swapped out without a rebuild. (Per-item counts live in ItemAnalysis.)
+    """
+    def __init__(self, n_items=50):
+        self.n = 0
+        self.total = 0
+        self.hist = np.zeros(n_items + 1, np.int64)        # hist[s] = sheets scoring s
+        self.buckets = {}                                  # score -> [(row, name), ...] in row (confirm) order
+
+    def _fit(self, score):
+        if score >= len(self.hist):
+            self.hist = np.concatenate([self.hist, np.zeros(score + 1 - len(self.hist), np.int64)])
+
+    def add(self, row, score, name):
+        self._fit(score)
+        self.n += 1
+        self.total += score
+        self.hist[score] += 1
+        bisect.insort(self.buckets.setdefault(score, []), (row, name))   # a re-added row keeps its place
+
+    def remove(self, row, score):
+        self.n -= 1
+        self.total -= score
+        self.hist[score] -= 1
+        bucket = self.buckets.get(score, [])
+        self.buckets[score] = [e for e in bucket if e[0] != row]
+        if not self.buckets[score]:
+            del self.buckets[score]
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """Bulk (re)build from an AnswerMatrix, e.g. after loading a key."""
+        st = cls(matrix.n_items)
+        sc = matrix.scores
+        st.n, st.total = len(matrix), int(sc.sum())
+        if st.n:
+            st._fit(int(sc.max()))
+            st.hist[:] = np.bincount(sc, minlength=len(st.hist))
+            for i, (s, m) in enumerate(zip(sc.tolist(), matrix.meta)):
+                st.buckets.setdefault(s, []).append((i, m['student_name']))
+        return st
+
+    def mean(self):
+        return self.total / self.n if self.n else None
+
+    def median(self):
+        if not self.n:
+            return None
+        cum = np.cumsum(self.hist)
+        lo = int(np.searchsorted(cum, (self.n - 1)//2 + 1))
+        hi = int(np.searchsorted(cum, self.n//2 + 1))
+        return lo if lo == hi else (lo + hi) / 2
+
+    def mode(self):
+        """Most common score; ties go to the score seen first (same as statistics.mode)."""
+        if not self.n:
+            return None
+        tied = np.flatnonzero(self.hist == self.hist.max())
+        return int(min(tied, key=lambda s: self.buckets[int(s)][0][0]))
+
+    def lowest(self):
+        return int(np.flatnonzero(self.hist)[0]) if self.n else None
+
+    def highest(self):
+        return int(np.flatnonzero(self.hist)[-1]) if self.n else None
+
+    def names_at(self, score):
+        return [name for _, name in self.buckets.get(score, [])]
+
+
+class ItemAnalysis:
+    """
+    Classical item analysis kept as counters, so add/remove are O(items) and a report is one
+    vectorized pass over items × scores (independent of the number of students):
+      - choice[j, c]   sheets choosing c on item j (column 0 = blank, 1.. = A..)
+      - by_score[j, s] sheets with total score s that got item j right
+    From these: difficulty (p), upper/lower 27% discrimination (D, boundary ties split pro rata),
+    point-biserial correlation with the total score, distractor frequencies and KR-20.
+    """
+    UPPER_LOWER = 0.27
+
+    def __init__(self, n_items=50):
+        self.n = 0
+        self.hist = np.zeros(n_items + 1, np.int64)
+        self.choice = np.zeros((n_items, len(LETTERS) + 1), np.int64)
+        self.by_score = np.zeros((n_items, n_items + 1), np.int64)
+        self._cache = {}
+
+    def _fit(self, score, n_items):
+        rows = max(n_items, self.choice.shape[0])
+        cols = max(score + 1, self.by_score.shape[1])
+        if rows > self.choice.shape[0]:
+            self.choice = np.vstack([self.choice, np.zeros((rows - self.choice.shape[0], self.choice.shape[1]), np.int64)])
+        if (rows, cols) != self.by_score.shape:
+            grown = np.zeros((rows, cols), np.int64)
+            grown[:self.by_score.shape[0], :self.by_score.shape[1]] = self.by_score
+            self.by_score = grown
+            self.hist = np.concatenate([self.hist, np.zeros(cols - len(self.hist), np.int64)])
+
+    def _update(self, answers, score, correct_row, sign):
+        answers = np.asarray(answers, np.int64)
+        k = len(answers)
+        self._fit(score, max(k, len(correct_row)))
+        self.n += sign
+        self.hist[score] += sign
+        self.choice[np.arange(k), answers + 1] += sign
+        self.by_score[:len(correct_row), score] += sign * np.asarray(correct_row, np.int64)
+        self._cache.clear()
+
+    def add(self, answers, score, correct_row):
+        self._update(answers, score, correct_row, 1)
+
+    def remove(self, answers, score, correct_row):
+        self._update(answers, score, correct_row, -1)
+
+    @classmethod
+    def from_matrix(cls, matrix, kv):
+        n_items = max(matrix.n_items, len(kv))
+        sc = matrix.scores.astype(np.int64)
+        ia = cls(n_items)
+        ia.n = len(matrix)
+        if ia.n:
+            ia._fit(int(sc.max()), n_items)
+            ia.hist[:] = np.bincount(sc, minlength=len(ia.hist))
+            A = matrix.answers.astype(np.int64) + 1
+            for c in range(ia.choice.shape[1]):
+                ia.choice[:A.shape[1], c] = (A == c).sum(axis=0)
+            C = matrix.correct(kv).astype(np.int64)
+            onehot = np.zeros((ia.n, ia.by_score.shape[1]), np.int64)
+            onehot[np.arange(ia.n), sc] = 1
+            ia.by_score[:C.shape[1]] = C.T @ onehot
+        return ia
+
+    def _group_weights(self, from_top):
+        """Per-score share of each score bucket that falls in the top (or bottom) 27%."""
+        g = self.UPPER_LOWER * self.n
+        h = self.hist[::-1] if from_top else self.hist
+        before = np.cumsum(h) - h
+        take = np.clip(g - before, 0, h)
+        w = np.divide(take, h, out=np.zeros(len(h)), where=h > 0)
+        return (w[::-1] if from_top else w), g
+
+    def report(self, kv, n_items):
+        """
+        Dict of arrays over the first n_items items (NaN where unkeyed): difficulty, discrimination,
+        point_biserial, choice_pct (items × [blank, A..]); plus kr20 and n. Cached until the next add/remove.
+        """
+        ck = (n_items, kv[:n_items].tobytes())
+        if ck in self._cache:
+            return self._cache[ck]
+        self._fit(0, n_items)
+        n = self.n
+        keyed = np.zeros(n_items, bool)
+        keyed[:min(n_items, len(kv))] = kv[:n_items] >= 0
+        scores = np.arange(self.by_score.shape[1], dtype=float)
+        B = self.by_score[:n_items].astype(float)
+        c = B.sum(axis=1)
+        nan = np.full(n_items, np.nan)
+        out = {'n': n, 'keyed': keyed, 'difficulty': nan.copy(), 'discrimination': nan.copy(),
+               'point_biserial': nan.copy(), 'kr20': None,
+               'choice_pct': 100.0 * self.choice[:n_items] / max(n, 1)}
+        if n:
+            p = c / n
+            mean = float(self.hist @ scores) / n
+            var = float(self.hist @ (scores - mean) ** 2) / n
+            w_hi, g = self._group_weights(True)
+            w_lo, _ = self._group_weights(False)
+            disc = (B @ w_hi - B @ w_lo) / g if g > 0 else nan
+            # r_pb = (M_correct - M_all) / sd * sqrt(p / q)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                m1 = (B @ scores) / c
+                rpb = (m1 - mean) / np.sqrt(var) * np.sqrt(p / (1 - p)) if var > 0 else nan
+            out['difficulty'] = np.where(keyed, p, np.nan)
+            out['discrimination'] = np.where(keyed, disc, np.nan)
+            out['point_biserial'] = np.where(keyed & (c > 0) & (c < n), rpb, np.nan)
+            k = int(keyed.sum())
+            if k > 1 and var > 0:
+                pq = float((p * (1 - p))[keyed].sum())
+                out['kr20'] = k / (k - 1) * (1 - pq / var)
+        self._cache[ck] = out
+        return out
+
+
+def decimate_minmax(y, n_out):
+    """
+    Indices of a min/max-bucketed subsample of `y` with at most ~n_out points
+    (each bucket keeps its lowest and highest value; first and last are always kept).
+    """
+    y = np.asarray(y, float)
+    n = len(y)
+    if n <= max(2, n_out):
+        return np.arange(n)
+    b = max(1, int(n_out) // 2)
+    # Even bucket bounds (sizes differ by at most one), so no bucket is empty or all padding
+    bounds = np.linspace(0, n, b + 1).astype(np.intp)
+    base, sizes = bounds[:-1], np.diff(bounds)
+    idx = base[:, None] + np.arange(sizes.max())[None, :]
+    yy = np.where(idx < bounds[1:, None], y[np.minimum(idx, n - 1)], np.nan)
+    lo = base + np.nanargmin(yy, axis=1)
+    hi = base + np.nanargmax(yy, axis=1)
+    return np.unique(np.concatenate([[0, n-1], lo, hi]))
@@ -0,0 +1,178 @@
+# analytics_index.py
+# Persistent cross-session index over OUTPUT_ROOT: per-session summaries, per-student score history
+# and per-item counts. Sessions are re-read only when their results.csv path/mtime/size changes.
+
+import os, re, sqlite3
+import numpy as np
+from config import OUTPUT_ROOT
+from analysis import key_vector
+from session_store import CSV_NAME, read_checkpoint, read_results_csv, matrix_from_records
+from sheets import load_sheet_meta
+
+INDEX_NAME = "_index.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions(
+    id           INTEGER PRIMARY KEY,
+    path         TEXT NOT NULL UNIQUE,  -- results.csv
+    mtime        REAL NOT NULL,
+    size         INTEGER NOT NULL,
+    exam         TEXT NOT NULL DEFAULT '',
+    section      TEXT NOT NULL DEFAULT '',
+    session_date TEXT NOT NULL DEFAULT '',
+    n            INTEGER NOT NULL,
+    mean         REAL,
+    lowest       INTEGER,
+    highest      INTEGER,
+    max          INTEGER,
+    keyed        INTEGER NOT NULL DEFAULT 0  -- 1 if item stats could be computed (key found)
+);
+CREATE TABLE IF NOT EXISTS student_scores(
+    session_id   INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    student_id   TEXT NOT NULL,
+    student_name TEXT NOT NULL DEFAULT '',
+    timestamp    TEXT NOT NULL DEFAULT '',
+    score        INTEGER NOT NULL,
+    max          INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS item_stats(
+    session_id   INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    item         INTEGER NOT NULL,
+    n            INTEGER NOT NULL,
+    correct      INTEGER NOT NULL,
+    blank        INTEGER NOT NULL,
+    PRIMARY KEY(session_id, item)
+);
+CREATE INDEX IF NOT EXISTS ix_scores_student ON student_scores(student_id);
+CREATE INDEX IF NOT EXISTS ix_sessions_exam_section ON sessions(exam, section);
+CREATE INDEX IF NOT EXISTS ix_sessions_date ON sessions(session_date);
+"""
+
+_DATE_RE = re.compile(r"(\d{4}-\d{2}-\d{2})(?: \(\d+\))?$")
+
+
+def _session_key(session_dir, matrix, info):
+    """Answer key of a session: checkpoint info first, else the sidecar of its last sheet."""
+    if info.get('key'):
+        return {int(q): int(a) for q, a in info['key']}
+    if len(matrix):
+        try:
+            return load_sheet_meta(session_dir, matrix.meta[-1]['filename']).get('key') or {}
+        except Exception:
+            pass
+    return {}
+
+
+class AnalyticsIndex:
+    """
+    Aggregate index over every session folder under `root`. Open one per thread;
+    `update()` is incremental and safe to call as often as needed.
+    """
+    def __init__(self, root=OUTPUT_ROOT):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(root, INDEX_NAME))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA foreign_keys=ON")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+    # ---------- Indexing ----------
+    def _csv_paths(self):
+        for entry in os.scandir(self.root):
+            if entry.is_dir():
+                path = os.path.join(entry.path, CSV_NAME)
+                if os.path.isfile(path):
+                    yield path
+
+    def update(self, job=None):
+        """Re-index sessions whose results.csv is new or changed; drop vanished ones. Returns (indexed, removed)."""
+        known = {p: (m, s) for p, m, s in self.conn.execute("SELECT path, mtime, size FROM sessions")}
+        paths = list(self._csv_paths())
+        stale = []
+        for path in paths:
+            st = os.stat(path)
+            if known.get(path) != (st.st_mtime, st.st_size):
+                stale.append((path, st))
+        gone = set(known) - set(paths)
+        with self.conn:
+            self.conn.executemany("DELETE FROM sessions WHERE path=?", [(p,) for p in gone])
+        for i, (path, st) in enumerate(stale):
+            if job is not None:
+                job.check()
+                job.progress(i, len(stale))
+            self._index_session(path, st)
+        return len(stale), len(gone)
+
+    def _index_session(self, csv_path, st):
+        session_dir = os.path.dirname(csv_path)
+        matrix = matrix_from_records(read_results_csv(csv_path))
+        ck = read_checkpoint(session_dir)
+        info = ck[1] if ck is not None else {}
+        last = matrix.meta[-1] if len(matrix) else {}
+        m = _DATE_RE.search(os.path.basename(session_dir))
+        session_date = info.get('session_date') or (m.group(1) if m else (last.get('timestamp') or '')[:10])
+        scores = matrix.scores
+        max_items = int(matrix.max_items.max()) if len(matrix) else 0
+
+        item_rows = []
+        key = _session_key(session_dir, matrix, info)
+        if key and len(matrix):
+            n_items = min(max(key), max_items or max(key))
+            kv = key_vector(key, n_items)
+            in_key = kv >= 0
+            correct = matrix.correct(kv).sum(axis=0)
+            blank = (matrix.answers[:, :n_items] < 0).sum(axis=0)
+            item_rows = [(q + 1, len(matrix), int(correct[q]), int(blank[q]))
+                         for q in np.flatnonzero(in_key).tolist()]
+
+        with self.conn:
+            self.conn.execute("DELETE FROM sessions WHERE path=?", (csv_path,))
+            cur = self.conn.execute(
+                "INSERT INTO sessions(path, mtime, size, exam, section, session_date, n, mean, lowest, highest, max, keyed)"
+                " VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                (csv_path, st.st_mtime, st.st_size, info.get('exam') or last.get('exam', ''),
+                 info.get('section') or last.get('section', ''), session_date, len(matrix),
+                 float(scores.mean()) if len(matrix) else None,
+                 int(scores.min()) if len(matrix) else None,
+                 int(scores.max()) if len(matrix) else None, max_items, int(bool(item_rows))))
+            sid = cur.lastrowid
+            self.conn.executemany(
+                "INSERT INTO student_scores(session_id, student_id, student_name, timestamp, score, max)"
+                " VALUES (?,?,?,?,?,?)",
+                ((sid, r['student_id'], r['student_name'], r['timestamp'], r['score'], r['max'])
+                 for r in matrix.meta if r['student_id']))
+            self.conn.executemany(
+                "INSERT INTO item_stats(session_id, item, n, correct, blank) VALUES (?,?,?,?,?)",
+                ((sid,) + row for row in item_rows))
+
+    # ---------- Queries ----------
+    def sessions(self):
+        """(exam, section, session_date, n, mean, lowest, highest, max) per session, newest first."""
+        return self.conn.execute(
+            "SELECT exam, section, session_date, n, mean, lowest, highest, max FROM sessions"
+            " ORDER BY session_date DESC, exam, section").fetchall()
+
+    def student_history(self, student_id, since=None, until=None):
+        """(session_date, exam, section, student_name, score, max) for one student, oldest first."""
+        sql = ("SELECT s.session_date, s.exam, s.section, t.student_name, t.score, t.max"
+               " FROM student_scores t JOIN sessions s ON s.id = t.session_id WHERE t.student_id = ?")
+        args = [student_id]
+        if since:
+            sql += " AND s.session_date >= ?"; args.append(since)
+        if until:
+            sql += " AND s.session_date <= ?"; args.append(until)
+        return self.conn.execute(sql + " ORDER BY s.session_date, t.timestamp", args).fetchall()
+
+    def item_difficulty(self, exam=None):
+        """(exam, section, item, n, p_correct, p_blank) per item and section, from keyed sessions."""
+        sql = ("SELECT s.exam, s.section, i.item, SUM(i.n), 1.0 * SUM(i.correct) / SUM(i.n), 1.0 * SUM(i.blank) / SUM(i.n)"
+               " FROM item_stats i JOIN sessions s ON s.id = i.session_id")
+        args = []
+        if exam:
+            sql += " WHERE s.exam = ?"; args.append(exam)
+        return self.conn.execute(sql + " GROUP BY s.exam, s.section, i.item ORDER BY s.exam, i.item, s.section",
+                                 args).fetchall()
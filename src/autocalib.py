@@ -0,0 +1,286 @@
+# autocalib.py
+# Offline calibration search: fits CALIB grid margins/shifts and decision thresholds to sample sheets
+# with known answers. Each sheet is equalized once; bubble scores for a candidate grid are a single
+# fancy-index gather over the same disc/ring pixels omr.center_ring_score uses.
+#
+#   python autocalib.py "<folder>" --truth truth.csv [-o calib_best.json] [--workers N] [--rounds 3]
+#
+# <folder> holds warped sheets (.webp/.png/.jpg). --truth names the hand-checked answers per image:
+#   CSV:  image,student_id,Q01,Q02,...   (image base name or file name; letters, '-' or blank = no mark)
+#   JSON: {"<image>": {"student_id": "12345", "answers": "AB-D..." or [0, 1, -1, 3, ...]}, ...}
+# --from-session instead reuses the answers the app itself saved (sidecars or results.csv). That fits
+# the calibration to the app's own readings, misreads included, so it is only a fallback.
+
+import os, re, csv, sys, json, glob, time, pprint, argparse, itertools, multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import cv2, numpy as np
+
+from config import CALIB, DIGITS_TOP_TO_BOTTOM, LETTERS
+from omr import ring_masks, equalize
+
+IMAGE_EXTS = (".webp", ".png", ".jpg", ".jpeg")
+
+# Geometry candidates per coordinate-descent round (offsets around the current value)
+GEOMETRY_STEPS = {
+    "row_top_margin":    np.linspace(-0.04, 0.04, 9),
+    "row_bottom_margin": np.linspace(-0.04, 0.04, 9),
+    "col_left_margin":   np.linspace(-0.04, 0.04, 9),
+    "col_right_margin":  np.linspace(-0.04, 0.04, 9),
+    "row_shift_px":      np.arange(-6, 7, 2),
+    "col_shift_px":      np.arange(-6, 7, 2),
+}
+# Decision thresholds are searched exhaustively per geometry (cheap: no pixel access)
+THRESHOLD_GRID = {
+    "abs_min": [0.0, 0.01, 0.02, 0.04, 0.06, 0.08, 0.10],
+    "margin":  [0.0, 0.01, 0.02, 0.04, 0.06, 0.08],
+    "z_min":   [0.3, 0.45, 0.6, 0.8, 1.0, 1.2, 1.5],
+}
+
+
+# ---------- Samples ----------
+def _answer_list(value):
+    """Letters string ('-'/' ' = no mark) or index list -> answer indices."""
+    if isinstance(value, str):
+        return [LETTERS.index(c) if c in LETTERS else -1 for c in value.strip().upper()]
+    return [int(a) for a in value]
+
+
+def load_truth(path):
+    """{image base name: (answers, student_id)} from a hand-checked ground-truth .csv or .json file."""
+    truth = {}
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            for image, rec in json.load(f).items():
+                base = os.path.splitext(os.path.basename(image))[0]
+                truth[base] = (_answer_list(rec.get("answers", [])), str(rec.get("student_id") or ""))
+        return truth
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        items = sorted((h for h in reader.fieldnames or () if re.fullmatch(r"Q\d+", h)), key=lambda h: int(h[1:]))
+        for row in reader:
+            image = (row.get("image") or row.get("filename") or "").strip()
+            if image:
+                answers = _answer_list("".join((row.get(h) or "-").strip()[:1] or "-" for h in items))
+                truth[os.path.splitext(os.path.basename(image))[0]] = (answers, (row.get("student_id") or "").strip())
+    return truth
+
+
+def session_truth(folder):
+    """
+    {image base name: (answers, student_id)} as the app recorded them (.json sidecars, else results.csv).
+    These are the app's own detections, so a search against them can only agree with past readings.
+    """
+    truth = {}
+    for path in glob.glob(os.path.join(folder, "*.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except Exception:
+            continue
+        if isinstance(meta, dict) and "answers" in meta:
+            base = os.path.splitext(os.path.basename(path))[0]
+            truth[base] = (list(meta["answers"]), str(meta.get("student_id") or ""))
+    if not truth:
+        from session_store import CSV_NAME, read_results_csv
+        csv_path = os.path.join(folder, CSV_NAME)
+        if os.path.exists(csv_path):
+            for rec in read_results_csv(csv_path):
+                truth[rec["filename"]] = (rec["answers"], rec["student_id"])
+    return truth
+
+
+def load_samples(folder, truth):
+    """[(base, equalized gray, answers, student_id)] for every image in `folder` listed in `truth`."""
+    samples = []
+    for path in sorted(glob.glob(os.path.join(folder, "*"))):
+        base, ext = os.path.splitext(os.path.basename(path))
+        if ext.lower() not in IMAGE_EXTS or base not in truth:
+            continue
+        g = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+        if g is not None:
+            samples.append((base, equalize(g)) + tuple(truth[base]))
+    return samples
+
+
+# ---------- Vectorized scoring ----------
+_OFFSETS = {}
+
+def _ring_offsets(r_in, r1, r2):
+    """(dy, dx) of the disc and ring pixels, identical to the masks center_ring_score applies."""
+    key = (int(r_in), int(r1), int(r2))
+    hit = _OFFSETS.get(key)
+    if hit is None:
+        half, mask_in, mask_ring = ring_masks(*key)
+        hit = _OFFSETS[key] = tuple(np.stack(np.nonzero(m)) - half for m in (mask_in, mask_ring))
+    return hit
+
+
+def _grid(shape, box, rows, cols, cfg):
+    """Bubble centers (rows × cols, same rounding as omr) and ring radii for one ROI."""
+    H, W = shape
+    y1, y2, x1, x2 = box
+    y1i, y2i, x1i, x2i = int(H*y1), int(H*y2), int(W*x1), int(W*x2)
+    gh, gw = y2i - y1i, x2i - x1i
+    rt, rb = cfg["row_top_margin"], cfg["row_bottom_margin"]
+    cl, cr = cfg["col_left_margin"], cfg["col_right_margin"]
+    rcent = cfg["row_shift_px"] + gh*rt + np.linspace(0, gh*(1.0 - rt - rb), rows)
+    ccent = cfg["col_shift_px"] + gw*cl + np.linspace(0, gw*(1.0 - cl - cr), cols)
+    base = max(4.0, min((rcent[1]-rcent[0]) if rows > 1 else 999, (ccent[1]-ccent[0]) if cols > 1 else 999))
+    cy = (y1i + rcent).astype(int)
+    cx = (x1i + ccent).astype(int)
+    return np.repeat(cy, cols), np.tile(cx, rows), (base*0.60, base*0.72, base*0.98)
+
+
+def _masked_mean(g, cy, cx, off):
+    ys = cy[:, None] + off[0][None, :]
+    xs = cx[:, None] + off[1][None, :]
+    ok = (ys >= 0) & (ys < g.shape[0]) & (xs >= 0) & (xs < g.shape[1])
+    vals = g[np.clip(ys, 0, g.shape[0]-1), np.clip(xs, 0, g.shape[1]-1)].astype(np.float32)
+    return (vals * ok).sum(1) / np.maximum(ok.sum(1), 1)
+
+
+def grid_scores(g, box, rows, cols, cfg):
+    """(rows × cols) bubble scores for one ROI; same values as omr._grid_centers_and_scores."""
+    cy, cx, radii = _grid(g.shape, box, rows, cols, cfg)
+    off_in, off_ring = _ring_offsets(*radii)
+    mi = _masked_mean(g, cy, cx, off_in)
+    mr = _masked_mean(g, cy, cx, off_ring)
+    return np.maximum(0.0, (mr - mi) / np.maximum(1.0, mr)).reshape(rows, cols)
+
+
+def sheet_scores(g, cfg, rois, roi_id):
+    ans = np.concatenate([grid_scores(g, box, 10, 5, cfg) for box in rois])
+    return ans, grid_scores(g, roi_id, 10, 5, cfg)
+
+
+# ---------- Objective ----------
+def _stack_truth(samples, n_items):
+    T = np.full((len(samples), n_items), -1, np.int64)
+    for i, s in enumerate(samples):
+        a = np.asarray(s[2][:n_items], np.int64)
+        T[i, :len(a)] = a
+    return T
+
+
+def evaluate_geometry(samples, cfg, rois, roi_id):
+    """
+    Score every threshold combination for one geometry. Returns (accuracy, mean margin, thresholds)
+    of the best combination; accuracy averages answer-item and ID-digit hit rates.
+    """
+    S, ID = zip(*(sheet_scores(s[1], cfg, rois, roi_id) for s in samples))
+    S = np.stack(S)                                   # sheets × items × 5
+    n_items = S.shape[1]
+    T = _stack_truth(samples, n_items)
+    scored = np.array([len(s[2]) for s in samples])[:, None] > np.arange(n_items)[None, :]
+
+    digit_row = {d: r for r, d in enumerate(DIGITS_TOP_TO_BOTTOM)}
+    id_rows = np.stack(ID).argmax(axis=1)            # sheets × 5 columns
+    id_hits, id_total = 0, 0
+    for i, s in enumerate(samples):
+        sid = s[3]
+        if len(sid) == id_rows.shape[1]:
+            id_hits += sum(int(id_rows[i, c] == digit_row.get(ch, -1)) for c, ch in enumerate(sid))
+            id_total += len(sid)
+    id_acc = id_hits / id_total if id_total else None
+
+    best = S.argmax(2)
+    srt = np.sort(S, axis=2)
+    top, second = srt[..., -1], srt[..., -2]
+    z = (top - S.mean(2)) / (S.std(2) + 1e-6)
+    gap = top - second
+    best_res = (-1.0, 0.0, None)
+    for abs_min, margin, z_min in itertools.product(*THRESHOLD_GRID.values()):
+        pick = best if cfg.get("force_pick") else np.where((top >= abs_min) & (gap >= margin) & (z >= z_min), best, -1)
+        hit = (pick == T) & scored
+        acc = hit.sum() / max(1, scored.sum())
+        if id_acc is not None:
+            acc = 0.5 * (acc + id_acc)
+        # Tie-break: how far the marked bubbles clear the threshold on correctly decided rows
+        m = float(gap[hit & (T >= 0)].mean()) if (hit & (T >= 0)).any() else 0.0
+        if (acc, m) > best_res[:2]:
+            best_res = (float(acc), m, {"abs_min": abs_min, "margin": margin, "z_min": z_min})
+    return best_res
+
+
+# ---------- Parallel search ----------
+_SAMPLES = None
+
+def _init_worker(folder, truth):
+    global _SAMPLES
+    cv2.setNumThreads(1)
+    _SAMPLES = load_samples(folder, truth)
+
+
+def _eval_worker(args):
+    cfg, rois, roi_id = args
+    return evaluate_geometry(_SAMPLES, cfg, rois, roi_id)
+
+
+def search(folder, truth, calib=CALIB, rounds=3, workers=None, log=print):
+    """Coordinate descent over GEOMETRY_STEPS (each sweep evaluated in parallel). Returns (calib, accuracy)."""
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    cfg = dict(calib["config"])
+    rois, roi_id = calib["rois_answers"], calib["roi_id"]
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(workers, mp_context=ctx, initializer=_init_worker, initargs=(folder, truth)) as ex:
+        best = ex.submit(_eval_worker, (cfg, rois, roi_id)).result()
+        log(f"start: accuracy {best[0]:.4f}")
+        for rnd in range(rounds):
+            improved = False
+            for name, steps in GEOMETRY_STEPS.items():
+                cands = []
+                for d in steps:
+                    c = dict(cfg)
+                    c[name] = round(float(cfg[name] + d), 4) if isinstance(cfg[name], float) else int(cfg[name] + d)
+                    if name.endswith("margin") and not 0.0 <= c[name] < 0.4:
+                        continue
+                    cands.append(c)
+                results = list(ex.map(_eval_worker, [(c, rois, roi_id) for c in cands]))
+                i = max(range(len(results)), key=lambda k: results[k][:2])
+                if results[i][:2] > best[:2]:
+                    cfg, best, improved = cands[i], results[i], True
+                    log(f"round {rnd+1}: {name}={cfg[name]} -> accuracy {best[0]:.4f}")
+            if not improved:
+                break
+    if best[2]:
+        cfg.update(best[2])
+    return {"config": cfg, "rois_answers": rois, "roi_id": roi_id}, best[0]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Fit CALIB to warped sample sheets with known answers.")
+    ap.add_argument("folder")
+    ap.add_argument("--truth", help="hand-checked answers per image (.csv or .json)")
+    ap.add_argument("--from-session", action="store_true",
+                    help="use the answers the app saved in <folder> instead (fits its own readings)")
+    ap.add_argument("-o", "--out", default="calib_best.json")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--rounds", type=int, default=3)
+    args = ap.parse_args(argv)
+
+    if args.truth:
+        truth = load_truth(args.truth)
+    elif args.from_session:
+        print("WARNING: --from-session scores calibrations against the app's own detections. Misread "
+              "bubbles count as correct, so this can only tune towards past behaviour; prefer --truth.",
+              file=sys.stderr)
+        truth = session_truth(args.folder)
+    else:
+        ap.error("ground truth needed: --truth FILE (or --from-session)")
+
+    n = len(load_samples(args.folder, truth))
+    if not n:
+        print("No sample sheets with known answers found.", file=sys.stderr)
+        return 1
+    print(f"{n} sample sheet(s).")
+    t0 = time.perf_counter()
+    calib, acc = search(args.folder, truth, rounds=args.rounds, workers=args.workers)
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(calib, f, indent=2)
+    print(f"Best accuracy {acc:.4f} in {time.perf_counter() - t0:.1f} s. Calibration written to {args.out}")
+    print("Paste over CALIB in config.py:\n\nCALIB = " + pprint.pformat(calib, sort_dicts=False))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -5,11 +5,64 @@ import os
 
 # =============== Config ===============
 OUTPUT_ROOT = "omr_annotations"   # root for all sessions
+ROSTER_CACHE_DIR = os.path.join(OUTPUT_ROOT, "_cache")   # parsed class lists (.npy, memory-mapped)
 DEFAULT_KEY_FILE = "answer_key_50.txt"
 LETTERS = ['A','B','C','D','E']
 DIGITS_TOP_TO_BOTTOM = ['1','2','3','4','5','6','7','8','9','0']
 WARP_W, WARP_H, PAD = 1200, 1600, 80
 ROWS_PER_COL, COLS = 10, 5  # 10 rows × 5 cols per ROI = 50 items across 5 ROIs
+TEMPLATE_DIR = "templates"       # extra sheet layouts (*.json); the CALIB layout below is built in
+TEMPLATE_ASPECT_TOL = 0.08       # |log(aspect ratio)| within which a marker quad matches a template
+
+# Per-sheet storage: warped grayscale page + JSON sidecar; annotated views are regenerated on demand
+SHEET_IMAGE_EXT = ".webp"       # ".webp" or ".jpg"
+SHEET_IMAGE_QUALITY = 90        # 0..100 for both formats
+SAVE_ANNOTATED_PNG = False      # also write a full-size annotated PNG per sheet (fast, low compression)
+CHECKPOINT_EVERY = 10           # confirms between resume checkpoints (also written on close)
+
+# Pre-scan quality gate (measured live on the marker region of the preview frame)
+QUALITY = {
+  "min_sharpness": 40.0,         # Laplacian variance on the region downscaled to ~320 px wide
+  "min_brightness": 70.0,        # mean gray level
+  "max_brightness": 245.0,
+  "max_glare": 0.05,             # fraction of saturated (>=250) pixels
+  "max_side_ratio": 1.30,        # longest/shortest of the opposite marker-quad sides
+  "max_angle_dev": 15.0,         # degrees a quad corner may deviate from 90
+  "min_coverage": 0.12,          # marker-quad area / frame area
+}
+QUALITY_DEFER_SECONDS = 8.0      # how long a blocked Scan waits for a usable frame
+
+# Multi-frame score fusion (Scan → "Multi-frame")
+FUSION = {
+  "min_frames": 2,
+  "max_frames": 12,
+  "z_conf": 3.0,                 # standard errors a row decision must clear to count as settled
+  "stable_px": 6.0,              # marker movement that restarts accumulation
+}
+
+# Confidence triage (Scan → "Auto-confirm"): clear sheets are saved unattended, the rest are queued for review
+AUTO_CONFIRM = {
+  "fill_ref": 0.15,              # bubble score of a clear fill; separations are measured against it
+  "z_full": 1.0,                 # z-score above z_min that counts as fully confident
+  "min_sheet": 0.5,              # sheet confidence (weakest row / ID digit, 0..1) needed to skip review
+}
+
+# Student-ID correction against the class list (roster.py)
+ROSTER = {
+  "max_changes": 2,              # ID digits that may differ from the argmax reading
+  "max_cost": 0.15,              # summed bubble-score deficit allowed for a corrected ID
+  "min_lead": 0.05,              # best correction must beat the runner-up by this much
+  "max_steps": 2000,             # candidate IDs probed per lookup
+}
+
+# Duplicate-sheet detection (dedup.py): perceptual hash of the bubble grids, LSH-banded
+DEDUP = {
+  "dark": 0.12,                  # cell darker than its row median by this fraction -> bit set
+  "bands": 16,                   # LSH bands the hash is cut into
+  "max_dist": 6,                 # answer bits a rescan of the same sheet may differ by
+  "max_id_dist": 1,              # ID bits likewise (two students always differ by >= 2)
+  "min_marks": 5,                # sheets with fewer filled cells are not compared
+}
 
 # ---- Replace with your latest calibration if needed ----
 CALIB = {
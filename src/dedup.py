@@ -0,0 +1,108 @@
+# dedup.py
+# Near-duplicate detection for scanned sheets, so the same paper captured twice is caught before it is graded.
+#
+# The hash is a block-mean perceptual hash aligned to the template's bubble grids: each grid is area-
+# downscaled to one cell per bubble and a cell's bit is set when it is clearly darker than the median
+# of its row (answer rows; ID columns for the ID block). Print and lighting cancel out, blank rows are
+# all zeros, and a rescan of the same sheet lands within a few bits. Lookups go through LSH bands
+# (the bit vector cut into fixed slices, each slice a dict key), then an exact Hamming check.
+
+import numpy as np
+import cv2
+from config import DEDUP
+
+ID_BITS = 50   # 10 digit rows × 5 ID columns, stored last in every hash
+QUEUED_REF = "queued-"   # ref name prefix of sheets indexed while they wait in the review queue
+
+
+def _cells(gray, box, rows, cols):
+    H, W = gray.shape[:2]
+    y1, y2, x1, x2 = box
+    roi = gray[int(H*y1):int(H*y2), int(W*x1):int(W*x2)]
+    if roi.size == 0:
+        return np.zeros((rows, cols), np.float32)
+    return cv2.resize(roi, (cols, rows), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+def _dark_bits(cells, dark):
+    med = np.median(cells, axis=1, keepdims=True)
+    return ((med - cells) / np.maximum(med, 1.0) > dark).ravel()
+
+
+def sheet_hash(gray, template, dark=DEDUP["dark"]):
+    """Bool vector: one bit per answer bubble (row-major per ROI), then ID_BITS for the ID block."""
+    bits = [_dark_bits(_cells(gray, box, template.rows_per_roi, 5), dark) for box in template.rois_answers]
+    bits.append(_dark_bits(_cells(gray, template.roi_id, 10, 5).T, dark))
+    return np.concatenate(bits)
+
+
+class DedupIndex:
+    """
+    In-session index of saved (and queued) sheets' hashes. `add`, `query` and `remove` touch `bands`
+    dict buckets (plus an exact check of the few sheets found there), independent of how many are stored.
+    """
+    def __init__(self, bands=DEDUP["bands"]):
+        self.bands = int(bands)
+        self.buckets = {}    # (template, band, band bytes) -> [entry index]
+        self.entries = []    # (template, packed answer bits, packed ID bits, ref), None once removed
+        self.by_ref = {}     # ref -> entry index
+
+    def __len__(self):
+        return len(self.by_ref)
+
+    def _keys(self, template, bits):
+        for b, part in enumerate(np.array_split(bits, self.bands)):
+            if part.any():   # all-blank slices say nothing and would match every sheet
+                yield (template, b, np.packbits(part).tobytes())
+
+    @staticmethod
+    def _indexable(bits):
+        return int(bits[:-ID_BITS].sum()) >= DEDUP["min_marks"]
+
+    def add(self, template, bits, ref):
+        """Remember a confirmed sheet; `ref` is returned by matching queries. Near-empty sheets are ignored."""
+        bits = np.asarray(bits, bool)
+        if not self._indexable(bits):
+            return
+        i = len(self.entries)
+        self.entries.append((template, np.packbits(bits[:-ID_BITS]), np.packbits(bits[-ID_BITS:]), ref))
+        self.by_ref[ref] = i
+        for k in self._keys(template, bits):
+            self.buckets.setdefault(k, []).append(i)
+
+    def remove(self, ref):
+        """Forget the sheet added with `ref` (no-op when unknown); its bucket slots are skipped from then on."""
+        i = self.by_ref.pop(ref, None)
+        if i is not None:
+            self.entries[i] = None
+
+    def query(self, template, bits, max_dist=DEDUP["max_dist"], max_id_dist=DEDUP["max_id_dist"]):
+        """`ref` of the closest stored sheet within max_dist answer bits and max_id_dist ID bits, or None."""
+        bits = np.asarray(bits, bool)
+        if not self._indexable(bits):
+            return None
+        ans, ids = np.packbits(bits[:-ID_BITS]), np.packbits(bits[-ID_BITS:])
+        seen, best = set(), None
+        for k in self._keys(template, bits):
+            for i in self.buckets.get(k, ()):
+                if i in seen:
+                    continue
+                seen.add(i)
+                if self.entries[i] is None:
+                    continue
+                _, a, d, ref = self.entries[i]
+                if len(a) != len(ans):
+                    continue
+                dist = int(np.unpackbits(a ^ ans).sum())
+                if dist <= max_dist and int(np.unpackbits(d ^ ids).sum()) <= max_id_dist:
+                    if best is None or dist < best[0]:
+                        best = (dist, ref)
+        return best[1] if best else None
+
+
+def hash_hex(bits):
+    return np.packbits(np.asarray(bits, bool)).tobytes().hex()
+
+
+def hash_from_hex(s, n_bits):
+    return np.unpackbits(np.frombuffer(bytes.fromhex(s), np.uint8))[:n_bits].astype(bool)
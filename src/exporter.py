@@ -0,0 +1,87 @@
+# exporter.py
+# Streaming XLSX/CSV exports: rows are produced and written one at a time inside a BackgroundJob.
+
+import os, csv
+from analysis import LETTER_LUT
+
+RESULT_COLUMNS = ['timestamp','exam','section','student_name','student_id','score','max','key_set']
+CSV_CHUNK = 500
+
+
+def have_xlsx():
+    try:
+        import openpyxl  # noqa: F401
+        return True
+    except Exception:
+        return False
+
+
+def _tmp_path(path):
+    root, ext = os.path.splitext(path)
+    return f"{root}.partial{ext}"
+
+
+def _write_sheets(path, sheets, job):
+    """
+    Write [(sheet_name, header, row_iter, n_rows), ...] to `path` (.xlsx via openpyxl write-only,
+    anything else as CSV; extra CSV sheets go to '<path> - <sheet>.csv'). Returns the paths written.
+    """
+    total = sum(n for *_, n in sheets) or 1
+    done = 0
+    written = []
+    if path.lower().endswith(".xlsx"):
+        from openpyxl import Workbook
+        wb = Workbook(write_only=True)
+        for name, header, rows, _ in sheets:
+            ws = wb.create_sheet(title=name[:31])
+            ws.append(header)
+            for row in rows:
+                ws.append(row)
+                done += 1
+                job.progress(done, total)
+        tmp = _tmp_path(path)
+        wb.save(tmp)
+        os.replace(tmp, path)
+        return [path]
+
+    root, _ = os.path.splitext(path)
+    for k, (name, header, rows, _) in enumerate(sheets):
+        out = path if k == 0 else f"{root} - {name.lower().replace(' ', '-')}.csv"
+        tmp = _tmp_path(out)
+        try:
+            with open(tmp, 'w', newline='', encoding='utf-8') as f:
+                w = csv.writer(f)
+                w.writerow(header)
+                chunk = []
+                for row in rows:
+                    chunk.append(row)
+                    if len(chunk) >= CSV_CHUNK:
+                        w.writerows(chunk); done += len(chunk); chunk = []
+                        job.progress(done, total)
+                w.writerows(chunk); done += len(chunk)
+            os.replace(tmp, out)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        written.append(out)
+        job.progress(done, total)
+    return written
+
+
+def export_results(path, matrix, n_rows, n_items, job):
+    """One row per confirmed sheet (info columns + answer letters), streamed from the answer matrix."""
+    answers, meta = matrix.answers, matrix.meta   # views: nothing is copied up front
+    def rows():
+        for i in range(n_rows):
+            r = meta[i]
+            yield [r[k] for k in RESULT_COLUMNS] + LETTER_LUT[answers[i, :n_items]].tolist()
+    header = RESULT_COLUMNS + [f"Q{i:02d}" for i in range(1, n_items+1)]
+    return _write_sheets(path, [("Results", header, rows(), n_rows)], job)
+
+
+def export_statistics(path, summary, item_header, item_rows, job):
+    """Summary dict (one row) + the item-analysis table."""
+    return _write_sheets(path, [
+        ("Summary", list(summary.keys()), iter([list(summary.values())]), 1),
+        ("Item Analysis", item_header, iter(item_rows), len(item_rows)),
+    ], job)
@@ -5,45 +5,131 @@ import os, re, csv
 from datetime import datetime
 from config import LETTERS, OUTPUT_ROOT
 
-def parse_answer_key(path):
-    """Return (exam_name, key_dict). First non-empty line is exam name. Lines like "12: B"."""
+_KEY_LINE = re.compile(r"(\d+)\s*:\s*([A-Ea-e])(?:\s*->\s*(\d+))?")
+_SET_LINE = re.compile(r"\[\s*(?:set\s+)?(\w+)\s*\]$", re.I)
+
+
+def _nonempty_lines(f):
+    for ln in f:
+        ln = ln.strip()
+        if ln:
+            yield ln
+
+
+def parse_answer_key_sets(path):
+    """
+    Return (exam_name, {set: (key_dict, item_map)}) for a key with one or more versions:
+        Midterm
+        [A]
+        1: B
+        [B]
+        1: C -> 7        item 1 of set B is item 7 of the canonical order
+    A partial remap is completed into a one-to-one map (see complete_item_map): above, item 7 of
+    set B becomes canonical item 1, so item_map is {1: 7, 7: 1}. Two items of one set sent to the
+    same canonical item raise ValueError. A file without [set] headers is one set "A".
+    """
     mapping = {c:i for i,c in enumerate(LETTERS)}
-    key, exam_name = {}, None
+    sets, exam_name = {}, None
     if not os.path.exists(path):
-        return exam_name, key
+        return exam_name, sets
     with open(path, 'r', encoding='utf-8') as f:
-        lines = [ln.strip() for ln in f if ln.strip()]
-    if not lines:
-        return exam_name, key
-    exam_name = lines[0]
-    for ln in lines[1:]:
-        m = re.match(r"(\d+)\s*:\s*([A-Ea-e])", ln)
-        if m:
-            q = int(m.group(1))
-            a = mapping[m.group(2).upper()]
-            key[q] = a
-    return exam_name, key
+        lines = _nonempty_lines(f)
+        exam_name = next(lines, None)
+        current = None
+        for ln in lines:
+            m = _SET_LINE.match(ln)
+            if m:
+                current = sets.setdefault(m.group(1).upper(), ({}, {}))
+                continue
+            m = _KEY_LINE.match(ln)
+            if m:
+                if current is None:
+                    current = sets.setdefault("A", ({}, {}))
+                q = int(m.group(1))
+                current[0][q] = mapping[m.group(2).upper()]
+                if m.group(3):
+                    current[1][q] = int(m.group(3))
+    out = {}
+    for name, (key, item_map) in sets.items():
+        if key:
+            n = max(list(key) + list(item_map) + list(item_map.values()))
+            try:
+                out[name] = (key, complete_item_map(item_map, n))
+            except ValueError as e:
+                raise ValueError(f"Answer key set {name}: {e}") from None
+    return exam_name, out
 
 
-def parse_class_section(path):
-    """Return (section_name, dict_id_to_name). First non-empty line = section; then "Full Name, 00001"."""
-    id2name = {}
-    section_name = None
+def complete_item_map(item_map, n):
+    """
+    One-to-one {printed item: canonical item} over items 1..n from a partial remap. Unlisted items keep
+    their number unless a listed item took it; those take the numbers the listed items gave up, in
+    order (so "1 -> 7" alone is the swap 1 <-> 7). Only items that do not keep their number are listed.
+    """
+    bad = sorted(c for c in item_map.values() if not 1 <= c <= n)
+    if bad:
+        raise ValueError(f"item {bad[0]} is out of range 1..{n}")
+    taken = {}
+    for q, c in sorted(item_map.items()):
+        if c in taken:
+            raise ValueError(f"items {taken[c]} and {q} both map to item {c}")
+        taken[c] = q
+    displaced = [q for q in range(1, n + 1) if q not in item_map and q in taken]
+    freed = [q for q in sorted(item_map) if q not in taken]
+    full = dict(item_map)
+    full.update(zip(displaced, freed))
+    return {q: c for q, c in full.items() if q != c}
+
+
+def parse_answer_key(path):
+    """Return (exam_name, key_dict). First non-empty line is exam name. Lines like "12: B".
+    With several sets the key is in canonical item order (first set to define an item wins)."""
+    exam_name, sets = parse_answer_key_sets(path)
+    return exam_name, canonical_key(sets)
+
+
+def canonical_key(sets):
+    """{item: choice} in canonical item order from parse_answer_key_sets output."""
+    key = {}
+    for k, item_map in sets.values():
+        for q, a in k.items():
+            key.setdefault(item_map.get(q, q), a)
+    return key
+
+
+_ID_RE = re.compile(r"\d{5}")
+_SET_RE = re.compile(r"[A-Za-z]")
+
+
+def class_section_name(path):
+    """First non-empty line of a class list (the section name), or None."""
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r', encoding='utf-8') as f:
+        return next(_nonempty_lines(f), None)
+
+
+def class_section_rows(path):
+    """Stream the student lines "Full Name, 00001[, B]" of a class list as (name, id, set); bad lines are skipped."""
     if not os.path.exists(path):
-        return section_name, id2name
+        return
     with open(path, 'r', encoding='utf-8') as f:
-        lines = [ln.strip() for ln in f if ln.strip()]
-    if not lines:
-        return section_name, id2name
-    section_name = lines[0]
-    for ln in lines[1:]:
-        parts = [p.strip() for p in ln.split(',')]
-        if len(parts) >= 2:
-            name = ','.join(parts[:-1]).strip()
-            sid = parts[-1].replace(' ', '')
-            if re.fullmatch(r"\d{5}", sid):
-                id2name[sid] = name
-    return section_name, id2name
+        lines = _nonempty_lines(f)
+        next(lines, None)   # section name
+        for ln in lines:
+            parts = [p.strip() for p in ln.split(',')]
+            key_set = ""
+            if len(parts) >= 3 and _SET_RE.fullmatch(parts[-1]) and _ID_RE.fullmatch(parts[-2].replace(' ', '')):
+                key_set = parts.pop().upper()
+            if len(parts) >= 2:
+                sid = parts[-1].replace(' ', '')
+                if _ID_RE.fullmatch(sid):
+                    yield ','.join(parts[:-1]).strip(), sid, key_set
+
+
+def parse_class_section(path):
+    """Return (section_name, dict_id_to_name). First non-empty line = section; then "Full Name, 00001"."""
+    return class_section_name(path), {sid: name for name, sid, _ in class_section_rows(path)}
 
 
 def ensure_outdir(path):
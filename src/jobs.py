@@ -0,0 +1,70 @@
+# jobs.py
+# Background worker thread with throttled progress reporting and cancel, polled from the Tk loop.
+
+import threading, queue
+
+
+class Cancelled(Exception):
+    """Raised inside a job function when the user cancels."""
+
+
+class BackgroundJob(threading.Thread):
+    """
+    Runs fn(job) on a daemon thread. The function reports with job.progress(done, total)
+    (which also honours cancel) and may call job.check() in tight loops.
+    Results/errors come back through `events`, drained on the UI thread by poll_job().
+    """
+    def __init__(self, fn, name="job"):
+        super().__init__(daemon=True, name=name)
+        self.fn = fn
+        self.events = queue.Queue()
+        self.result = None
+        self.error = None
+        self._cancel = threading.Event()
+        self._last_pct = -1
+
+    def run(self):
+        try:
+            self.result = self.fn(self)
+        except Cancelled:
+            self.error = Cancelled()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.events.put(("done", None))
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise Cancelled()
+
+    def progress(self, done, total):
+        self.check()
+        pct = int(100 * done / total) if total else 100
+        if pct != self._last_pct:   # at most ~100 UI updates per job
+            self._last_pct = pct
+            self.events.put(("progress", (done, total)))
+
+
+def poll_job(root, job, on_progress, on_done, interval=100):
+    """Drain `job` events on the Tk thread every `interval` ms until it finishes."""
+    finished = False
+    try:
+        while True:
+            kind, payload = job.events.get_nowait()
+            if kind == "progress":
+                on_progress(*payload)
+            else:
+                finished = True
+    except queue.Empty:
+        pass
+    if finished:
+        on_done(job)
+    else:
+        root.after(interval, poll_job, root, job, on_progress, on_done, interval)
@@ -1,55 +1,275 @@
 # omr.py
 # Core OMR / CV helpers and grading.
 
-import cv2, math, numpy as np
-from config import WARP_W, WARP_H, PAD, ANSWER_ROIS, ROI_ID, DIGITS_TOP_TO_BOTTOM
+import cv2, math, threading, numpy as np
+from itertools import combinations as _combinations
+from config import WARP_W, WARP_H, PAD, ANSWER_ROIS, ROI_ID, DIGITS_TOP_TO_BOTTOM, QUALITY
+
+# ---- Buffer pool ----
+class BufferPool:
+    """Preallocated work arrays for the scan and preview paths, reused every frame via `dst` arguments."""
+    def __init__(self, cam_w=1280, cam_h=720):
+        self._scratch = {}
+        self.ensure_warp(WARP_W, WARP_H)
+        self.ensure_camera(cam_w, cam_h)
+
+    def ensure_warp(self, w, h):
+        """(Re)size the warp-resolution buffers for a sheet template; no-op when unchanged."""
+        if getattr(self, "warp_size", None) == (w, h):
+            return
+        self.warp_size = (w, h)
+        self.warped = np.empty((h, w, 3), np.uint8)   # warp_page output
+        self.gray = np.empty((h, w), np.uint8)        # warped grayscale
+        self.clahe = np.empty((h, w), np.uint8)       # detector equalization
+        self.annot = np.empty((h, w, 3), np.uint8)    # full-size annotation
+
+    def ensure_camera(self, w, h):
+        """(Re)size the camera-resolution buffers; no-op when the resolution is unchanged."""
+        if getattr(self, "cam_size", None) == (w, h):
+            return
+        self.cam_size = (w, h)
+        self.frame = np.empty((h, w, 3), np.uint8)        # stable copy of the last camera frame
+        self.frame_gray = np.empty((h, w), np.uint8)
+        self.frame_blur = np.empty((h, w), np.uint8)
+        self.frame_th = np.empty((h, w), np.uint8)
+        self.preview = np.empty((h, w, 3), np.uint8)      # preview overlay canvas
+
+    def ensure_for(self, frame):
+        h, w = frame.shape[:2]
+        self.ensure_camera(w, h)
+
+    def scratch(self, name, shape, dtype=np.uint8):
+        """Named buffer reallocated only when the requested shape changes (e.g. display sizes)."""
+        buf = self._scratch.get(name)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = self._scratch[name] = np.empty(shape, dtype)
+        return buf
+
+
+def _fits(buf, shape):
+    return buf is not None and buf.shape == tuple(shape)
+
 
 # ---- Corner detection & warp ----
-def find_markers(gray):
-    blur = cv2.GaussianBlur(gray, (5,5), 0)
-    _, th = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU)
-    cnts,_ = cv2.findContours(th, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+def _marker_points(gray, blur=None, th=None, nested=False, min_area=0.0002, solid=False):
+    """
+    Centroids and areas of every square marker candidate in the frame. nested=True also looks inside
+    other dark regions (sheets lying on a darker table become holes of the table blob). solid=True keeps
+    only filled squares: the contour must fill its rotated bounding box (a disc fills pi/4 of it) and
+    be inked inside (rules out printed outlines and empty bubble rings).
+    """
+    blur = cv2.GaussianBlur(gray, (5,5), 0, dst=blur if _fits(blur, gray.shape) else None)
+    _, th = cv2.threshold(blur, 0, 255, cv2.THRESH_BINARY_INV+cv2.THRESH_OTSU,
+                          dst=th if _fits(th, gray.shape) else None)
+    cnts,_ = cv2.findContours(th, cv2.RETR_LIST if nested else cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     h,w = gray.shape
-    pts = []
+    pts = []; areas = []
     for c in cnts:
         area = cv2.contourArea(c)
-        if area < (w*h)*0.0002 or area > (w*h)*0.02:
+        if area < (w*h)*min_area or area > (w*h)*0.02:
             continue
         x,y,bw,bh = cv2.boundingRect(c)
         asp = bw/float(bh)
         if 0.6 < asp < 1.4:
             peri = cv2.arcLength(c, True)
             if len(cv2.approxPolyDP(c, 0.05*peri, True)) == 4:
+                if solid and not _is_solid_square(c, area, th):
+                    continue
                 M = cv2.moments(c)
                 if M["m00"] != 0:
                     pts.append((int(M["m10"]/M["m00"]), int(M["m01"]/M["m00"])) )
-    if len(pts) < 4:
-        raise RuntimeError("4 corner squares not found")
-    pts = np.array(pts, np.float32)
+                    areas.append(area)
+    return np.array(pts, np.float32).reshape(-1, 2), np.array(areas, np.float32)
+
+
+def _is_solid_square(c, area, th):
+    (_, _), (rw, rh), _ = cv2.minAreaRect(c)
+    if area < 0.88 * rw * rh:
+        return False
+    x, y, bw, bh = cv2.boundingRect(c)
+    mask = np.zeros((bh, bw), np.uint8)
+    cv2.drawContours(mask, [c - (x, y)], -1, 255, -1)
+    inked = cv2.countNonZero(cv2.bitwise_and(th[y:y+bh, x:x+bw], mask))
+    return inked >= 0.85 * max(1, cv2.countNonZero(mask))
+
+
+def _extreme_corners(pts):
     s = pts.sum(1); d = np.diff(pts, axis=1).reshape(-1)
     TL = pts[np.argmin(s)]; BR = pts[np.argmax(s)]
     TR = pts[np.argmin(d)]; BL = pts[np.argmax(d)]
     return np.array([TL,TR,BR,BL], np.float32)
 
 
-def warp_page(img):
-    g = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-    m = find_markers(g)
-    dst = np.array([[PAD,PAD],[WARP_W-PAD,PAD],[WARP_W-PAD,WARP_H-PAD],[PAD,WARP_H-PAD]], np.float32)
-    M = cv2.getPerspectiveTransform(m, dst)
-    return cv2.warpPerspective(img, M, (WARP_W, WARP_H))
+def find_markers(gray, blur=None, th=None):
+    pts, _ = _marker_points(gray, blur, th)
+    if len(pts) < 4:
+        raise RuntimeError("4 corner squares not found")
+    return _extreme_corners(pts)
+
+
+def _quad_cost(q):
+    """Rectangularity cost of a TL,TR,BR,BL quad (inf if not convex): worst corner-angle error + side mismatch."""
+    if not cv2.isContourConvex(q.reshape(-1, 1, 2)):
+        return np.inf
+    worst = 0.0
+    for i in range(4):
+        u, v = q[i-1]-q[i], q[(i+1) % 4]-q[i]
+        c = float(np.dot(u, v)/max(1e-6, np.linalg.norm(u)*np.linalg.norm(v)))
+        worst = max(worst, abs(c))
+    sides = np.linalg.norm(q - np.roll(q, -1, axis=0), axis=1)
+    mismatch = max(sides[0], sides[2])/max(1e-6, min(sides[0], sides[2])) + \
+        max(sides[1], sides[3])/max(1e-6, min(sides[1], sides[3])) - 2.0
+    return worst + mismatch
+
+
+MAX_GROUP_CANDIDATES = 32   # marker candidates considered per frame (largest first)
+MAX_CORNER_CHOICES = 14     # partners tried per top-left corner, most similar in size first
+
+
+def find_marker_groups(gray, blur=None, th=None, max_sheets=4):
+    """
+    Split every marker in a frame into per-sheet quads (TL,TR,BR,BL), in reading order.
+    Works greedily: the remaining marker with the smallest x+y is a sheet's top-left; its quad is the
+    most rectangular choice of three other markers (similar size, no other marker-sized square inside).
+    The work is bounded: at most MAX_GROUP_CANDIDATES squares and C(MAX_CORNER_CHOICES, 3) quads per corner.
+    """
+    # Several sheets per frame means smaller markers: accept down to a quarter of the single-sheet minimum
+    pts, areas = _marker_points(gray, blur, th, nested=True, min_area=0.00005, solid=True)
+    if len(pts) > MAX_GROUP_CANDIDATES:
+        keep = np.argsort(-areas)[:MAX_GROUP_CANDIDATES]
+        pts, areas = pts[keep], areas[keep]
+    groups = []
+    left = list(range(len(pts)))
+    while len(left) >= 4 and len(groups) < max_sheets:
+        tl = min(left, key=lambda i: pts[i].sum())
+        rest = [i for i in left if i != tl and 0.4 < areas[i]/areas[tl] < 2.5]
+        rest = sorted(rest, key=lambda i: abs(np.log(areas[i]/areas[tl])))[:MAX_CORNER_CHOICES]
+        best, best_cost = None, np.inf
+        for a, b, c in _combinations(rest, 3):
+            q = np.array([pts[tl], pts[a], pts[b], pts[c]], np.float32)
+            o = _extreme_corners(q)
+            if not np.array_equal(o[0], pts[tl]):
+                continue
+            cost = _quad_cost(o)
+            if cost >= best_cost:
+                continue
+            others = [pts[i] for i in rest if i not in (a, b, c)]
+            if any(cv2.pointPolygonTest(o.reshape(-1, 1, 2), (float(x), float(y)), False) >= 0 for x, y in others):
+                continue
+            best, best_cost = (o, (tl, a, b, c)), cost
+        if best is None or best_cost > 0.6:
+            left.remove(tl)   # stray square (not a sheet corner)
+            continue
+        groups.append(best[0])
+        left = [i for i in left if i not in best[1]]
+    groups.sort(key=lambda q: (round(float(q[:, 1].mean()) / max(1.0, float(np.ptp(q[:, 1])))), float(q[:, 0].mean())))
+    return groups
+
+
+_WARP_DST = np.array([[PAD,PAD],[WARP_W-PAD,PAD],[WARP_W-PAD,WARP_H-PAD],[PAD,WARP_H-PAD]], np.float32)
+
+def warp_page(img, dst=None, pool=None, markers=None, template=None):
+    """
+    Find the 4 markers (unless given) and warp to WARP_W×WARP_H (or the template's size).
+    With a BufferPool, every array is reused.
+    """
+    if markers is not None:
+        m = markers
+    elif pool is not None:
+        pool.ensure_for(img)
+        g = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=pool.frame_gray)
+        m = find_markers(g, blur=pool.frame_blur, th=pool.frame_th)
+    else:
+        m = find_markers(cv2.cvtColor(img, cv2.COLOR_BGR2GRAY))
+    dst_pts, w, h = (template.warp_dst, template.warp_w, template.warp_h) if template else (_WARP_DST, WARP_W, WARP_H)
+    M = cv2.getPerspectiveTransform(m, dst_pts)
+    return cv2.warpPerspective(img, M, (w, h), dst=dst if _fits(dst, (h, w) + img.shape[2:]) else None)
+
+
+# ---- Pre-scan quality gate ----
+def frame_quality(gray, corners):
+    """Cheap metrics on the marker-bounded region: sharpness, brightness, glare and quad geometry."""
+    H,W = gray.shape[:2]
+    q = np.asarray(corners, np.float32).reshape(4, 2)
+    x,y,bw,bh = cv2.boundingRect(q.astype(np.int32))
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(W, x+bw), min(H, y+bh)
+    roi = gray[y0:y1, x0:x1]
+    if roi.size == 0:
+        roi = gray
+    # Fixed ~320 px working width keeps the cost constant whatever the camera resolution
+    f = min(1.0, 320.0/max(1, roi.shape[1]))
+    small = cv2.resize(roi, None, fx=f, fy=f, interpolation=cv2.INTER_AREA) if f < 1.0 else roi
+    _, sd = cv2.meanStdDev(cv2.Laplacian(small, cv2.CV_32F))
+    brightness = float(cv2.mean(small)[0])
+    glare = float(np.count_nonzero(small >= 250)) / max(1, small.size)
+
+    TL,TR,BR,BL = q
+    top, bottom = np.linalg.norm(TR-TL), np.linalg.norm(BR-BL)
+    left, right = np.linalg.norm(BL-TL), np.linalg.norm(BR-TR)
+    def _ratio(a, b):
+        return max(a, b)/max(1e-6, min(a, b))
+    side_ratio = max(_ratio(top, bottom), _ratio(left, right))
+    angle_dev = 0.0
+    for i in range(4):
+        p, a, b = q[i], q[i-1], q[(i+1) % 4]
+        u, v = a-p, b-p
+        c = float(np.dot(u, v)/max(1e-6, np.linalg.norm(u)*np.linalg.norm(v)))
+        angle_dev = max(angle_dev, abs(90.0 - math.degrees(math.acos(max(-1.0, min(1.0, c))))))
+    coverage = abs(float(cv2.contourArea(q))) / float(W*H)
+    return {"sharpness": float(sd[0][0])**2, "brightness": brightness, "glare": glare,
+            "side_ratio": float(side_ratio), "angle_dev": angle_dev, "coverage": coverage}
+
+
+def quality_problems(q, limits=QUALITY):
+    """Human-readable reasons a frame should not be graded (empty list = good to scan)."""
+    out = []
+    if q["sharpness"] < limits["min_sharpness"]:
+        out.append("blurry")
+    if q["brightness"] < limits["min_brightness"]:
+        out.append("too dark")
+    elif q["brightness"] > limits["max_brightness"]:
+        out.append("overexposed")
+    if q["glare"] > limits["max_glare"]:
+        out.append("glare")
+    if q["side_ratio"] > limits["max_side_ratio"] or q["angle_dev"] > limits["max_angle_dev"]:
+        out.append("skewed")
+    if q["coverage"] < limits["min_coverage"]:
+        out.append("too far")
+    return out
 
 
 # ---- Bubble scoring helpers ----
+_RING_MASKS = {}   # (r_in, r1, r2) -> (half, mask_in, mask_ring), patch-sized and shared by every bubble
+
+def ring_masks(r_in, r1, r2):
+    """(half, disc mask, ring mask) bubble patches for the given radii (cached; also used by autocalib)."""
+    key = (int(r_in), int(r1), int(r2))
+    hit = _RING_MASKS.get(key)
+    if hit is None:
+        half = max(key) + 1
+        size = 2*half + 1
+        mask_in = np.zeros((size, size), np.uint8)
+        mask_ring = np.zeros((size, size), np.uint8)
+        cv2.circle(mask_in, (half,half), key[0], 255, -1)
+        cv2.circle(mask_ring, (half,half), key[2], 255, -1)
+        cv2.circle(mask_ring, (half,half), key[1], 0, -1)
+        hit = _RING_MASKS[key] = (half, mask_in, mask_ring)
+    return hit
+
+
 def center_ring_score(gray, cx, cy, r_in, r1, r2):
+    # Same disc/ring pixels as full-frame masks, but only the bubble's patch is touched
     H,W = gray.shape
-    mask_in = np.zeros((H,W), np.uint8)
-    mask_ring = np.zeros((H,W), np.uint8)
-    cv2.circle(mask_in, (cx,cy), int(r_in), 255, -1)
-    cv2.circle(mask_ring, (cx,cy), int(r2), 255, -1)
-    cv2.circle(mask_ring, (cx,cy), int(r1), 0, -1)
-    mi = cv2.mean(gray, mask=mask_in)[0]
-    mr = cv2.mean(gray, mask=mask_ring)[0]
+    half, mask_in, mask_ring = ring_masks(r_in, r1, r2)
+    x0, y0 = cx-half, cy-half
+    xa, ya = max(0, x0), max(0, y0)
+    xb, yb = min(W, x0+mask_in.shape[1]), min(H, y0+mask_in.shape[0])
+    if xa >= xb or ya >= yb:
+        return 0.0
+    patch = gray[ya:yb, xa:xb]
+    mi = cv2.mean(patch, mask=mask_in[ya-y0:yb-y0, xa-x0:xb-x0])[0]
+    mr = cv2.mean(patch, mask=mask_ring[ya-y0:yb-y0, xa-x0:xb-x0])[0]
     return max(0.0, (mr-mi)/max(1.0, mr))
 
 
@@ -90,88 +310,298 @@ def _grid_centers_and_scores(gray, box, rows, cols, cfg):
     return centers, scores, r_draw
 
 
-def detect_answers(warped_gray, cfg):
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    g = clahe.apply(warped_gray)
+_CLAHE = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+_CLAHE_TLS = threading.local()
+
+def _clahe():
+    """CLAHE objects keep internal work buffers, so worker threads each get their own."""
+    if threading.current_thread() is threading.main_thread():
+        return _CLAHE
+    c = getattr(_CLAHE_TLS, "clahe", None)
+    if c is None:
+        c = _CLAHE_TLS.clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
+    return c
+
+def equalize(warped_gray, dst=None):
+    """CLAHE-equalized page, the image every bubble score is measured on."""
+    return _clahe().apply(warped_gray, dst=dst if _fits(dst, warped_gray.shape) else None)
+
+
+def score_answers(warped_gray, cfg, dst=None, template=None):
+    """Return (scores[items, choices], centers_per_item, r_draw) without deciding anything."""
+    g = equalize(warped_gray, dst)
+    rois, rows = (template.rois_answers, template.rows_per_roi) if template else (ANSWER_ROIS, 10)
+    centers=[]; scores=[]; r_draw=8
+    for box in rois:
+        c, s, r_draw = _grid_centers_and_scores(g, box, rows=rows, cols=5, cfg=cfg)
+        centers.extend(c)
+        scores.extend(s)
+    return np.array(scores, float).reshape(-1, 5), centers, r_draw
+
 
-    answers=[]; centers=[]; r_draw=8
+def decide_rows(scores, cfg):
+    """Per-row pick from an (items × choices) score array; -1 = blank/ambiguous."""
+    if len(scores) == 0:
+        return []
     abs_min, margin, z_min = cfg["abs_min"], cfg["margin"], cfg["z_min"]
     force_pick = bool(cfg.get("force_pick", False))
+    best = scores.argmax(1)
+    top = scores[np.arange(len(scores)), best]
+    second = np.partition(scores, -2, axis=1)[:, -2]
+    z = (top - scores.mean(1)) / (scores.std(1) + 1e-6)
+    good = (top >= abs_min) & (top >= second+margin) & (z >= z_min)
+    return np.where(good | force_pick, best, -1).tolist()
 
-    for box in ANSWER_ROIS:
-        c, s, r_draw = _grid_centers_and_scores(g, box, rows=10, cols=5, cfg=cfg)
-        centers.extend(c)
-        for row_scores in s:
-            arr = np.array(row_scores, float)
-            best = int(arr.argmax())
-            second = float(np.partition(arr, -2)[-2]) if len(arr)>1 else 0.0
-            mean, std = arr.mean(), arr.std()+1e-6
-            z = (arr[best]-mean)/std
-            good = (arr[best] >= abs_min) and (arr[best] >= second+margin) and (z >= z_min)
-            answers.append(best if (good or force_pick) else -1)
-    return answers, centers, r_draw
-
-
-def detect_student_id(warped_gray, cfg):
-    """Return (id_string, id_centers_per_col, r_draw). Always picks 5 digits."""
-    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8,8))
-    g = clahe.apply(warped_gray)
 
-    centers, scores, r_draw = _grid_centers_and_scores(g, ROI_ID, rows=10, cols=5, cfg=cfg)
-    if not centers:
-        return "", [], r_draw
+def row_confidence(scores, cfg, fill_ref=0.15, z_full=1.0):
+    """
+    Per-row confidence (0..1) in decide_rows' call: for a pick, how far the fill clears the margin,
+    abs_min and z thresholds (relative to a clear fill `fill_ref`); for a blank, how light its darkest bubble is.
+    """
+    if len(scores) == 0:
+        return np.zeros(0)
+    srt = np.sort(scores, axis=1)
+    top, second = srt[:, -1], srt[:, -2]
+    z = (top - scores.mean(1)) / (scores.std(1) + 1e-6)
+    picked = np.asarray(decide_rows(scores, cfg)) >= 0
+    pick_conf = np.minimum.reduce([(top - second - cfg["margin"]) / fill_ref,
+                                   (top - cfg["abs_min"]) / fill_ref,
+                                   (z - cfg["z_min"]) / z_full])
+    blank_conf = 1.0 - top / fill_ref
+    return np.clip(np.where(picked, pick_conf, blank_conf), 0.0, 1.0)
+
+
+def sheet_confidence(ans_scores, id_scores, cfg, n_items=None, fill_ref=0.15, z_full=1.0):
+    """(confidence of the weakest active row or ID digit, per-row confidences) for one scan."""
+    rows = row_confidence(np.asarray(ans_scores, float)[:n_items], cfg, fill_ref, z_full)
+    id_scores = np.asarray(id_scores, float)
+    digits = np.zeros(0)
+    if id_scores.ndim == 2 and id_scores.shape[0] >= 2:
+        srt = np.sort(id_scores, axis=0)
+        digits = np.clip((srt[-1] - srt[-2]) / fill_ref, 0.0, 1.0)
+    both = np.concatenate([rows, digits])
+    return (float(both.min()) if both.size else 0.0), rows
+
+
+def detect_answers(warped_gray, cfg, dst=None, template=None):
+    scores, centers, r_draw = score_answers(warped_gray, cfg, dst, template)
+    return decide_rows(scores, cfg), centers, r_draw
+
 
+def score_student_id(warped_gray, cfg, dst=None, template=None):
+    """Return (scores[digit_rows, id_cols], centers[row][col], r_draw)."""
+    g = equalize(warped_gray, dst)
+    roi = template.roi_id if template else ROI_ID
+    centers, scores, r_draw = _grid_centers_and_scores(g, roi, rows=10, cols=5, cfg=cfg)
+    return np.array(scores, float), centers, r_draw
+
+
+def decode_student_id(scores, centers):
+    """Argmax digit per column -> (id_string, id_cols=[(best_row, col_centers), ...])."""
+    if not centers:
+        return "", []
     rows=len(centers); cols=len(centers[0]) if rows else 0
     id_digits=[]; id_cols=[]
     for c in range(cols):
-        col_scores = [scores[r][c] for r in range(rows)]
         col_centers = [centers[r][c] for r in range(rows)]
-        best_row = int(np.argmax(col_scores))
+        best_row = int(np.argmax(scores[:, c]))
         id_digits.append(DIGITS_TOP_TO_BOTTOM[best_row])
         id_cols.append((best_row, col_centers))
-    return "".join(id_digits), id_cols, r_draw
+    return "".join(id_digits), id_cols
+
+
+def detect_student_id(warped_gray, cfg, dst=None, template=None):
+    """Return (id_string, id_centers_per_col, r_draw). Always picks 5 digits."""
+    scores, centers, r_draw = score_student_id(warped_gray, cfg, dst, template)
+    if not centers:
+        return "", [], r_draw
+    student_id, id_cols = decode_student_id(scores, centers)
+    return student_id, id_cols, r_draw
+
+
+def detect_key_set(warped_gray, cfg, dst=None, template=None):
+    """Exam-version bubble row of the template -> set name, or "" (no row on this layout / unclear fill)."""
+    ks = template.key_set if template else None
+    if not ks:
+        return ""
+    g = equalize(warped_gray, dst)
+    names = ks["names"]
+    _, scores, _ = _grid_centers_and_scores(g, ks["roi"], rows=1, cols=len(names), cfg=cfg)
+    if not scores:
+        return ""
+    pick = decide_rows(np.array(scores, float).reshape(1, -1), cfg)[0]
+    return str(names[pick]).upper() if pick >= 0 else ""
 
 
-def annotate(warped, centers, r, answers, key=None, mark_blanks=True, id_cols=None, r_id=None, limit_items=None):
-    out = warped.copy()
+# ---- Multi-frame fusion ----
+class ScoreFusion:
+    """
+    Online (Welford) mean/variance of every bubble score across consecutive stable frames.
+    A row is confident once its decision cannot flip within `z_conf` standard errors;
+    the scan finalizes as soon as all active rows and ID columns are confident.
+    """
+    def __init__(self, cfg, min_frames=2, max_frames=12, z_conf=3.0):
+        self.cfg = cfg
+        self.min_frames, self.max_frames, self.z_conf = int(min_frames), int(max_frames), float(z_conf)
+        self.reset()
+
+    def reset(self):
+        self.n = 0
+        self.mean_ans = self.m2_ans = None
+        self.mean_id = self.m2_id = None
+
+    @staticmethod
+    def _welford(n, mean, m2, x):
+        if mean is None:
+            return x.astype(float), np.zeros_like(x, float)
+        d = x - mean
+        mean = mean + d/n
+        return mean, m2 + d*(x - mean)
+
+    def add(self, ans_scores, id_scores):
+        self.n += 1
+        self.mean_ans, self.m2_ans = self._welford(self.n, self.mean_ans, self.m2_ans, np.asarray(ans_scores, float))
+        self.mean_id, self.m2_id = self._welford(self.n, self.mean_id, self.m2_id, np.asarray(id_scores, float))
+
+    def _sem(self, m2):
+        # Standard error of the mean; unknown (inf) until there are two frames
+        if self.n < 2:
+            return np.full_like(m2, np.inf)
+        return np.sqrt(m2/(self.n-1)/self.n)
+
+    def _top2(self, mean, sem, axis):
+        order = np.argsort(-mean, axis=axis)
+        best = np.take(order, 0, axis=axis); second = np.take(order, 1, axis=axis)
+        pick = lambda a, i: np.take_along_axis(a, np.expand_dims(i, axis), axis).squeeze(axis)
+        return pick(mean, best), pick(mean, second), pick(sem, best), pick(sem, second)
+
+    def row_confidence(self, n_items=None):
+        """Signed decision margin per row in standard errors (|value| >= z_conf means settled)."""
+        mean = self.mean_ans[:n_items]; sem = self._sem(self.m2_ans)[:n_items]
+        top, second, s_top, s_sec = self._top2(mean, sem, axis=1)
+        se = np.sqrt(s_top**2 + s_sec**2) + 1e-9
+        z, s_z = self._z_se(mean, sem)
+        # Distance of the row to each of decide_rows' thresholds (separation, absolute level, z-score)
+        return np.minimum.reduce([np.abs(top - second - self.cfg["margin"])/se,
+                                  np.abs(top - self.cfg["abs_min"])/(s_top+1e-9),
+                                  np.abs(z - self.cfg["z_min"])/(s_z+1e-9)])
+
+    @staticmethod
+    def _z_se(mean, sem):
+        """Per-row z-score of the top choice as decide_rows computes it, and its standard error (delta method)."""
+        rows, k = np.arange(len(mean)), mean.shape[1]
+        mu = mean.mean(1, keepdims=True)
+        sd = mean.std(1, keepdims=True) + 1e-6
+        best = mean.argmax(1)
+        lead = mean[rows, best][:, None] - mu
+        # dz/dx_j = ([j == best] - 1/k)/sd - lead*(x_j - mu)/(k*sd^3)
+        grad = -1.0/(k*sd) - lead*(mean - mu)/(k*sd**3)
+        grad[rows, best] += 1.0/sd[:, 0]
+        return (lead/sd)[:, 0], np.sqrt(np.nansum((grad*sem)**2, axis=1))
+
+    def id_confidence(self):
+        mean, sem = self.mean_id, self._sem(self.m2_id)
+        if mean.ndim < 2 or mean.shape[0] < 2:
+            return np.zeros(0)
+        top, second, s_top, s_sec = self._top2(mean, sem, axis=0)
+        return (top - second)/(np.sqrt(s_top**2 + s_sec**2) + 1e-9)
+
+    def confident(self, n_items=None):
+        if self.n < max(2, self.min_frames):
+            return False
+        return bool(np.all(self.row_confidence(n_items) >= self.z_conf) and np.all(self.id_confidence() >= self.z_conf))
+
+    def done(self, n_items=None):
+        return self.n >= self.max_frames or self.confident(n_items)
+
+    def answers(self):
+        return decide_rows(self.mean_ans, self.cfg)
+
+
+# ---- Annotation ----
+_GUIDE_CACHE = {}   # (shape, r, centers) -> flat pixel indices of the yellow guide rings
+
+def _guide_pixels(shape, centers, r):
+    """Flat indices of the guide-ring pixels for one layout; rasterized once, reused every sheet."""
+    key = (shape[:2], r, tuple(p for row in centers for p in row))
+    idx = _GUIDE_CACHE.get(key)
+    if idx is None:
+        mask = np.zeros(shape[:2], np.uint8)
+        for row in centers:
+            for (x,y) in row:
+                cv2.circle(mask, (x,y), r, 255, 1)
+        idx = np.flatnonzero(mask)
+        if len(_GUIDE_CACHE) >= 8:
+            _GUIDE_CACHE.clear()
+        _GUIDE_CACHE[key] = idx
+    return idx
+
+
+def _scale_pts(row, s):
+    return [(int(round(x*s)), int(round(y*s))) for (x,y) in row]
+
+
+def annotate(warped, centers, r, answers, key=None, mark_blanks=True, id_cols=None, r_id=None, limit_items=None,
+             scale=1.0, dst=None, item_offset=0):
+    """
+    Draw guides, correctness marks and the ID pick. scale<1 renders straight at display resolution.
+    item_offset: exam item number before this page's first item (multi-page exams).
+    """
+    s = float(scale or 1.0)
+    if s != 1.0:
+        H,W = warped.shape[:2]
+        size = (max(1,int(round(W*s))), max(1,int(round(H*s))))
+        out = cv2.resize(warped, size, dst=dst if _fits(dst, (size[1], size[0]) + warped.shape[2:]) else None,
+                         interpolation=cv2.INTER_AREA)
+        centers = [_scale_pts(row, s) for row in centers]
+        if id_cols:
+            id_cols = [(best_row, _scale_pts(col, s)) for best_row, col in id_cols]
+        r = max(1, int(round(r*s)))
+        r_id = max(1, int(round(r_id*s))) if r_id else None
+    elif _fits(dst, warped.shape) and dst is not warped:
+        out = dst
+        np.copyto(out, warped)
+    else:
+        out = warped.copy()
     N = len(answers) if limit_items is None else max(0, int(limit_items))
+    thick = max(1, int(round(3*s)))
+    font_scale = 0.45*s
+    text_dx, text_dy = int(round(44*s)), int(round(5*s))
 
-    # Guides for all items (yellow)
-    for row in centers:
-        for (x,y) in row:
-            cv2.circle(out, (x,y), r, (0,255,255), 1)
+    # Guides for all items (yellow) — cached per layout, blended in one write
+    out.reshape(-1, out.shape[2])[_guide_pixels(out.shape, centers, r)] = (0,255,255)
 
     # Correctness for first N
     for i,row in enumerate(centers):
         if i >= N:
             continue
         sel = answers[i] if i < len(answers) else -1
-        k = key.get(i+1, None) if key else None
+        k = key.get(item_offset+i+1, None) if key else None
 
         if sel < 0:
             if mark_blanks and row:
                 xavg = int(sum(p[0] for p in row)/len(row))
                 yavg = int(sum(p[1] for p in row)/len(row))
-                cv2.putText(out, "NO ANSWER", (xavg - 44, yavg + 5),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0,0,255), 2, cv2.LINE_AA)
+                cv2.putText(out, "NO ANSWER", (xavg - text_dx, yavg + text_dy),
+                            cv2.FONT_HERSHEY_SIMPLEX, font_scale, (0,0,255), max(1, int(round(2*s))), cv2.LINE_AA)
             if k is not None and 0 <= k < len(row):
                 xg, yg = row[k]
-                cv2.circle(out, (xg,yg), r, (0,255,0), 3)
+                cv2.circle(out, (xg,yg), r, (0,255,0), thick)
             continue
 
         if k is None:
             x,y = row[sel]
-            cv2.circle(out, (x,y), r, (0,255,0), 3)
+            cv2.circle(out, (x,y), r, (0,255,0), thick)
         else:
             if sel == k:
                 xg, yg = row[sel]
-                cv2.circle(out, (xg,yg), r, (0,255,0), 3)
+                cv2.circle(out, (xg,yg), r, (0,255,0), thick)
             else:
                 xr, yr = row[sel]
-                cv2.circle(out, (xr,yr), r, (0,0,255), 3)
+                cv2.circle(out, (xr,yr), r, (0,0,255), thick)
                 if 0 <= k < len(row):
                     xg, yg = row[k]
-                    cv2.circle(out, (xg,yg), r, (0,255,0), 3)
+                    cv2.circle(out, (xg,yg), r, (0,255,0), thick)
 
     # Student ID (blue guides + pick)
     if id_cols:
@@ -180,14 +610,20 @@ def annotate(warped, centers, r, answers, key=None, mark_blanks=True, id_cols=No
             for (x,y) in col_centers:
                 cv2.circle(out,(x,y), rr, (255,0,0), 1)
             x,y = col_centers[best_row]
-            cv2.circle(out,(x,y), rr, (255,0,0), 3)
+            cv2.circle(out,(x,y), rr, (255,0,0), thick)
     return out
 
 
-def grade(answers, key, limit_items=None):
+def display_scale(shape, box_w, box_h):
+    """Downscale factor (<=1) that fits an image of `shape` into a box_w×box_h widget."""
+    ih, iw = shape[:2]
+    return min(1.0, box_w/float(iw), box_h/float(ih))
+
+
+def grade(answers, key, limit_items=None, item_offset=0):
     correct = 0
     N = len(answers) if limit_items is None else max(0, int(limit_items))
-    for i,a in enumerate(answers[:N], 1):
+    for i,a in enumerate(answers[:N], item_offset+1):
         k = key.get(i, None)
         if k is not None and a == k:
             correct += 1
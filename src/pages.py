@@ -0,0 +1,57 @@
+# pages.py
+# Joins the pages of multi-page exams (one sheet per page, same student ID) into one answer vector.
+# Incomplete students are kept in a small JSON file in the session folder so a restart loses nothing.
+
+import os, json
+
+PAGES_PENDING_NAME = "pages_pending.json"
+
+
+class PageStitcher:
+    """
+    student_id -> pages seen so far. `add` returns the stitched result once every page is in:
+    {'answers': full vector (-1 where no page covers an item), 'bases': sheet names in page order}.
+    Rescanning a page replaces the earlier copy.
+    """
+    def __init__(self, session_dir=None):
+        self.path = os.path.join(session_dir, PAGES_PENDING_NAME) if session_dir else None
+        self.pending = {}
+        if self.path and os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.pending = json.load(f)
+            except Exception:
+                self.pending = {}
+
+    def _save(self):
+        if not self.path:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.pending, f, separators=(",", ":"))
+        os.replace(tmp, self.path)
+
+    def add(self, student_id, page, pages, item_offset, answers, base):
+        entry = self.pending.setdefault(student_id, {'pages': int(pages), 'parts': {}})
+        entry['parts'][str(int(page))] = {'offset': int(item_offset), 'answers': list(answers), 'base': base}
+        if len(entry['parts']) < entry['pages']:
+            self._save()
+            return None
+        del self.pending[student_id]
+        self._save()
+        parts = [entry['parts'][p] for p in sorted(entry['parts'], key=int)]
+        width = max(p['offset'] + len(p['answers']) for p in parts)
+        answers = [-1] * width
+        for p in parts:
+            answers[p['offset']:p['offset'] + len(p['answers'])] = p['answers']
+        return {'answers': answers, 'bases': [p['base'] for p in parts]}
+
+    def missing(self, student_id):
+        """Page numbers still missing for a student (empty if nothing is pending)."""
+        entry = self.pending.get(student_id)
+        if not entry:
+            return []
+        return [p for p in range(1, entry['pages'] + 1) if str(p) not in entry['parts']]
+
+    def __len__(self):
+        return len(self.pending)
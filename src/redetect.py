@@ -0,0 +1,153 @@
+# redetect.py
+# Batch re-detection of a session's stored sheets across a process pool, e.g. after tuning CALIB.
+# Workers are spawned fresh, so they read config.py as it is on disk now (not the running app's copy).
+
+import os, multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+
+from sheets import load_sheet_meta, load_sheet_gray, update_sheet_meta
+from roster import RosterIndex, id_columns
+
+
+def _init_worker():
+    from templates import load_templates
+    cv2.setNumThreads(1)   # one OpenCV thread per process; the pool provides the parallelism
+    load_templates()
+
+
+def _redetect_page(session_dir, base, meta):
+    from omr import detect_answers, score_student_id, decode_student_id
+    from templates import get_template
+    tpl = get_template(meta.get('template'))
+    gray = load_sheet_gray(session_dir, meta)
+    answers, centers, r = detect_answers(gray, tpl.cfg, template=tpl)
+    id_scores, id_centers, r_id = score_student_id(gray, tpl.cfg, template=tpl)
+    student_id, id_cols = decode_student_id(id_scores, id_centers)
+    return {'base': base, 'answers': answers, 'centers': centers, 'r': r,
+            'student_id': student_id, 'id_cols': id_cols, 'r_id': r_id, 'id_scores': id_scores}
+
+
+def redetect_sheet(session_dir, base):
+    """
+    Re-run answer/ID detection on one stored result with the current calibration. Multi-page results
+    (first page lists the others) are re-detected page by page and joined at each page's item offset.
+    """
+    meta = load_sheet_meta(session_dir, base)
+    pages = []
+    for b in meta.get('pages_bases') or [base]:
+        m = meta if b == base else load_sheet_meta(session_dir, b)
+        det = _redetect_page(session_dir, b, m)
+        det['item_offset'] = int(m.get('item_offset', 0))
+        pages.append(det)
+    answers = []
+    for det in pages:
+        off = det['item_offset']
+        answers += [-1] * (off + len(det['answers']) - len(answers))
+        answers[off:off + len(det['answers'])] = det['answers']
+    return dict(pages[0], answers=answers, pages=pages, key_set=meta.get('key_set', ''))
+
+
+def redetect_session(session_dir, bases, job=None, workers=None):
+    """{base: detection dict or Exception} for every stored sheet in `bases`, in parallel."""
+    workers = workers or max(1, (os.cpu_count() or 2) - 1)
+    out, total = {}, len(bases)
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker) as ex:
+        futures = {ex.submit(redetect_sheet, session_dir, b): b for b in bases}
+        try:
+            for done, fut in enumerate(as_completed(futures), 1):
+                base = futures[fut]
+                try:
+                    out[base] = fut.result()
+                except Exception as e:
+                    out[base] = e
+                if job is not None:
+                    job.progress(done, total)
+        except BaseException:
+            ex.shutdown(wait=False, cancel_futures=True)
+            raise
+    return out
+
+
+def diff_redetection(matrix, results, kv, id_to_name=None, keys=None):
+    """
+    Compare fresh detections with the confirmed rows. Returns a list of dicts (only rows that changed):
+    row, base, items [(q, old, new)], old/new ID, old/new score, answers, name and `conflict`
+    (new ID already used by another sheet; the old ID is kept). With a multi-version KeyMatrix `keys`,
+    detections are moved to canonical item order and scored against their own set. When `id_to_name`
+    is a RosterIndex, an ID missing from it is corrected the way the scan did before comparing.
+    """
+    id_to_name = id_to_name or {}
+    taken = {m['student_id'] for m in matrix.meta if m['student_id']}
+    changes = []
+    for i, m in enumerate(matrix.meta):
+        det = results.get(m['filename'])
+        if not isinstance(det, dict):
+            continue
+        n = int(m['max'])
+        old = matrix.row_answers(i)
+        new = list(det['answers'][:n])
+        if keys is not None and len(keys) > 1:
+            # Canonical order: the first n printed items may land past column n
+            v = keys.index(det.get('key_set', ''))
+            new = keys.to_canonical(new, v)
+            score = int(keys.grade(np.array([new], np.int8), [v], [n])[0])
+        else:
+            score = sum(1 for q, a in enumerate(new) if q < len(kv) and a >= 0 and a == kv[q])
+        w = max(n, len(old), len(new))
+        old, new = old + [-1] * (w - len(old)), new + [-1] * (w - len(new))
+        items = [(q + 1, a, b) for q, (a, b) in enumerate(zip(old, new)) if a != b]
+        new_id, conflict = det['student_id'], False
+        if isinstance(id_to_name, RosterIndex) and new_id not in id_to_name and len(det.get('id_scores', ())):
+            fix = id_to_name.correct(det['id_scores'])
+            if fix:
+                new_id = fix[0]
+                det['pages'][0]['id_cols'] = id_columns(new_id, det['pages'][0]['id_cols'])
+        if new_id != m['student_id'] and new_id in taken:
+            new_id, conflict = m['student_id'], True
+        if items or new_id != m['student_id'] or conflict:
+            name = id_to_name.get(new_id, m['student_name'] if new_id == m['student_id'] else "(Unknown)")
+            changes.append({'row': i, 'base': m['filename'], 'items': items, 'answers': new,
+                            'old_id': m['student_id'], 'new_id': new_id, 'conflict': conflict,
+                            'old_score': int(m['score']), 'new_score': score, 'name': name, 'det': det})
+            if new_id != m['student_id']:
+                taken.discard(m['student_id']); taken.add(new_id)
+    return changes
+
+
+def apply_redetection(session_dir, matrix, store, changes):
+    """Write accepted changes to the matrix, the SQLite store and the sheet sidecars."""
+    for c in changes:
+        i = c['row']
+        matrix.set_answers(i, c['answers'])
+        matrix.set_scores([i], [c['new_score']])
+        matrix.meta[i].update(student_id=c['new_id'], student_name=c['name'])
+        for det in c['det']['pages']:
+            update_sheet_meta(session_dir, det['base'], answers=det['answers'], centers=det['centers'], r=det['r'],
+                              id_cols=det['id_cols'], r_id=det['r_id'], student_id=c['new_id'])
+    if store is not None:
+        store.update_results((c['base'], c['old_id'], c['new_id'], c['name'], c['new_score'], c['answers'])
+                             for c in changes)
+
+
+if __name__ == "__main__":
+    # Dry run: python redetect.py "<session folder>"  -> prints what would change
+    import sys
+    from analysis import key_vector
+    from session_store import SessionStore, load_session
+
+    session_dir = sys.argv[1]
+    store = SessionStore(session_dir)
+    matrix, info, _ = load_session(session_dir, store)
+    store.close()
+    key = {int(q): int(a) for q, a in info.get('key') or []}
+    if not key and len(matrix):
+        key = load_sheet_meta(session_dir, matrix.meta[-1]['filename'])['key']
+    results = redetect_session(session_dir, [m['filename'] for m in matrix.meta])
+    changes = diff_redetection(matrix, results, key_vector(key, max(matrix.n_items, max(key, default=0))))
+    for c in changes:
+        items = ", ".join(f"Q{q}" for q, _, _ in c['items'])
+        print(f"{c['base']}: ID {c['old_id']}->{c['new_id']} score {c['old_score']}->{c['new_score']} {items}")
+    print(f"{len(changes)} of {len(matrix)} sheet(s) would change.")
@@ -0,0 +1,200 @@
+# roster.py
+# Class-list index for exact student-ID lookup and confidence-aware correction of misread IDs.
+#
+# A misread ID is corrected towards the roster ID that costs the least bubble evidence: per column,
+# changing the argmax digit to digit d costs (top score - score of d). Candidates are enumerated
+# best-first over the per-column alternatives (at most `max_changes` columns changed), so a lookup
+# touches only a handful of binary-search probes whatever the roster size.
+# Parsed class lists are cached as memory-mapped .npy arrays (load_roster), so district-size rosters
+# reload without re-reading the text file.
+
+import os, json, heapq, hashlib
+import numpy as np
+from config import DIGITS_TOP_TO_BOTTOM, ROSTER, ROSTER_CACHE_DIR
+from files_io import class_section_name, class_section_rows
+
+_DIGIT_ROW = {d: r for r, d in enumerate(DIGITS_TOP_TO_BOTTOM)}
+_ARRAYS = ("ids", "name_off", "names", "sets")
+
+
+class RosterIndex:
+    """
+    Valid student IDs of a class list as sorted int32 IDs with names in one UTF-8 blob (offsets
+    alongside) and the optional exam set per student. Arrays may be memory-mapped from the cache.
+    """
+    def __init__(self, ids=None, name_off=None, names=None, sets=None, section=None):
+        self.ids = np.zeros(0, np.int32) if ids is None else ids
+        self.name_off = np.zeros(1, np.int64) if name_off is None else name_off
+        self.names = np.zeros(0, np.uint8) if names is None else names
+        self.sets = np.zeros(len(self.ids), np.uint8) if sets is None else sets
+        self.section = section
+
+    @classmethod
+    def from_rows(cls, rows, section=None):
+        """Build from (name, id, set) rows (e.g. files_io.class_section_rows); a repeated ID keeps its last line."""
+        by_id = {}
+        for name, sid, key_set in rows:
+            by_id[int(sid)] = (name, key_set)
+        ids = np.fromiter(by_id, np.int32, len(by_id))
+        order = np.argsort(ids, kind="stable")
+        entries = list(by_id.values())
+        blobs = [entries[i][0].encode("utf-8") for i in order.tolist()]
+        name_off = np.zeros(len(blobs) + 1, np.int64)
+        np.cumsum([len(b) for b in blobs], out=name_off[1:])
+        sets = np.array([ord(entries[i][1]) if entries[i][1] else 0 for i in order.tolist()], np.uint8)
+        return cls(ids[order], name_off, np.frombuffer(b"".join(blobs), np.uint8), sets, section)
+
+    @classmethod
+    def from_dict(cls, id_to_name, section=None):
+        return cls.from_rows(((n, sid, "") for sid, n in id_to_name.items()), section)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _find(self, student_id):
+        """Row of a 5-digit ID string, or -1."""
+        if len(student_id) != 5 or not student_id.isdigit():
+            return -1
+        v = int(student_id)
+        i = int(np.searchsorted(self.ids, v))
+        return i if i < len(self.ids) and self.ids[i] == v else -1
+
+    def __contains__(self, student_id):
+        return bool(student_id) and self._find(student_id) >= 0
+
+    def get(self, student_id, default=None):
+        """Name for an ID (dict-style, so the index can stand in for an id -> name mapping)."""
+        i = self._find(student_id) if student_id else -1
+        if i < 0:
+            return default
+        return bytes(self.names[self.name_off[i]:self.name_off[i+1]]).decode("utf-8")
+
+    def name(self, student_id, default="(Unknown)"):
+        return self.get(student_id, default)
+
+    def key_set(self, student_id):
+        """Exam version assigned to a student by the class list ('' when none)."""
+        i = self._find(student_id) if student_id else -1
+        return chr(self.sets[i]) if i >= 0 and self.sets[i] else ""
+
+    def candidates(self, id_scores, k=3, max_changes=ROSTER["max_changes"], max_cost=ROSTER["max_cost"],
+                   max_steps=ROSTER["max_steps"]):
+        """
+        Up to k roster IDs as [(student_id, cost)], cheapest first, reachable from the per-column
+        digit scores (digit rows × ID columns, DIGITS_TOP_TO_BOTTOM order) by changing at most
+        max_changes digits. cost is the summed score deficit of the digits used (0 = the argmax ID).
+        """
+        S = np.asarray(id_scores, float)
+        if S.ndim != 2 or not len(self):
+            return []
+        order = np.argsort(-S, axis=0)                      # per column: digit rows, best first
+        deficit = (S[order[0], np.arange(S.shape[1])] - np.take_along_axis(S, order, 0)).tolist()
+        digits = [[DIGITS_TOP_TO_BOTTOM[r] for r in order[:, c]] for c in range(S.shape[1])]
+        cols, depth = S.shape[1], S.shape[0]
+
+        # Best-first over index vectors (rank of the digit used in each column)
+        start = (0,) * cols
+        heap, seen, out = [(0.0, start)], {start}, []
+        steps = 0
+        while heap and len(out) < k and steps < max_steps:
+            cost, idx = heapq.heappop(heap)
+            if cost > max_cost:
+                break
+            steps += 1
+            sid = "".join(digits[c][i] for c, i in enumerate(idx))
+            if self._find(sid) >= 0:
+                out.append((sid, cost))
+            changed = sum(1 for i in idx if i)
+            for c in range(cols):
+                i = idx[c] + 1
+                if i >= depth or (idx[c] == 0 and changed >= max_changes):
+                    continue
+                nxt = idx[:c] + (i,) + idx[c+1:]
+                if nxt not in seen:
+                    seen.add(nxt)
+                    heapq.heappush(heap, (cost - deficit[idx[c]][c] + deficit[i][c], nxt))
+        return out
+
+    def correct(self, id_scores, min_lead=ROSTER["min_lead"]):
+        """
+        (student_id, cost) of the roster ID the scores most likely show, or None when nothing is
+        close enough or the runner-up is within min_lead (ambiguous: leave it to the reviewer).
+        """
+        cands = self.candidates(id_scores, k=2)
+        if not cands:
+            return None
+        if len(cands) > 1 and cands[1][1] - cands[0][1] < min_lead:
+            return None
+        return cands[0]
+
+
+def id_columns(student_id, id_cols):
+    """id_cols (best_row, centers) per column re-pointed at the digits of `student_id` (for annotation)."""
+    return [(_DIGIT_ROW.get(d, row), centers) for d, (row, centers) in zip(student_id, id_cols)]
+
+
+# ---- Binary cache ----
+def _file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _cache_dir(path, cache_root):
+    return os.path.join(cache_root, hashlib.sha1(os.path.abspath(path).encode("utf-8")).hexdigest()[:16])
+
+
+def _read_cache(folder):
+    with open(os.path.join(folder, "meta.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    arrays = {k: np.load(os.path.join(folder, f"{meta['sha1'][:12]}.{k}.npy"), mmap_mode="r") for k in _ARRAYS}
+    return meta, RosterIndex(section=meta.get("section"), **arrays)
+
+
+def _write_meta(folder, meta):
+    tmp = os.path.join(folder, "meta.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, os.path.join(folder, "meta.json"))
+
+
+def load_roster(path, cache_root=ROSTER_CACHE_DIR):
+    """
+    RosterIndex for a class-list file. The parsed arrays are cached as .npy files (memory-mapped on
+    load) under cache_root, keyed by the file's mtime/size and, when those moved, its SHA-1, so an
+    unchanged roster reloads without parsing. Returns (index, source) with source "cache" or "parsed".
+    """
+    st = os.stat(path)
+    folder = _cache_dir(path, cache_root)
+    meta, sha1 = None, None
+    try:
+        meta, index = _read_cache(folder)
+        if (meta["mtime"], meta["size"]) == (st.st_mtime, st.st_size):
+            return index, "cache"
+        sha1 = _file_sha1(path)
+        if meta["sha1"] == sha1:   # touched or copied, same content
+            _write_meta(folder, dict(meta, mtime=st.st_mtime, size=st.st_size))
+            return index, "cache"
+    except Exception:
+        pass
+
+    index = RosterIndex.from_rows(class_section_rows(path), class_section_name(path))
+    sha1 = sha1 or _file_sha1(path)
+    try:
+        os.makedirs(folder, exist_ok=True)
+        for k in _ARRAYS:
+            np.save(os.path.join(folder, f"{sha1[:12]}.{k}.npy"), getattr(index, k))
+        _write_meta(folder, {"path": os.path.abspath(path), "mtime": st.st_mtime, "size": st.st_size,
+                             "sha1": sha1, "section": index.section, "n": len(index)})
+        # Older generations (may still be mapped elsewhere; removal is best effort)
+        for name in os.listdir(folder):
+            if name.endswith(".npy") and not name.startswith(sha1[:12]):
+                try:
+                    os.remove(os.path.join(folder, name))
+                except OSError:
+                    pass
+    except OSError as e:
+        print(f"[OMR] roster cache not written: {e}")
+    return index, "parsed"
@@ -0,0 +1,259 @@
+# session_store.py
+# Per-session SQLite store (WAL mode) for confirmed sheets, plus the binary checkpoint used to resume.
+# results.csv is exported from the store.
+
+import os, re, csv, json, sqlite3
+import numpy as np
+from config import LETTERS
+from analysis import AnswerMatrix
+
+STORE_NAME = "session.sqlite"
+CSV_NAME = "results.csv"
+RESULT_FIELDS = ("timestamp", "filename", "exam", "section", "student_name", "student_id", "score", "max", "key_set")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results(
+    id           INTEGER PRIMARY KEY,
+    timestamp    TEXT NOT NULL,
+    filename     TEXT NOT NULL,
+    exam         TEXT NOT NULL DEFAULT '',
+    section      TEXT NOT NULL DEFAULT '',
+    student_name TEXT NOT NULL DEFAULT '',
+    student_id   TEXT NOT NULL DEFAULT '',
+    score        INTEGER NOT NULL,
+    max          INTEGER NOT NULL,
+    answers      BLOB NOT NULL,         -- int8 per item in canonical order, -1 = blank
+    key_set      TEXT NOT NULL DEFAULT ''  -- exam version (answer-key set) the sheet was graded with
+);
+CREATE UNIQUE INDEX IF NOT EXISTS ix_results_student ON results(student_id) WHERE student_id != '';
+CREATE INDEX IF NOT EXISTS ix_results_exam_section ON results(exam, section);
+CREATE INDEX IF NOT EXISTS ix_results_timestamp ON results(timestamp);
+"""
+
+
+def pack_answers(answers):
+    return np.asarray(answers, np.int8).tobytes()
+
+
+def unpack_answers(blob):
+    return np.frombuffer(blob, np.int8).tolist()
+
+
+def answer_letters(answers, n_items):
+    """Answer indices -> letters ('-' for blank), padded to n_items."""
+    out = [LETTERS[a] if isinstance(a, int) and a >= 0 else "-" for a in answers[:n_items]]
+    return out + ["-"] * (n_items - len(out))
+
+
+class SessionStore:
+    """Crash-safe, indexed record of one session's confirmed sheets."""
+    def __init__(self, session_dir):
+        self.session_dir = session_dir
+        self.path = os.path.join(session_dir, STORE_NAME)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(_SCHEMA)
+        cols = {r[1] for r in self.conn.execute("PRAGMA table_info(results)")}
+        if "key_set" not in cols:   # stores written before answer-key sets
+            self.conn.execute("ALTER TABLE results ADD COLUMN key_set TEXT NOT NULL DEFAULT ''")
+        self.conn.commit()
+
+    def has_student(self, student_id):
+        if not student_id:
+            return False
+        cur = self.conn.execute("SELECT 1 FROM results WHERE student_id = ? LIMIT 1", (student_id,))
+        return cur.fetchone() is not None
+
+    def add(self, rec):
+        """Insert one result dict (RESULT_FIELDS + 'answers'). Raises sqlite3.IntegrityError on a duplicate ID."""
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO results(timestamp, filename, exam, section, student_name, student_id, score, max, key_set,"
+                " answers) VALUES (?,?,?,?,?,?,?,?,?,?)",
+                tuple(rec[k] for k in RESULT_FIELDS) + (pack_answers(rec['answers']),))
+        return cur.lastrowid
+
+    def add_many(self, recs):
+        """Bulk insert (used when a session is rebuilt from results.csv)."""
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO results(timestamp, filename, exam, section, student_name, student_id, score, max,"
+                " key_set, answers) VALUES (?,?,?,?,?,?,?,?,?,?)",
+                (tuple(r[k] for k in RESULT_FIELDS) + (pack_answers(r['answers']),) for r in recs))
+
+    def update_scores(self, changes):
+        """Apply re-graded scores: iterable of (filename, student_id, score)."""
+        with self.conn:
+            self.conn.executemany("UPDATE results SET score = ? WHERE filename = ? AND student_id = ?",
+                                  ((int(sc), fn, sid) for fn, sid, sc in changes))
+
+    def update_results(self, changes):
+        """Apply re-detected rows: iterable of (filename, old_id, new_id, name, score, answers)."""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE results SET student_id = ?, student_name = ?, score = ?, answers = ?"
+                " WHERE filename = ? AND student_id = ?",
+                ((new_id, name, int(score), pack_answers(answers), fn, old_id)
+                 for fn, old_id, new_id, name, score, answers in changes))
+
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def records(self):
+        """Yield result dicts in confirm order (answers unpacked)."""
+        cur = self.conn.execute(
+            "SELECT timestamp, filename, exam, section, student_name, student_id, score, max, key_set, answers"
+            " FROM results ORDER BY id")
+        for row in cur:
+            rec = dict(zip(RESULT_FIELDS, row[:-1]))
+            rec['answers'] = unpack_answers(row[-1])
+            yield rec
+
+    def export_csv(self, path=None):
+        """Write results.csv (or `path`) row by row from the store; returns the path written."""
+        path = path or os.path.join(self.session_dir, CSV_NAME)
+        # Canonical answers of a key set can be wider than the items graded ('max')
+        n_items = self.conn.execute("SELECT COALESCE(MAX(MAX(max, LENGTH(answers))), 0) FROM results").fetchone()[0]
+        tmp = path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(list(RESULT_FIELDS) + [f"Q{i:02d}" for i in range(1, n_items+1)])
+            for rec in self.records():
+                w.writerow([rec[k] for k in RESULT_FIELDS] + answer_letters(rec['answers'], n_items))
+        os.replace(tmp, path)
+        return path
+
+    def close(self):
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+# ---- Checkpoint / resume ----
+CHECKPOINT_NAME = "session.ckpt.npz"
+_META_TEXT = ("timestamp", "filename", "exam", "section", "student_name", "student_id", "key_set")
+_LETTER_INDEX = {c: i for i, c in enumerate(LETTERS)}
+
+
+def write_checkpoint(session_dir, matrix, info):
+    """Atomically write the answer matrix + row metadata + session info (exam, key, paths...)."""
+    path = os.path.join(session_dir, CHECKPOINT_NAME)
+    tmp = path + ".tmp.npz"
+    rows = [[m[k] for k in _META_TEXT] for m in matrix.meta]
+    np.savez(tmp,
+             answers=matrix.answers, scores=matrix.scores, max=matrix.max_items,
+             meta=np.frombuffer(json.dumps(rows, separators=(",", ":")).encode("utf-8"), np.uint8),
+             info=np.frombuffer(json.dumps(info).encode("utf-8"), np.uint8))
+    os.replace(tmp, path)
+    return path
+
+
+def read_checkpoint(session_dir):
+    """Return (matrix, info) from the checkpoint, or None when absent/unreadable."""
+    path = os.path.join(session_dir, CHECKPOINT_NAME)
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path) as z:
+            rows = json.loads(z["meta"].tobytes().decode("utf-8"))
+            info = json.loads(z["info"].tobytes().decode("utf-8"))
+            scores, maxes = z["scores"], z["max"]
+            # Checkpoints written before key sets have one text field less
+            meta = [dict(dict.fromkeys(_META_TEXT, ""), **dict(zip(_META_TEXT, r)), score=int(s), max=int(m))
+                    for r, s, m in zip(rows, scores.tolist(), maxes.tolist())]
+            return AnswerMatrix.from_arrays(z["answers"], scores, maxes, meta), info
+    except Exception:
+        return None
+
+
+def matrix_from_records(records):
+    matrix = AnswerMatrix()
+    for rec in records:
+        answers = rec.pop('answers')
+        matrix.append(answers, rec)
+    return matrix
+
+
+def read_results_csv(path):
+    """Stream results.csv rows back into result dicts (letters -> indices)."""
+    with open(path, "r", newline="", encoding="utf-8") as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if not header:
+            return
+        # Info columns are everything before Q01 (older files have no key_set column)
+        n_info = next((i for i, h in enumerate(header) if re.fullmatch(r"Q\d+", h)), len(header))
+        fields = header[:n_info]
+        for row in reader:
+            if len(row) < n_info:
+                continue
+            rec = dict(dict.fromkeys(RESULT_FIELDS, ""), **dict(zip(fields, row[:n_info])))
+            rec['score'], rec['max'] = int(rec['score'] or 0), int(rec['max'] or 0)
+            rec['answers'] = [_LETTER_INDEX.get(c, -1) for c in row[n_info:]]
+            yield rec
+
+
+def load_session(session_dir, store=None):
+    """
+    Restore a session's results as (matrix, info, source). Tries the binary checkpoint first
+    (only if it is as current as the store), then the SQLite store, then a streaming parse of results.csv.
+    """
+    n_store = store.count() if store is not None else None
+    ck = read_checkpoint(session_dir)
+    if ck is not None and (n_store is None or len(ck[0]) == n_store):
+        return ck[0], ck[1], "checkpoint"
+    if n_store:
+        return matrix_from_records(store.records()), {}, "store"
+    csv_path = os.path.join(session_dir, CSV_NAME)
+    if os.path.exists(csv_path):
+        return matrix_from_records(read_results_csv(csv_path)), {}, "csv"
+    return AnswerMatrix(), {}, "empty"
+
+
+def _store_rows(path):
+    """Row count of a session store, read-only (0 when absent or unreadable)."""
+    if not os.path.exists(path):
+        return 0
+    try:
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            return conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return 0
+
+
+def _csv_has_rows(path):
+    try:
+        with open(path, "r", encoding="utf-8", newline="") as f:
+            return any(line.strip() for i, line in enumerate(f) if i)   # something past the header
+    except OSError:
+        return False
+
+
+def has_session_data(session_dir):
+    """True when a session folder holds at least one result (checkpoint, store rows or CSV data rows)."""
+    # A checkpoint is only written for a non-empty matrix; an opened store or a header-only CSV may be empty
+    return (os.path.exists(os.path.join(session_dir, CHECKPOINT_NAME))
+            or _store_rows(os.path.join(session_dir, STORE_NAME)) > 0
+            or _csv_has_rows(os.path.join(session_dir, CSV_NAME)))
+
+
+def latest_session_dir(root, exclude=None):
+    """Most recently modified session folder under `root` that holds results (other than `exclude`), or None."""
+    best, best_t = None, -1.0
+    if not os.path.isdir(root):
+        return None
+    skip = os.path.abspath(exclude) if exclude else None
+    for entry in os.scandir(root):
+        if not entry.is_dir() or os.path.abspath(entry.path) == skip:
+            continue
+        if has_session_data(entry.path):
+            t = max(os.path.getmtime(os.path.join(entry.path, n))
+                    for n in (CHECKPOINT_NAME, STORE_NAME, CSV_NAME) if os.path.exists(os.path.join(entry.path, n)))
+            if t > best_t:
+                best, best_t = entry.path, t
+    return best
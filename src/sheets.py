@@ -0,0 +1,87 @@
+# sheets.py
+# Compact per-sheet records (warped grayscale + JSON sidecar) and on-demand annotated rendering.
+
+import os, json, hashlib
+import cv2
+from config import SHEET_IMAGE_EXT, SHEET_IMAGE_QUALITY
+from omr import annotate
+
+
+def key_version(key):
+    """Short stable fingerprint of an answer key dict {item: choice}."""
+    blob = ",".join(f"{q}:{a}" for q, a in sorted((key or {}).items()))
+    return hashlib.sha1(blob.encode("ascii")).hexdigest()[:10]
+
+
+def _image_params(ext):
+    q = int(SHEET_IMAGE_QUALITY)
+    if ext == ".webp":
+        return [cv2.IMWRITE_WEBP_QUALITY, q]
+    if ext in (".jpg", ".jpeg"):
+        return [cv2.IMWRITE_JPEG_QUALITY, q]
+    return []
+
+
+def unique_base(session_dir, stem):
+    """`stem`, or `stem_2`, `stem_3`... when a sheet sidecar of that name already exists in the session."""
+    base, n = stem, 1
+    while os.path.exists(os.path.join(session_dir, f"{base}.json")):
+        n += 1
+        base = f"{stem}_{n}"
+    return base
+
+
+def save_sheet(session_dir, base, warped_gray, meta):
+    """Write <base><ext> (grayscale page) and <base>.json (answers, centers, key...). Returns image path."""
+    ext = SHEET_IMAGE_EXT.lower()
+    img_path = os.path.join(session_dir, f"{base}{ext}")
+    if not cv2.imwrite(img_path, warped_gray, _image_params(ext)):
+        raise IOError(f"Could not write sheet image: {img_path}")
+    rec = dict(meta, image=os.path.basename(img_path))
+    with open(os.path.join(session_dir, f"{base}.json"), "w", encoding="utf-8") as f:
+        json.dump(rec, f, separators=(",", ":"))
+    return img_path
+
+
+def load_sheet_meta(session_dir, base):
+    with open(os.path.join(session_dir, f"{base}.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    # JSON turns tuples into lists and int keys into strings; restore what annotate expects
+    meta["centers"] = [[tuple(p) for p in row] for row in meta.get("centers", [])]
+    meta["id_cols"] = [(int(b), [tuple(p) for p in col]) for b, col in meta.get("id_cols", [])]
+    meta["key"] = {int(q): int(a) for q, a in (meta.get("key") or {}).items()}
+    return meta
+
+
+def update_sheet_meta(session_dir, base, **fields):
+    """Rewrite selected fields of a sheet's JSON sidecar (atomic replace)."""
+    path = os.path.join(session_dir, f"{base}.json")
+    with open(path, "r", encoding="utf-8") as f:
+        rec = json.load(f)
+    rec.update(fields)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(rec, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def load_sheet_gray(session_dir, meta):
+    g = cv2.imread(os.path.join(session_dir, meta["image"]), cv2.IMREAD_GRAYSCALE)
+    if g is None:
+        raise IOError(f"Missing sheet image: {meta['image']}")
+    return g
+
+
+def render_sheet(session_dir, base, key=None, scale=1.0):
+    """Rebuild the annotated BGR view of a stored sheet (optionally against a different key)."""
+    meta = load_sheet_meta(session_dir, base)
+    bgr = cv2.cvtColor(load_sheet_gray(session_dir, meta), cv2.COLOR_GRAY2BGR)
+    return annotate(bgr, meta["centers"], meta["r"], meta["answers"],
+                    key=meta["key"] if key is None else key,
+                    mark_blanks=meta.get("mark_blanks", True),
+                    id_cols=meta["id_cols"], r_id=meta.get("r_id"),
+                    limit_items=meta.get("limit_items"), scale=scale, item_offset=meta.get("item_offset", 0))
+
+
+def save_annotated_png(path, bgr):
+    """Fast, low-compression PNG write for when a full annotated image is really wanted."""
+    return cv2.imwrite(path, bgr, [cv2.IMWRITE_PNG_COMPRESSION, 1])
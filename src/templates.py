@@ -0,0 +1,131 @@
+# templates.py
+# Registry of answer-sheet layouts and cheap identification of which one is under the camera.
+#
+# The built-in "std50" template is the CALIB layout from config.py. More layouts are loaded from
+# TEMPLATE_DIR/*.json, e.g.:
+#   {"name": "std100", "warp_w": 1200, "warp_h": 1900, "pad": 80, "rows_per_roi": 10,
+#    "rois_answers": [[y1, y2, x1, x2], ...], "roi_id": [y1, y2, x1, x2],
+#    "config": {...CALIB config overrides...},
+#    "code": {"roi": [y1, y2, x1, x2], "bits": 3, "value": 5},
+#    "page": 2, "pages": 2, "item_offset": 50,
+#    "key_set": {"roi": [y1, y2, x1, x2], "names": ["A", "B", "C"]}}
+# Templates are told apart by the marker-quad aspect ratio; layouts that share an aspect ratio
+# need a printed code strip (`bits` cells left to right, filled = 1, LSB first).
+# Multi-page exams use one template per page: `page` of `pages`, whose first item is item_offset + 1.
+# `key_set` is an optional single row of bubbles the student fills to say which exam version they have.
+
+import os, json, glob, math
+import cv2, numpy as np
+from config import CALIB, WARP_W, WARP_H, PAD, ROWS_PER_COL, TEMPLATE_DIR, TEMPLATE_ASPECT_TOL
+
+
+class SheetTemplate:
+    """One sheet layout with its geometry precomputed (warp target, aspect ratio, code cell centers)."""
+    def __init__(self, name, rois_answers, roi_id, warp_w=WARP_W, warp_h=WARP_H, pad=PAD,
+                 rows_per_roi=ROWS_PER_COL, config=None, code=None, page=1, pages=1, item_offset=0, key_set=None):
+        self.name = name
+        self.rois_answers = [list(map(float, b)) for b in rois_answers]
+        self.roi_id = list(map(float, roi_id))
+        self.warp_w, self.warp_h, self.pad = int(warp_w), int(warp_h), int(pad)
+        self.rows_per_roi = int(rows_per_roi)
+        self.n_items = len(self.rois_answers) * self.rows_per_roi
+        self.page, self.pages, self.item_offset = int(page), int(pages), int(item_offset)
+        self.cfg = dict(CALIB["config"], **(config or {}))
+        self.code = code
+        self.key_set = key_set
+        self.aspect = (self.warp_w - 2*self.pad) / float(self.warp_h - 2*self.pad)
+        self.warp_dst = np.array([[pad, pad], [warp_w-pad, pad], [warp_w-pad, warp_h-pad], [pad, warp_h-pad]],
+                                 np.float32)
+        self.code_cells = None
+        if code:
+            y1, y2, x1, x2 = code["roi"]
+            n = int(code["bits"])
+            xs = (x1 + (np.arange(n) + 0.5) * (x2 - x1) / n) * warp_w
+            self.code_cells = np.stack([xs, np.full(n, 0.5*(y1 + y2)*warp_h)], 1).astype(np.float32)
+            self.code_win = max(3, int(0.3 * min((x2 - x1) * warp_w / n, (y2 - y1) * warp_h)))
+
+    def __repr__(self):
+        page = f", page {self.page}/{self.pages}" if self.pages > 1 else ""
+        return f"SheetTemplate({self.name!r}, {self.n_items} items{page})"
+
+
+TEMPLATES = {}
+DEFAULT_TEMPLATE = "std50"
+
+
+def register(t):
+    TEMPLATES[t.name] = t
+    return t
+
+
+def get_template(name=None):
+    return TEMPLATES.get(name or DEFAULT_TEMPLATE) or TEMPLATES[DEFAULT_TEMPLATE]
+
+
+def load_templates(folder=TEMPLATE_DIR):
+    """Register every *.json layout in `folder`; returns the names loaded (bad files are skipped)."""
+    loaded = []
+    for path in sorted(glob.glob(os.path.join(folder, "*.json"))):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                d = json.load(f)
+            d.setdefault("name", os.path.splitext(os.path.basename(path))[0])
+            loaded.append(register(SheetTemplate(**d)).name)
+        except Exception as e:
+            print(f"[OMR] template {os.path.basename(path)} skipped: {e}")
+    return loaded
+
+
+def max_items():
+    """Largest exam length the loaded templates can cover (pages included)."""
+    return max(t.item_offset + t.n_items for t in TEMPLATES.values())
+
+
+def quad_aspect(corners):
+    """Width/height of the marker quad (mean of opposite sides; TL, TR, BR, BL order)."""
+    TL, TR, BR, BL = np.asarray(corners, np.float32).reshape(4, 2)
+    w = 0.5 * (np.linalg.norm(TR - TL) + np.linalg.norm(BR - BL))
+    h = 0.5 * (np.linalg.norm(BL - TL) + np.linalg.norm(BR - TR))
+    return float(w / max(1e-6, h))
+
+
+def read_code(t, gray, corners):
+    """Decode t's code strip straight from the camera frame (no warp): mean of a small window per cell."""
+    H = cv2.getPerspectiveTransform(t.warp_dst, np.asarray(corners, np.float32).reshape(4, 2))
+    pts = cv2.perspectiveTransform(t.code_cells[None], H)[0]
+    h, w = gray.shape[:2]
+    k = max(1, t.code_win // 2)
+    means = []
+    for x, y in pts:
+        x, y = int(round(x)), int(round(y))
+        patch = gray[max(0, y-k):min(h, y+k+1), max(0, x-k):min(w, x+k+1)]
+        means.append(float(patch.mean()) if patch.size else 255.0)
+    means = np.array(means)
+    lo, hi = means.min(), means.max()
+    dark = means < (0.5*(lo + hi) if hi - lo > 40 else 128)
+    return int(sum(1 << i for i, d in enumerate(dark) if d))
+
+
+def identify(corners, gray=None):
+    """
+    Template for a detected marker quad: nearest aspect ratio within TEMPLATE_ASPECT_TOL (log scale),
+    disambiguated by the code strip when several layouts share it. Falls back to the default template.
+    """
+    if len(TEMPLATES) == 1:
+        return get_template()
+    a = quad_aspect(corners)
+    near = sorted((abs(math.log(a / t.aspect)), t.name) for t in TEMPLATES.values())
+    cands = [TEMPLATES[n] for d, n in near if d <= TEMPLATE_ASPECT_TOL]
+    if not cands:
+        return get_template()
+    if len(cands) > 1 and gray is not None:
+        for t in cands:
+            if t.code and read_code(t, gray, corners) == int(t.code["value"]):
+                return t
+        uncoded = [t for t in cands if not t.code]
+        if uncoded:
+            return uncoded[0]
+    return cands[0]
+
+
+register(SheetTemplate(DEFAULT_TEMPLATE, CALIB["rois_answers"], CALIB["roi_id"]))
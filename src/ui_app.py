@@ -1,21 +1,38 @@
 # ui_app.py
 # The main Tkinter application class, importing pure logic from other modules.
 
-import os, re, math, platform, csv
+import os, re, platform, time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-import statistics as stats
 
 import cv2, numpy as np
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from PIL import Image, ImageTk
 
-from config import OUTPUT_ROOT, LETTERS, CFG
-from files_io import parse_answer_key, parse_class_section, ensure_outdir
-from ui_widgets import ScrollableToolbar, ScrollableFrame
-from omr import warp_page, find_markers, detect_answers, detect_student_id, annotate, grade
+from config import (OUTPUT_ROOT, CFG, LETTERS, SAVE_ANNOTATED_PNG, CHECKPOINT_EVERY, QUALITY_DEFER_SECONDS, FUSION,
+                    QUALITY, AUTO_CONFIRM)
+from files_io import parse_answer_key_sets, canonical_key, ensure_outdir
+from ui_widgets import ScrollableToolbar, ScrollableFrame, WindowedTreeview, TrendChart
+from session_store import SessionStore, load_session, write_checkpoint, latest_session_dir
+from analysis import AnswerMatrix, RunningStats, ItemAnalysis, KeyMatrix, key_vector
+from jobs import BackgroundJob, Cancelled, poll_job
+from exporter import export_results, export_statistics, have_xlsx
+from analytics_index import AnalyticsIndex
+from redetect import redetect_session, diff_redetection, apply_redetection
+from templates import load_templates, identify, max_items
+from sheets import save_sheet, unique_base, render_sheet, save_annotated_png, key_version, load_sheet_meta, update_sheet_meta
+from pages import PageStitcher
+from roster import RosterIndex, id_columns, load_roster
+from dedup import DedupIndex, QUEUED_REF, sheet_hash, hash_hex, hash_from_hex
+from omr import (warp_page, find_markers, find_marker_groups, annotate, grade, display_scale,
+                 BufferPool, frame_quality, quality_problems, ScoreFusion, score_answers, score_student_id,
+                 decode_student_id, detect_key_set, decide_rows, sheet_confidence)
 
 class OMRApp:
+    ITEM_COLUMNS = ("Item", "Key", "% Correct", "Correct (n)", "Discrimination", "Point-biserial") \
+        + tuple(LETTERS) + ("Blank",)
+
     def __init__(self, root):
         self.root = root
         self.root.title("OMR Scanner — 50 items + Student ID (touch-friendly)")
@@ -40,15 +57,25 @@ class OMRApp:
         self.session_date = datetime.now().strftime("%Y-%m-%d")
         self.exam_name = None
         self.key_path = None
-        self.key = {}
+        self.key = {}                  # canonical-order key (statistics, stored answers)
+        self.keys = KeyMatrix.single({})   # every exam version (set A/B/C...) in printed order
         self.section_name = None
-        self.id_to_name = {}
+        self.section_path = None
+        self.roster = RosterIndex()    # class list: ID -> name/exam set lookups and misread-ID correction
         ensure_outdir(OUTPUT_ROOT)
         self.session_dir = None
+        self.store = None              # SessionStore of the current session_dir
+        self.stitcher = None           # PageStitcher joining multi-page exams per student ID
+        self.dedup = DedupIndex()      # perceptual hashes of this session's saved sheets
+        self.pending = None            # sheet on screen awaiting Confirm/Retry
+        self._fusion = None            # active ScoreFusion while a multi-frame scan accumulates
+        self._scan_queue = []          # further sheets from a multi-sheet capture, reviewed one by one
+        self.review_queue = []         # auto-confirm mode: low-confidence sheets awaiting a human decision
+        self._queued_seq = 0           # numbers the dedup refs of queued sheets
         self._refresh_session_dir()
 
         # Variables
-        self.max_items_var = tk.StringVar(value="50")  # 1..50
+        self.max_items_var = tk.StringVar(value="50")  # 1..max_items() of the loaded templates
         self.detect_every_n = 5  # frames
         self.detect_var = tk.IntVar(value=self.detect_every_n)
 
@@ -57,10 +84,21 @@ class OMRApp:
         self.preview_running = False
         self.last_frame_bgr = None
         self.last_corners = None
+        self.last_quality = None       # frame_quality() of the last detected marker region
+        self._scan_deferred_until = None
+        self._fusion_corners = None
+        self._fusion_tpl = None
+        self._fusion_hash = None       # perceptual hash of the sheet being fused (duplicate check)
         self.preview_frame_count = 0
+        self.templates_loaded = load_templates()   # extra layouts from TEMPLATE_DIR (std50 is built in)
 
-        self.pending = None
-        self.results = []
+        self.pool = BufferPool()   # reused warp/gray/annotation/preview arrays
+
+        self._job = None               # running BackgroundJob (exports, batch tasks)
+        self.matrix = AnswerMatrix()   # confirmed sheets: int8 answers + scores + per-row meta
+        self.stats = RunningStats()    # updated per confirm; rebuilt only when the key changes
+        self.item_stats = ItemAnalysis()
+        self._kv = None                # cached key vector for self.key
 
         # Build UI
         self._build_appbar()      # top app bar (scrollable)
@@ -72,7 +110,9 @@ class OMRApp:
         self._apply_responsive_scaling()
         self.root.bind('<Configure>', self._on_root_configure)
 
-        self.log("💡 Tip: Load an answer key and a class section, pick item count, then scan.")
+        self.log("💡 Tip: Load an answer key and a class section, pick item count, then scan."
+                 + (f" • Templates: std50, {', '.join(self.templates_loaded)}" if self.templates_loaded else ""))
+        self.root.after(300, self._offer_resume)
 
     # ---------- Responsive scaling ----------
     def _base_size(self):
@@ -181,7 +221,7 @@ class OMRApp:
             n = int(self.max_items_var.get())
         except Exception:
             n = 50
-        return min(50, max(1, n))
+        return min(max_items(), max(1, n))
 
     def _make_safe(self, s: str) -> str:
         s = (s or "").strip()
@@ -210,7 +250,14 @@ class OMRApp:
                 return
         session_path = self._unique_dir(base)
         ensure_outdir(session_path)
+        self._drop_unsaved()
+        self._close_store()
         self.session_dir = session_path
+        self.store = SessionStore(self.session_dir)
+        self.stitcher = PageStitcher(self.session_dir)
+        self.dedup = DedupIndex()
+        if getattr(self, 'matrix', None) is not None and len(self.matrix):
+            self._reset_results()  # results belong to the folder they were confirmed in
         try:
             readme = os.path.join(self.session_dir, "_session_info.txt")
             with open(readme, "w", encoding="utf-8") as f:
@@ -218,6 +265,115 @@ class OMRApp:
                 f.write(f"Session created: {ts}\nExam: {exam}\nSection: {section}\nDate tag: {self.session_date}\n")
         except Exception:
             pass
+
+    def _close_store(self):
+        """Checkpoint, export results.csv from the current store (if it has rows) and close it."""
+        if not self.store:
+            return
+        self._write_checkpoint()
+        try:
+            if self.store.count():
+                self.store.export_csv()
+        except Exception as e:
+            print(f"[OMR] results.csv export failed: {e}")
+        self.store.close()
+        self.store = None
+
+    def _session_info(self):
+        return {'exam': self.exam_name, 'section': self.section_name, 'session_date': self.session_date,
+                'key': sorted(self.key.items()), 'key_path': self.key_path, 'section_path': self.section_path}
+
+    def _write_checkpoint(self):
+        if self.session_dir and getattr(self, 'matrix', None) is not None and len(self.matrix):
+            try:
+                write_checkpoint(self.session_dir, self.matrix, self._session_info())
+            except Exception as e:
+                print(f"[OMR] checkpoint failed: {e}")
+
+    def _reset_results(self, matrix=None):
+        """Swap in a new result set (empty by default) and rebuild statistics and tables from it."""
+        self.matrix = matrix if matrix is not None else AnswerMatrix()
+        self._rebuild_stats()
+        if hasattr(self, 'tree_scores'):
+            self.tree_scores.clear()
+            self.refresh_scores()
+            self.refresh_stats()
+
+    # ---------- Resume ----------
+    def _offer_resume(self):
+        # The startup session folder already exists (empty) by now, so it is excluded by name
+        path = latest_session_dir(OUTPUT_ROOT, exclude=self.session_dir)
+        if not path:
+            return
+        if (messagebox.askyesno("Resume Session", f"Resume the most recent session?\n\n{os.path.basename(path)}")
+                and self._ok_to_drop_unsaved("Resume Session")):
+            self._resume_session(path)
+
+    def on_resume(self):
+        path = filedialog.askdirectory(title="Resume session folder", initialdir=OUTPUT_ROOT)
+        if path and self._ok_to_drop_unsaved("Resume Session"):
+            self._resume_session(path)
+
+    def _resume_session(self, path):
+        """Restore results, statistics and the duplicate-ID index of a session folder."""
+        t0 = time.perf_counter()
+        self._drop_unsaved()
+        self._close_store()
+        store = SessionStore(path)
+        matrix, info, source = load_session(path, store)
+        if source == "csv":
+            # Rebuild the indexed store so duplicate checks work again
+            store.add_many(dict(m, answers=matrix.row_answers(i)) for i, m in enumerate(matrix.meta))
+        self.session_dir, self.store = path, store
+        self.stitcher = PageStitcher(path)
+        self.dedup = self._load_dedup(path, matrix)
+
+        last = matrix.meta[-1] if len(matrix) else {}
+        self.exam_name = info.get('exam') or last.get('exam') or self.exam_name
+        self.section_name = info.get('section') or last.get('section') or self.section_name
+        m = re.search(r"(\d{4}-\d{2}-\d{2})(?: \(\d+\))?$", os.path.basename(path))
+        self.session_date = info.get('session_date') or (m.group(1) if m else self.session_date)
+        key = {int(q): int(a) for q, a in info.get('key') or []}
+        if not key and last:
+            try:
+                key = load_sheet_meta(path, last['filename'])['key']
+            except Exception:
+                key = {}
+        if key:
+            self.key, self.key_path = key, info.get('key_path') or self.key_path
+            self.max_items_var.set(str(min(max_items(), max(key))))
+            try:
+                sets = parse_answer_key_sets(self.key_path)[1] if self.key_path and os.path.exists(self.key_path) else {}
+            except ValueError:
+                sets = {}   # key file edited since; grade with the stored key alone
+            self.keys = KeyMatrix(sets) if canonical_key(sets) == key else KeyMatrix.single(key)
+        section_path = info.get('section_path')
+        if section_path and os.path.exists(section_path):
+            self.section_path = section_path
+            self.roster, _ = load_roster(section_path)
+        self.lbl_exam.config(text=f"Exam: {self.exam_name or '—'}")
+        self.lbl_section.config(text=f"Section: {self.section_name or '—'}")
+
+        self._reset_results(matrix)
+        ms = 1000 * (time.perf_counter() - t0)
+        hint = "" if len(self.roster) else " • Load the class section to keep scanning"
+        self.log(f"Resumed {len(matrix)} sheet(s) from {source} in {ms:.0f} ms • {path}{hint}")
+
+    def _load_dedup(self, path, matrix):
+        """Duplicate index of a resumed session, from the hashes kept in the sheet sidecars."""
+        index = DedupIndex()
+        for m in matrix.meta:
+            try:
+                first = load_sheet_meta(path, m['filename'])
+                for base in first.get('pages_bases') or [m['filename']]:
+                    meta = first if base == m['filename'] else load_sheet_meta(path, base)
+                    if meta.get('phash'):
+                        index.add(meta.get('template'), hash_from_hex(meta['phash'], meta['phash_bits']),
+                                  (base, meta.get('student_id', '')))
+            except Exception:
+                continue
+        return index
+
 ####################
     # ---------- Top App Bar ----------
     def _build_appbar(self):
@@ -234,6 +390,10 @@ class OMRApp:
         ttk.Button(row1, text="📄 Answer Key", style='Primary.TButton', command=self.on_load_key)\
             .pack(side=tk.LEFT, padx=(0,8))
         ttk.Button(row1, text="👥 Class Section", style='Primary.TButton', command=self.on_load_section)\
+            .pack(side=tk.LEFT, padx=(0,8))
+        ttk.Button(row1, text="⏏ Resume", style='Primary.TButton', command=self.on_resume)\
+            .pack(side=tk.LEFT, padx=(0,8))
+        ttk.Button(row1, text="♻ Re-grade", style='Primary.TButton', command=self.on_regrade)\
             .pack(side=tk.LEFT)
 
         info = ttk.Frame(files_grp, style='Modern.TFrame'); info.pack(side=tk.TOP, anchor='w', pady=(6,0))
@@ -245,11 +405,11 @@ class OMRApp:
         ttk.Label(items_grp, text="📝 Items", style='Title.TLabel').pack(side=tk.TOP, anchor='w')
         row_items = ttk.Frame(items_grp, style='Modern.TFrame'); row_items.pack(side=tk.TOP)
         self.combo_max = ttk.Combobox(
-            row_items, values=[str(i) for i in range(1, 51)],
+            row_items, values=[str(i) for i in range(1, max_items() + 1)],
             textvariable=self.max_items_var, state="readonly", justify="center", width=6
         )
         self.combo_max.pack(side=tk.LEFT)
-        ttk.Label(row_items, text=" (1–50)", style='Status.TLabel').pack(side=tk.LEFT, padx=(6,0))
+        ttk.Label(row_items, text=f" (1–{max_items()})", style='Status.TLabel').pack(side=tk.LEFT, padx=(6,0))
 
         # CAMERA GROUP
         cam_grp = ttk.Frame(bar, style='Modern.TFrame'); cam_grp.pack(side=tk.LEFT, padx=16, pady=8)
@@ -278,6 +438,15 @@ class OMRApp:
         self.btn_confirm = ttk.Button(scan_row, text="✅ Confirm", style='Primary.TButton',
                                       command=self.on_confirm, state=tk.DISABLED)
         self.btn_confirm.pack(side=tk.LEFT)
+        self.fusion_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(scan_row, text="Multi-frame", variable=self.fusion_var).pack(side=tk.LEFT, padx=(12,0))
+        self.multi_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(scan_row, text="Multi-sheet", variable=self.multi_var).pack(side=tk.LEFT, padx=(12,0))
+        self.auto_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(scan_row, text="Auto-confirm", variable=self.auto_var).pack(side=tk.LEFT, padx=(12,0))
+        self.btn_review = ttk.Button(scan_row, text="🗂 Review (0)", style='Primary.TButton',
+                                     command=self.on_review, state=tk.DISABLED)
+        self.btn_review.pack(side=tk.LEFT, padx=(8,0))
 
         # PERF GROUP (corner detect frequency)
         perf_grp = ttk.Frame(bar, style='Modern.TFrame'); perf_grp.pack(side=tk.LEFT, padx=16, pady=8)
@@ -289,6 +458,9 @@ class OMRApp:
                                        command=self._on_detect_change)
         self.spin_detect.pack(side=tk.LEFT)
         ttk.Label(perf_row, text="frames", style='Status.TLabel').pack(side=tk.LEFT, padx=(6,0))
+        self.quality_gate_var = tk.BooleanVar(value=True)
+        ttk.Checkbutton(perf_row, text="Quality gate", variable=self.quality_gate_var)\
+            .pack(side=tk.LEFT, padx=(12,0))
 
         # EXPORT GROUP
         exp_grp = ttk.Frame(bar, style='Modern.TFrame'); exp_grp.pack(side=tk.LEFT, padx=16, pady=8)
@@ -296,6 +468,10 @@ class OMRApp:
         ttk.Button(exp_grp, text="📊 Results", style='Primary.TButton', command=self.on_export)\
             .pack(side=tk.LEFT, padx=(0,8))
         ttk.Button(exp_grp, text="📈 Statistics", style='Primary.TButton', command=self.on_export_stats)\
+            .pack(side=tk.LEFT, padx=(0,8))
+        ttk.Button(exp_grp, text="🖼 Sheets", style='Primary.TButton', command=self.on_export_sheets)\
+            .pack(side=tk.LEFT, padx=(0,8))
+        ttk.Button(exp_grp, text="📚 History", style='Primary.TButton', command=self.on_history)\
             .pack(side=tk.LEFT)
 
         # LIVE STATUS (compact)
@@ -331,6 +507,8 @@ class OMRApp:
         status = ttk.Frame(tab_scan, style='Modern.TFrame', padding=(12, 10)); status.pack(side=tk.TOP, fill=tk.X)
         self.corner_status = tk.StringVar(value="🔴 Corners: Not detected")
         ttk.Label(status, textvariable=self.corner_status, style='Status.TLabel').pack(side=tk.LEFT)
+        self.quality_status = tk.StringVar(value="")
+        ttk.Label(status, textvariable=self.quality_status, style='Status.TLabel').pack(side=tk.LEFT, padx=(16,0))
 
         # PanedWindow: left preview | right annotated (user-resizable)
         paned = ttk.Panedwindow(tab_scan, orient=tk.HORIZONTAL)
@@ -369,6 +547,8 @@ class OMRApp:
 
         top = ttk.Frame(scores_root, style='Modern.TFrame', padding=(12, 10)); top.pack(side=tk.TOP, fill=tk.X)
         ttk.Button(top, text="🔄 Refresh", style='Primary.TButton', command=self.refresh_scores).pack(side=tk.LEFT)
+        ttk.Button(top, text="🔁 Re-detect", style='Primary.TButton', command=self.on_redetect)\
+            .pack(side=tk.LEFT, padx=(8, 0))
         hist = ttk.Frame(top, style='Modern.TFrame'); hist.pack(side=tk.LEFT, padx=16)
         ttk.Label(hist, text="SCANNED", style='Status.TLabel').pack(anchor='w')
         self.lbl_count = ttk.Label(hist, text="0", style='Title.TLabel'); self.lbl_count.pack(anchor='w')
@@ -382,11 +562,13 @@ class OMRApp:
         self.lbl_highest_names = ttk.Label(high, text="", style='Status.TLabel'); self.lbl_highest_names.pack(anchor='w')
 
         cols = ("#", "Student Name", "Student ID", "Score", "Max")
-        self.tree_scores = ttk.Treeview(scores_root, columns=cols, show="headings", height=14, style='Modern.Treeview')
+        self.tree_scores = WindowedTreeview(scores_root, columns=cols, height=14)
         for c, w in zip(cols, (60, 360, 180, 140, 100)):
             self.tree_scores.heading(c, text=c)
             self.tree_scores.column(c, width=w, anchor=tk.CENTER if c in ("#","Student ID","Score","Max") else tk.W)
         self.tree_scores.pack(fill=tk.BOTH, expand=True, padx=12, pady=12)
+        self.tree_scores.tree.bind("<Double-1>", self.on_view_sheet)
+        self._tab_scan = tab_scan
 
         
         # --- Tab: Statistics ---
@@ -407,9 +589,12 @@ class OMRApp:
         median_frame = ttk.Frame(stats_frame, style='Modern.TFrame'); median_frame.pack(side=tk.LEFT, padx=(0, 24))
         ttk.Label(median_frame, text="MEDIAN", style='Status.TLabel').pack(anchor='w')
         self.stat_median = tk.StringVar(value="—"); ttk.Label(median_frame, textvariable=self.stat_median, style='Title.TLabel').pack(anchor='w')
-        mode_frame = ttk.Frame(stats_frame, style='Modern.TFrame'); mode_frame.pack(side=tk.LEFT)
+        mode_frame = ttk.Frame(stats_frame, style='Modern.TFrame'); mode_frame.pack(side=tk.LEFT, padx=(0, 24))
         ttk.Label(mode_frame, text="MODE", style='Status.TLabel').pack(anchor='w')
         self.stat_mode = tk.StringVar(value="—"); ttk.Label(mode_frame, textvariable=self.stat_mode, style='Title.TLabel').pack(anchor='w')
+        kr20_frame = ttk.Frame(stats_frame, style='Modern.TFrame'); kr20_frame.pack(side=tk.LEFT)
+        ttk.Label(kr20_frame, text="KR-20", style='Status.TLabel').pack(anchor='w')
+        self.stat_kr20 = tk.StringVar(value="—"); ttk.Label(kr20_frame, textvariable=self.stat_kr20, style='Title.TLabel').pack(anchor='w')
 
         trend_frame = ttk.Labelframe(stats_root, text="📈 Score Trend (Scan Order)", style='Modern.TLabelframe', padding=12)
         trend_frame.pack(side=tk.TOP, fill=tk.X, padx=12, pady=6)
@@ -417,15 +602,16 @@ class OMRApp:
         self.trend_canvas = tk.Canvas(trend_frame, height=260, bg="#0F0E47", highlightthickness=0, relief='flat')
         #########
         self.trend_canvas.pack(fill=tk.X, padx=6, pady=6)
+        self.trend_chart = TrendChart(self.trend_canvas)
         self.trend_canvas.bind("<Configure>", lambda e: self._redraw_trend_only())
 
-        item_frame = ttk.Labelframe(stats_root, text="🔍 Item Analysis (% Correct)", style='Modern.TLabelframe', padding=12)
+        item_frame = ttk.Labelframe(stats_root, text="🔍 Item Analysis (difficulty, discrimination, choices)",
+                                    style='Modern.TLabelframe', padding=12)
         item_frame.pack(side=tk.TOP, fill=tk.BOTH, expand=True, padx=12, pady=(6, 12))
-        self.tree_items = ttk.Treeview(item_frame, columns=("Item", "% Correct", "Correct (n)"),
-                                       show="headings", height=12, style='Modern.Treeview')
-        for col, w, anchor in (("Item", 120, tk.CENTER), ("% Correct", 180, tk.CENTER), ("Correct (n)", 180, tk.CENTER)):
+        self.tree_items = WindowedTreeview(item_frame, columns=self.ITEM_COLUMNS, height=12)
+        for col in self.ITEM_COLUMNS:
             self.tree_items.heading(col, text=col)
-            self.tree_items.column(col, width=w, anchor=anchor)
+            self.tree_items.column(col, width=70 if len(col) <= 5 else 120, anchor=tk.CENTER)
         self.tree_items.pack(fill=tk.BOTH, expand=True, padx=6, pady=6)
 
         # ---------- Bottom Status Bar ----------
@@ -436,6 +622,12 @@ class OMRApp:
         self.log_var = tk.StringVar(value="")
         ttk.Label(bar, textvariable=self.log_var, style='Status.TLabel').pack(side=tk.LEFT, padx=12, pady=6)
 
+        # Background task progress (shown only while a job runs)
+        self.job_frame = ttk.Frame(bar, style='Modern.TFrame')
+        self.job_progress = ttk.Progressbar(self.job_frame, length=220, mode='determinate', maximum=100)
+        self.job_progress.pack(side=tk.LEFT, padx=(0,8))
+        ttk.Button(self.job_frame, text="✖ Cancel", style='Danger.TButton', command=self.on_cancel_job).pack(side=tk.LEFT)
+
     # ---------- Camera ----------
     def _probe_cams(self):
         found = []
@@ -453,6 +645,8 @@ class OMRApp:
         if not self.cap or not self.cap.isOpened():
             messagebox.showerror("Camera", f"Cannot open camera index {idx}")
             self.cap = None; return
+        self.pool.ensure_camera(int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH) or 1280),
+                                int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT) or 720))
         self.preview_running = True
         self.btn_open.config(state=tk.DISABLED)
         self.btn_close.config(state=tk.NORMAL)
@@ -470,30 +664,82 @@ class OMRApp:
         self.btn_scan.config(state=tk.DISABLED)
         self.preview_label.config(image="", text="📹 Preview")
         self.corner_status.set("🔴 Corners: Not detected")
+        self.quality_status.set("")
         self.last_corners = None
+        self.last_quality = None
+        self._scan_deferred_until = None
+        self._fusion = None
         self.log("Camera closed.")
 
     def _loop_preview(self):
         if not self.preview_running or not self.cap:
             return
-        ok, frame = self.cap.read()
+        pool = self.pool
+        ok, frame = self.cap.read(pool.frame)
         if ok:
+            if frame is not pool.frame:
+                pool.ensure_for(frame)   # camera resolution changed; next read lands in the new buffer
             self.last_frame_bgr = frame
             self.preview_frame_count += 1
             # Adjustable detection frequency
             if self.preview_frame_count % max(1, int(self.detect_every_n)) == 0:
                 try:
-                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                    corners = find_markers(gray)
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY,
+                                        dst=pool.frame_gray if frame is pool.frame else None)
+                    corners = find_markers(gray, blur=pool.frame_blur, th=pool.frame_th)
                     self.last_corners = corners
                     self.corner_status.set("🟢 Corners: Detected ✓")
+                    self._update_quality(gray, corners)
                 except Exception:
                     self.last_corners = None
+                    self.last_quality = None
                     self.corner_status.set("🔴 Corners: Not detected")
-            disp = self._draw_corner_overlay(frame.copy(), self.last_corners)
+                    self.quality_status.set("")
+                self._poll_deferred_scan()
+            if self._fusion is not None:
+                self._fusion_step(frame)
+            if frame is pool.frame:
+                np.copyto(pool.preview, frame)
+                canvas = pool.preview
+            else:
+                canvas = frame.copy()
+            disp = self._draw_corner_overlay(canvas, self.last_corners)
             self._show_bgr_on_label(disp, self.preview_label)
         self.root.after(20, self._loop_preview)
 
+    def _update_quality(self, gray, corners):
+        q = frame_quality(gray, corners)
+        self.last_quality = q
+        bad = quality_problems(q)
+        self.quality_status.set(
+            f"{'🟢' if not bad else '🟠'} Sharp {q['sharpness']:.0f} • Light {q['brightness']:.0f}"
+            f" • Glare {100*q['glare']:.1f}% • Skew {q['side_ratio']:.2f}/{q['angle_dev']:.0f}°"
+            + (f" — {', '.join(bad)}" if bad else ""))
+
+    def _frame_blockers(self):
+        """Reasons the current preview frame should not be graded (empty when gate is off or frame is good)."""
+        if not self.quality_gate_var.get():
+            return []
+        if self.multi_var.get():
+            # The preview quad spans all sheets, so only the photometric checks apply
+            if self.last_quality is None:
+                return []
+            return quality_problems(self.last_quality, dict(QUALITY, max_side_ratio=float("inf"),
+                                                            max_angle_dev=180.0, min_coverage=0.0))
+        if self.last_corners is None or self.last_quality is None:
+            return ["markers not found"]
+        return quality_problems(self.last_quality)
+
+    def _poll_deferred_scan(self):
+        if self._scan_deferred_until is None:
+            return
+        if not self._frame_blockers():
+            self._scan_deferred_until = None
+            self.scan_current()
+        elif time.monotonic() > self._scan_deferred_until:
+            self._scan_deferred_until = None
+            self.log(f"Scan cancelled — frame never became usable ({', '.join(self._frame_blockers())}).")
+
     def _draw_corner_overlay(self, bgr, corners_np):
         h, w = bgr.shape[:2]
         have_corners = corners_np is not None and len(corners_np)==4
@@ -503,9 +749,12 @@ class OMRApp:
             x0, y0 = int(x0r*w), int(y0r*h)
             x1, y1 = int(x1r*w), int(y1r*h)
             cv2.rectangle(bgr, (x0,y0), (x1,y1), box_color, 2)
-            overlay = bgr.copy()
-            cv2.rectangle(overlay, (x0,y0), (x1,y1), box_color, -1)
-            bgr = cv2.addWeighted(overlay, 0.08, bgr, 0.92, 0)
+            # 8% tint, blended in place on the target patch only (pixels outside are unchanged)
+            roi = bgr[max(0,y0):y1+1, max(0,x0):x1+1]
+            if roi.size:
+                tint = self.pool.scratch(f"tint{box_color}", roi.shape)
+                tint[:] = box_color
+                cv2.addWeighted(tint, 0.08, roi, 0.92, 0, dst=roi)
         if have_corners:
             for (x,y) in corners_np.astype(int):
                 cv2.circle(bgr, (int(x),int(y)), 8, dot_color, -1)
@@ -513,15 +762,19 @@ class OMRApp:
             cv2.polylines(bgr, [np.array([tl,tr,br,bl,tl])], False, (0,255,0), 2)
         return bgr
 
+    def _label_box(self, widget):
+        return max(widget.winfo_width(), 480), max(widget.winfo_height(), 360)
+
     def _show_bgr_on_label(self, bgr, widget):
-        rgb = cv2.cvtColor(bgr, cv2.COLOR_BGR2RGB)
-        w = max(widget.winfo_width(), 480)
-        h = max(widget.winfo_height(), 360)
-        ih, iw = rgb.shape[:2]
+        w, h = self._label_box(widget)
+        ih, iw = bgr.shape[:2]
         scale = min(w/iw, h/ih)
         new_w, new_h = max(1,int(iw*scale)), max(1,int(ih*scale))
-        resized = cv2.resize(rgb, (new_w, new_h), interpolation=cv2.INTER_AREA)
-        im = Image.fromarray(resized)
+        # Resize first, then convert the (smaller) result in place; both land in a per-widget buffer
+        disp = self.pool.scratch(f"disp{widget}", (new_h, new_w, 3))
+        cv2.resize(bgr, (new_w, new_h), dst=disp, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(disp, cv2.COLOR_BGR2RGB, dst=disp)
+        im = Image.fromarray(disp)
         imgtk = ImageTk.PhotoImage(image=im)
         widget.imgtk = imgtk
         widget.configure(image=imgtk)
@@ -531,39 +784,171 @@ class OMRApp:
         path = filedialog.askopenfilename(title="Select answer key",
                                           filetypes=[("Text files","*.txt"),("All files","*.*")],
                                           initialdir=self.session_dir)
-        if not path:
+        if not path or not self._ok_to_drop_unsaved("Answer Key"):
             return
-        exam, key = parse_answer_key(path)
+        try:
+            exam, sets = parse_answer_key_sets(path)
+        except ValueError as e:
+            messagebox.showerror("Answer Key", str(e))
+            return
+        key = canonical_key(sets)
         if not exam or not key:
             messagebox.showwarning("Answer Key", "File parsed, but exam name or items look empty.")
         self.exam_name = exam or "(Unnamed Exam)"
         self.key_path = path
         self.key = key
+        self.keys = KeyMatrix(sets)
+        self._rebuild_stats()
         self.lbl_exam.config(text=f"Exam: {self.exam_name}")
         if key:
             try:
-                self.max_items_var.set(str(min(50, max(key.keys()))))
+                self.max_items_var.set(str(min(max_items(), max(key.keys()))))
                 if hasattr(self, "combo_max"):
                     self.combo_max.set(self.max_items_var.get())
             except ValueError:
                 pass
         self._refresh_session_dir()
-        self.log(f"Loaded answer key: {os.path.basename(path)} ({len(key)} items)\nSession: {self.session_dir}")
+        versions = f", sets {'/'.join(self.keys.names)}" if len(self.keys) > 1 else ""
+        self.log(f"Loaded answer key: {os.path.basename(path)} ({len(key)} items{versions})\nSession: {self.session_dir}")
+
+    def on_regrade(self):
+        """Re-score every confirmed sheet against a corrected key, from the stored answers (no rescanning)."""
+        if not len(self.matrix):
+            messagebox.showinfo("Re-grade", "No confirmed sheets to re-grade yet.")
+            return
+        path = filedialog.askopenfilename(title="Select corrected answer key",
+                                          filetypes=[("Text files","*.txt"),("All files","*.*")],
+                                          initialdir=os.path.dirname(self.key_path) if self.key_path else self.session_dir)
+        if not path:
+            return
+        try:
+            _, sets = parse_answer_key_sets(path)
+        except ValueError as e:
+            messagebox.showerror("Re-grade", str(e))
+            return
+        key = canonical_key(sets)
+        if not key:
+            messagebox.showwarning("Re-grade", "No answer items found in that key file.")
+            return
+        t0 = time.perf_counter()
+        keys = KeyMatrix(sets)
+        old = self.matrix.scores.copy()
+        if len(keys) > 1 or len(self.keys) > 1:
+            # Per-row version gather over the canonical answers
+            new = keys.grade(self.matrix.answers, keys.indices(m['key_set'] for m in self.matrix.meta),
+                             self.matrix.max_items)
+        else:
+            new = self.matrix.grade_all(key_vector(key, max(self.matrix.n_items, max(key))))
+        changed = np.flatnonzero(new != old)
+        ms = 1000 * (time.perf_counter() - t0)
+        if not messagebox.askyesno("Re-grade",
+                                   f"{len(changed)} of {len(old)} score(s) change with this key.\n\nApply the new key?"):
+            return
+
+        self.key, self.keys, self.key_path = key, keys, path
+        self.matrix.set_scores(changed, new[changed])
+        if self.store:
+            self.store.update_scores((self.matrix.meta[i]['filename'], self.matrix.meta[i]['student_id'], new[i])
+                                    for i in changed.tolist())
+            self.store.export_csv()
+        self._rebuild_stats()
+        self._write_checkpoint()
+        self.refresh_scores(changed=changed.tolist())
+        self.refresh_stats()
+
+        lines = [f"{m['student_name']} ({m['student_id'] or '—'}): {old[i]} → {new[i]}"
+                 for i, m in ((i, self.matrix.meta[i]) for i in changed.tolist())]
+        msg = f"Re-graded {len(old)} sheet(s) in {ms:.0f} ms; {len(changed)} score(s) changed."
+        if lines:
+            msg += "\n\n" + "\n".join(lines[:20]) + (f"\n… and {len(lines) - 20} more" if len(lines) > 20 else "")
+        self.log(f"Re-graded with {os.path.basename(path)}: {len(changed)} score(s) changed.")
+        messagebox.showinfo("Re-grade", msg)
+
+    def on_redetect(self):
+        """Re-run detection on every stored sheet (process pool, current config.py), then review the diff."""
+        if not len(self.matrix):
+            messagebox.showinfo("Re-detect", "No confirmed sheets in this session.")
+            return
+        session_dir, bases = self.session_dir, [m['filename'] for m in self.matrix.meta]
+        n_rows = len(self.matrix)
+
+        def _done(results):
+            if len(self.matrix) != n_rows or self.session_dir != session_dir:
+                messagebox.showwarning("Re-detect", "The session changed while re-detecting; run it again.")
+                return
+            failed = sum(1 for r in results.values() if not isinstance(r, dict))
+            changes = diff_redetection(self.matrix, results, self._key_vec(), self.roster, keys=self.keys)
+            self.log(f"Re-detect: {len(changes)} of {n_rows} sheet(s) changed"
+                     + (f", {failed} unreadable." if failed else "."))
+            if not changes:
+                messagebox.showinfo("Re-detect", "No decisions changed." + (f"\n\n{failed} sheet(s) could not be read." if failed else ""))
+                return
+            self._show_redetect_diff(changes)
+
+        self._start_job("Re-detect", lambda job: redetect_session(session_dir, bases, job), _done)
+
+    def _show_redetect_diff(self, changes):
+        win = tk.Toplevel(self.root)
+        win.title(f"Re-detect — {len(changes)} sheet(s) changed")
+        win.geometry("980x520")
+        cols = ("#", "Student", "ID", "Score", "Changed items")
+        frame = ttk.Frame(win); frame.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+        tree = ttk.Treeview(frame, columns=cols, show='headings', style='Modern.Treeview')
+        for c, w in zip(cols, (50, 220, 150, 90, 440)):
+            tree.heading(c, text=c); tree.column(c, width=w, anchor=tk.W if c == "Changed items" else tk.CENTER)
+        sb = ttk.Scrollbar(frame, orient='vertical', command=tree.yview)
+        tree.configure(yscrollcommand=sb.set)
+        tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True); sb.pack(side=tk.RIGHT, fill=tk.Y)
+        letter = lambda a: LETTERS[a] if a >= 0 else "-"
+        for c in changes:
+            ids = c['old_id'] if c['old_id'] == c['new_id'] else f"{c['old_id'] or '—'} → {c['new_id'] or '—'}"
+            if c['conflict']:
+                ids += " (ID clash, kept)"
+            items = ", ".join(f"Q{q} {letter(a)}→{letter(b)}" for q, a, b in c['items'])
+            tree.insert('', 'end', values=(c['row'] + 1, c['name'], ids, f"{c['old_score']} → {c['new_score']}", items))
+
+        def _apply():
+            win.destroy()
+            # Only the re-detected rows change: take them out of the statistics and put them back after
+            kv, rows = self._key_vec(), [c['row'] for c in changes]
+            for i in rows:
+                score = int(self.matrix.scores[i])
+                self.stats.remove(i, score)
+                self.item_stats.remove(self.matrix.row_answers(i), score, self.matrix.row_correct(i, kv))
+            apply_redetection(self.session_dir, self.matrix, self.store, changes)
+            if self.store:
+                self.store.export_csv()
+            for i in rows:
+                score = int(self.matrix.scores[i])
+                self.stats.add(i, score, self.matrix.meta[i]['student_name'])
+                self.item_stats.add(self.matrix.row_answers(i), score, self.matrix.row_correct(i, kv))
+            self._write_checkpoint()
+            self.refresh_scores(changed=[c['row'] for c in changes])
+            self.refresh_stats()
+            self.log(f"Re-detect: applied changes to {len(changes)} sheet(s).")
+
+        bar = ttk.Frame(win); bar.pack(fill=tk.X, padx=8, pady=(0, 8))
+        ttk.Button(bar, text="✅ Apply", style='Primary.TButton', command=_apply).pack(side=tk.RIGHT)
+        ttk.Button(bar, text="Discard", style='Danger.TButton', command=win.destroy).pack(side=tk.RIGHT, padx=8)
 
     def on_load_section(self):
         path = filedialog.askopenfilename(title="Select class section",
                                           filetypes=[("Text files","*.txt"),("All files","*.*")],
                                           initialdir=self.session_dir)
-        if not path:
+        if not path or not self._ok_to_drop_unsaved("Class Section"):
             return
-        section, id2name = parse_class_section(path)
-        if not section:
+        t0 = time.perf_counter()
+        roster, source = load_roster(path)
+        ms = 1000 * (time.perf_counter() - t0)
+        if not roster.section:
             messagebox.showwarning("Class Section", "Section name missing (first non-empty line).")
-        self.section_name = section or "(Unnamed Section)"
-        self.id_to_name = id2name
+        self.section_name = roster.section or "(Unnamed Section)"
+        self.section_path = path
+        self.roster = roster
         self.lbl_section.config(text=f"Section: {self.section_name}")
         self._refresh_session_dir()
-        self.log(f"Loaded section: {self.section_name} ({len(id2name)} students)\nSession: {self.session_dir}")
+        self.log(f"Loaded section: {self.section_name} ({len(roster)} students, {source} in {ms:.0f} ms)\n"
+                 f"Session: {self.session_dir}")
 
     # ---------- Scan flow ----------
     def scan_current(self):
@@ -571,7 +956,7 @@ class OMRApp:
             messagebox.showerror("Setup Required",
                                  "Please load the Answer Key (quiz name) before scanning.\n\nApp Bar → 📄 Answer Key")
             return
-        if not (self.section_name and self.id_to_name):
+        if not (self.section_name and len(self.roster)):
             messagebox.showerror("Setup Required",
                                  "Please load the Class Section before scanning.\n\nApp Bar → 👥 Class Section")
             return
@@ -579,11 +964,35 @@ class OMRApp:
             messagebox.showwarning("Scan", "No frame available. Open camera first.")
             return
 
-        N = self.get_active_items()
+        blockers = self._frame_blockers()
+        if blockers:
+            # Auto-defer: the preview loop re-triggers the scan as soon as the gate passes
+            self._scan_deferred_until = time.monotonic() + QUALITY_DEFER_SECONDS
+            self.log(f"Waiting for a usable frame ({', '.join(blockers)})… hold the sheet steady.")
+            return
+        self._scan_deferred_until = None
+        self._scan_queue = []
+
+        if self.multi_var.get():
+            self._scan_multi(self.last_frame_bgr)
+            return
+        if self.fusion_var.get():
+            self._fusion = ScoreFusion(CFG, FUSION["min_frames"], FUSION["max_frames"], FUSION["z_conf"])
+            self._fusion_corners = None
+            self._fusion_tpl = None
+            self._fusion_hash = None
+            self.log("Multi-frame: hold the sheet steady…")
+            return
 
-        frame = self.last_frame_bgr.copy()
+        frame = self.last_frame_bgr
+        pool = self.pool
         try:
-            warped = warp_page(frame)
+            pool.ensure_for(frame)
+            fgray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=pool.frame_gray)
+            m = find_markers(fgray, blur=pool.frame_blur, th=pool.frame_th)
+            tpl = identify(m, fgray)
+            pool.ensure_warp(tpl.warp_w, tpl.warp_h)
+            warped = warp_page(frame, dst=pool.warped, markers=m, template=tpl)
         except Exception as e:
             messagebox.showerror(
                 "Warp/Markers",
@@ -592,36 +1001,295 @@ class OMRApp:
             )
             return
 
-        gray = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY)
-        answers, centers, r = detect_answers(gray, CFG)
-        student_id, id_cols, r_id = detect_student_id(gray, CFG)
-
-        annotated = annotate(
-            warped, centers, r, answers, key=self.key,
-            mark_blanks=bool(CFG.get("mark_blanks", True)),
-            id_cols=id_cols, r_id=r_id, limit_items=N
-        )
-
-        score = grade(answers, self.key, limit_items=N)
+        gray = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY, dst=pool.gray)
+        phash = sheet_hash(gray, tpl)
+        if not self._allow_duplicate(tpl, phash):
+            return
+        ans_scores, centers, r = score_answers(gray, tpl.cfg, dst=pool.clahe, template=tpl)
+        id_scores, id_centers, r_id = score_student_id(gray, tpl.cfg, dst=pool.clahe, template=tpl)
+        student_id, id_cols = decode_student_id(id_scores, id_centers)
+        self._present_scan(warped, gray, decide_rows(ans_scores, tpl.cfg), centers, r, student_id, id_cols, r_id, tpl,
+                           scores=(ans_scores, id_scores), phash=phash)
+
+    def _allow_duplicate(self, tpl, phash):
+        """False when the sheet matches one already saved this session (skipped in auto mode, asked otherwise)."""
+        dup = self.dedup.query(tpl.name, phash)
+        if dup is None:
+            return True
+        base, student_id = dup
+        where = "waiting in the review queue" if base.startswith(QUEUED_REF) else "already saved"
+        if self.auto_var.get():
+            self.log(f"Skipped: same sheet as {base} ({student_id or '-----'}), {where}.")
+            return False
+        ok = messagebox.askyesno("Possible Duplicate",
+                                 f"This sheet looks like {base} (ID {student_id or '-----'}), {where} "
+                                 "in this session.\n\nGrade it anyway?")
+        if not ok:
+            self.log(f"Duplicate of {base} not graded.")
+        return ok
+
+    def _scan_multi(self, frame):
+        """Grade every sheet in the frame (one per marker group) in parallel; results are reviewed in turn."""
+        pool = self.pool
+        pool.ensure_for(frame)
+        fgray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=pool.frame_gray)
+        groups = find_marker_groups(fgray, blur=pool.frame_blur, th=pool.frame_th)
+        if not groups:
+            messagebox.showerror("Multi-sheet", "No complete sheet (4 corner squares) found in the frame.")
+            return
 
-        self._show_bgr_on_label(annotated, self.annot_label)
-        self.id_var.set(f"{student_id if student_id else '-----'}")
-        self.score_var.set(f"{score}/{N}")
+        def _one(i, m):
+            # Each sheet gets its own named buffers so queued results stay valid while others are reviewed
+            tpl = identify(m, fgray)
+            warped = warp_page(frame, dst=pool.scratch(f"multi_warped{i}", (tpl.warp_h, tpl.warp_w, 3)),
+                               markers=m, template=tpl)
+            gray = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY, dst=pool.scratch(f"multi_gray{i}", warped.shape[:2]))
+            phash = sheet_hash(gray, tpl)
+            if self.dedup.query(tpl.name, phash) is not None:
+                return None   # already saved this session: not graded again
+            clahe = pool.scratch(f"multi_clahe{i}", gray.shape)
+            ans_scores, centers, r = score_answers(gray, tpl.cfg, dst=clahe, template=tpl)
+            id_scores, id_centers, r_id = score_student_id(gray, tpl.cfg, dst=clahe, template=tpl)
+            student_id, id_cols = decode_student_id(id_scores, id_centers)
+            return (warped, gray, decide_rows(ans_scores, tpl.cfg), centers, r, student_id, id_cols, r_id, tpl,
+                    (ans_scores, id_scores), phash)
+
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(groups)) as ex:
+            results = list(ex.map(_one, range(len(groups)), groups))
+        ms = 1000 * (time.perf_counter() - t0)
+        dups = sum(1 for res in results if res is None)
+        results = [res for res in results if res is not None]
+        self.log(f"Multi-sheet: {len(results)} sheet(s) graded in {ms:.0f} ms"
+                 + (f", {dups} already-saved sheet(s) skipped" if dups else ""))
+        if not results:
+            return
+        self._scan_queue = results[1:]
+        self._present_scan(*results[0])
+
+    def _next_queued(self):
+        """Show the next sheet of a multi-sheet capture, if any. Returns True when one was shown."""
+        if not self._scan_queue:
+            return False
+        self._present_scan(*self._scan_queue.pop(0))
+        self.log(f"Multi-sheet: next sheet ({len(self._scan_queue)} more after this).")
+        return True
+
+    def _fusion_step(self, frame):
+        """Accumulate one stable frame into the running fusion; present the result once it settles."""
+        pool, fusion = self.pool, self._fusion
+        try:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=pool.frame_gray if frame is pool.frame else None)
+            m = find_markers(gray, blur=pool.frame_blur, th=pool.frame_th)
+        except Exception:
+            return  # markers lost on this frame; keep what we have
+        if self._fusion_corners is not None and float(np.abs(m - self._fusion_corners).max()) > FUSION["stable_px"]:
+            fusion.reset()  # sheet moved: only consecutive stable frames are fused
+        self._fusion_corners = m
+        tpl = identify(m, gray)
+        if tpl is not self._fusion_tpl:
+            fusion.reset()  # different layout: score arrays are not comparable
+            fusion.cfg = tpl.cfg
+            self._fusion_tpl = tpl
+        n_active = min(self.get_active_items(), tpl.n_items)
+
+        pool.ensure_warp(tpl.warp_w, tpl.warp_h)
+        warped = warp_page(frame, dst=pool.warped, markers=m, template=tpl)
+        wgray = cv2.cvtColor(warped, cv2.COLOR_BGR2GRAY, dst=pool.gray)
+        if self._fusion_hash is None:
+            # Checked once per fused scan, on its first frame
+            self._fusion_hash = sheet_hash(wgray, tpl)
+            if not self._allow_duplicate(tpl, self._fusion_hash):
+                self._fusion = None
+                return
+        ans_scores, centers, r = score_answers(wgray, tpl.cfg, dst=pool.clahe, template=tpl)
+        id_scores, id_centers, r_id = score_student_id(wgray, tpl.cfg, dst=pool.clahe, template=tpl)
+        fusion.add(ans_scores, id_scores)
+        if not fusion.done(n_active):
+            self.log(f"Multi-frame: {fusion.n} frame(s) fused…")
+            return
 
-        self.pending = {
+        self._fusion = None
+        student_id, id_cols = decode_student_id(fusion.mean_id, id_centers)
+        settled = "settled" if fusion.confident(n_active) else "frame limit reached"
+        self.log(f"Multi-frame: {settled} after {fusion.n} frame(s).")
+        self._present_scan(warped, wgray, fusion.answers(), centers, r, student_id, id_cols, r_id, tpl,
+                           scores=(fusion.mean_ans, fusion.mean_id), phash=self._fusion_hash)
+
+    def _present_scan(self, warped, gray, answers, centers, r, student_id, id_cols, r_id, template, scores=None,
+                      phash=None):
+        self._requeue_pending()
+        # Items of this page that fall inside the active exam length
+        offset = template.item_offset
+        N = max(0, min(template.n_items, self.get_active_items() - offset))
+
+        # An ID missing from the class list is moved to the most likely listed ID, when one clearly wins
+        id_fixed = None
+        if scores is not None and student_id not in self.roster:
+            fix = self.roster.correct(scores[1])
+            if fix:
+                id_fixed = student_id
+                student_id, id_cols = fix[0], id_columns(fix[0], id_cols)
+                self.log(f"ID {id_fixed} is not in the class list; read as {student_id} (evidence cost {fix[1]:.3f}).")
+
+        # Exam version: the sheet's set bubbles, else the roster, else the first set
+        key_set, key = self._sheet_key(detect_key_set(gray, template.cfg, template=template)
+                                       or self.roster.key_set(student_id))
+
+        annot_args = dict(centers=centers, r=r, answers=answers, key=key,
+                          mark_blanks=bool(template.cfg.get("mark_blanks", True)),
+                          id_cols=id_cols, r_id=r_id, limit_items=N, item_offset=offset)
+        score = grade(answers, key, limit_items=N, item_offset=offset)
+        confidence = 0.0
+        if scores is not None:
+            confidence, _ = sheet_confidence(scores[0], scores[1], template.cfg, N,
+                                             AUTO_CONFIRM["fill_ref"], AUTO_CONFIRM["z_full"])
+
+        # warped/gray live in the buffer pool: valid until the next scan overwrites them
+        data = {
             'warped': warped,
-            'annotated': annotated,
+            'gray': gray,
+            'annot_args': annot_args,
             'answers': answers[:N],
             'student_id': student_id,
             'score': score,
             'total_items': N,
+            'template': template.name,
+            'page': template.page, 'pages': template.pages, 'item_offset': offset,
+            'key_set': key_set, 'key': key,
+            'confidence': confidence, 'id_fixed': id_fixed, 'phash': phash,
         }
+        if self.auto_var.get():
+            self._triage(data)
+        else:
+            self._show_pending(data)
+
+    def _render_result(self, data):
+        """Annotated preview (rendered straight at display resolution) and the ID/score readouts."""
+        warped = data['warped'] if data['warped'] is not None else cv2.cvtColor(data['gray'], cv2.COLOR_GRAY2BGR)
+        preview = annotate(warped, scale=display_scale(warped.shape, *self._label_box(self.annot_label)),
+                           **data['annot_args'])
+        self._show_bgr_on_label(preview, self.annot_label)
+        student_id = data['student_id']
+        self.id_var.set(f"{student_id if student_id else '-----'}")
+        page = f"p{data['page']}/{data['pages']} " if data['pages'] > 1 else ""
+        version = f"Set {data['key_set']} " if data['key_set'] else ""
+        self.score_var.set(f"{page}{version}{data['score']}/{data['total_items']}")
+
+    def _show_pending(self, data):
+        self._render_result(data)
+        self.pending = data
         self.btn_retry.config(state=tk.NORMAL)
         self.btn_confirm.config(state=tk.NORMAL)
-        self.log("Review the annotated view, then Confirm to save.")
+        self.log(f"Review the annotated view (confidence {data['confidence']:.2f}), then Confirm to save.")
+
+    # ---------- Confidence triage ----------
+    def _review_reason(self, data):
+        """Why a sheet cannot be saved unattended, or None when it can."""
+        student_id = data['student_id']
+        if data['confidence'] < AUTO_CONFIRM["min_sheet"]:
+            return f"low confidence {data['confidence']:.2f}"
+        if data.get('id_fixed') is not None:
+            # A corrected ID is a guess between students: a person confirms it
+            return f"ID corrected from {data['id_fixed']} to {student_id}"
+        if student_id not in self.roster:
+            return f"ID {student_id or '-----'} not in the class list"
+        if self.store.has_student(student_id):
+            return f"ID {student_id} already scanned"
+        return None
+
+    def _triage(self, data):
+        """Auto-confirm mode: save a confident sheet right away, queue anything doubtful. Never waits for input."""
+        self._render_result(data)
+        reason = self._review_reason(data)
+        if reason is None and self._confirm_pending(data):
+            self.log(f"Auto-confirmed {data['student_id']} ({data['score']}/{data['total_items']}, "
+                     f"confidence {data['confidence']:.2f}).")
+        else:
+            reason = reason or "not saved"
+            # Index the queued sheet too, so a rescan before review is caught; Retry drops it again
+            ref = None
+            if data['phash'] is not None:
+                self._queued_seq += 1
+                ref = (f"{QUEUED_REF}{self._queued_seq}", data['student_id'])
+                self.dedup.add(data['template'], data['phash'], ref)
+            # The pool buffers are reused by the next scan; a queued sheet keeps its own gray copy
+            self.review_queue.append(dict(data, warped=None, gray=data['gray'].copy(), queued=True, reason=reason,
+                                          dedup_ref=ref))
+            self.log(f"Queued for review ({reason}) • {len(self.review_queue)} waiting.")
+        self._update_review_button()
+        self._next_queued()
+
+    def _requeue_pending(self):
+        """A queued sheet still on screen when a new scan arrives goes back to the front of the review queue."""
+        data = self.pending
+        if data is None or not data.get('queued'):
+            return
+        self.pending = None
+        self.review_queue.insert(0, data)
+        self._update_review_button()
+        self.log(f"Sheet under review put back in the queue • {len(self.review_queue)} waiting.")
+
+    def _unsaved_sheets(self):
+        return len(self.review_queue) + len(self._scan_queue) + (self.pending is not None)
+
+    def _ok_to_drop_unsaved(self, title):
+        """Ask before a key/section/session change discards graded sheets that were not saved yet."""
+        n = self._unsaved_sheets()
+        return not n or messagebox.askyesno(
+            title, f"{n} scanned sheet(s) not saved yet (on screen or awaiting review) belong to the current "
+                   "session and will be discarded.\n\nContinue?")
+
+    def _drop_unsaved(self):
+        """Forget the sheet on screen and both queues: they were graded for the previous session."""
+        for data in self.review_queue + [self.pending or {}]:
+            if data.get('dedup_ref'):
+                self.dedup.remove(data['dedup_ref'])
+        self.pending, self.review_queue, self._scan_queue, self._fusion = None, [], [], None
+        if hasattr(self, 'btn_review'):
+            self._update_review_button()
+            self.btn_retry.config(state=tk.DISABLED)
+            self.btn_confirm.config(state=tk.DISABLED)
+            self._show_placeholder_annot()
+            self.score_var.set("—")
+            self.id_var.set("-----")
+
+    def _update_review_button(self):
+        n = len(self.review_queue)
+        self.btn_review.config(text=f"🗂 Review ({n})", state=tk.NORMAL if n else tk.DISABLED)
+
+    def on_review(self):
+        """Bring up the next queued low-confidence sheet for a Confirm/Retry decision."""
+        if not self.review_queue:
+            return
+        if self.pending is not None:
+            messagebox.showinfo("Review", "Confirm or retry the sheet on screen first.")
+            return
+        data = self.review_queue.pop(0)
+        self._update_review_button()
+        self._show_pending(data)
+        self.log(f"Reviewing queued sheet ({data['reason']}) • {len(self.review_queue)} more waiting.")
+
+    def _sheet_key(self, key_set):
+        """(set name, printed-order key dict) for a detected/assigned set; single-version keys ignore it."""
+        if len(self.keys) < 2:
+            return "", self.key
+        v = self.keys.index(key_set)
+        if key_set and self.keys.names[v] != key_set:
+            self.log(f"Set {key_set} is not in the answer key; grading as set {self.keys.names[v]}.")
+        return self.keys.names[v], self.keys.key(v)
 
     def on_retry(self):
-        self.pending = None
+        data, self.pending = self.pending, None
+        self._fusion = None
+        if data and data.get('dedup_ref'):
+            self.dedup.remove(data['dedup_ref'])   # a discarded queued sheet may be scanned again
+        if self._next_queued():
+            return
+        if data and data.get('queued') and self.review_queue:
+            self.log(f"Discarded queued sheet {data['student_id'] or '-----'}.")
+            self.on_review()
+            return
         self._show_placeholder_annot()
         self.score_var.set("—")
         self.id_var.set("-----")
@@ -633,43 +1301,85 @@ class OMRApp:
         if not self.pending:
             return
         data = self.pending
+        if self._confirm_pending(data) and not self._next_queued() and data.get('queued'):
+            self.on_review()
 
+    def _confirm_pending(self, data):
+        """Save and record one reviewed sheet. Returns False if it was refused (e.g. duplicate ID)."""
         # Duplicate Student ID protection
         student_id = data.get('student_id') or ""
-        if student_id and any(r.get('student_id') == student_id for r in self.results):
+        if self.store.has_student(student_id):
             messagebox.showerror(
                 "Duplicate Student ID",
                 f"Student ID {student_id} has already been scanned in this session."
             )
-            return
-
-        self.pending = None
-
-        # Save annotated image & CSV row into session directory
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        base = f"scan_{ts}"
+            return False
+        multipage = data['pages'] > 1
+        if multipage and not student_id:
+            messagebox.showerror("Multi-page Exam", "A Student ID is needed to join the pages of this exam.")
+            return False
+
+        under_review = data is self.pending
+        if under_review:
+            self.pending = None
+
+        # Save compact sheet record (grayscale page + sidecar) & store row into session directory
+        now = datetime.now()
+        ts = now.strftime("%Y%m%d_%H%M%S")
         ensure_outdir(self.session_dir)
-        out_img = os.path.join(self.session_dir, f"{base}.png")
-        cv2.imwrite(out_img, data['annotated'])
-        csv_path = os.path.join(self.session_dir, "results.csv")
-
-        answers = data['answers']
-        score = data['score']
-        total_items = data['total_items']  # N at scan time
-        student_name = self.id_to_name.get(student_id, "(Unknown)") if student_id else "(Unknown)"
-
-        header = ["timestamp","filename","exam","section","student_name","student_id","score","max"] + [f"Q{i:02d}" for i in range(1,total_items+1)]
-        row = [ts, base, self.exam_name or "", self.section_name or "", student_name, student_id, score, total_items]
-        letters = [LETTERS[a] if isinstance(a,int) and a>=0 else "-" for a in answers]
-        row.extend(letters[:total_items])
-        new_file = not os.path.exists(csv_path)
-        with open(csv_path, "a", newline="", encoding='utf-8') as f:
-            w = csv.writer(f)
-            if new_file:
-                w.writerow(header)
-            w.writerow(row)
-
-        self.results.append({
+        # Auto-confirm can save several sheets within one second: milliseconds plus a probe keep names unique
+        base = unique_base(self.session_dir, f"scan_{ts}_{now.microsecond // 1000:03d}")
+        args = data['annot_args']
+        out_img = save_sheet(self.session_dir, base, data['gray'], {
+            'student_id': data.get('student_id') or "",
+            'score': data['score'],
+            'answers': args['answers'], 'centers': args['centers'], 'r': args['r'],
+            'id_cols': args['id_cols'], 'r_id': args['r_id'],
+            'limit_items': args['limit_items'], 'mark_blanks': args['mark_blanks'],
+            'key': data['key'], 'key_version': key_version(data['key']), 'key_set': data['key_set'],
+            'template': data['template'],
+            'page': data['page'], 'pages': data['pages'], 'item_offset': data['item_offset'],
+            'phash': hash_hex(data['phash']) if data['phash'] is not None else "",
+            'phash_bits': len(data['phash']) if data['phash'] is not None else 0,
+        })
+        if data.get('dedup_ref'):
+            self.dedup.remove(data['dedup_ref'])
+        if data['phash'] is not None:
+            self.dedup.add(data['template'], data['phash'], (base, student_id))
+        if SAVE_ANNOTATED_PNG:
+            warped = data['warped'] if data['warped'] is not None else cv2.cvtColor(data['gray'], cv2.COLOR_GRAY2BGR)
+            save_annotated_png(os.path.join(self.session_dir, f"{base}.png"), annotate(warped, dst=self.pool.annot, **args))
+        if under_review:
+            self.btn_retry.config(state=tk.DISABLED)
+            self.btn_confirm.config(state=tk.DISABLED)
+
+        answers, score, total_items = data['answers'], data['score'], data['total_items']  # N at scan time
+        if multipage:
+            done = self.stitcher.add(student_id, data['page'], data['pages'], data['item_offset'], answers, base)
+            if done is None:
+                left = ", ".join(map(str, self.stitcher.missing(student_id)))
+                self.log(f"Saved page {data['page']}/{data['pages']} for {student_id} • waiting for page(s) {left}")
+                return True
+            # All pages in: grade the joined vector as one sheet; the first page's sidecar lists the others
+            base = done['bases'][0]
+            total_items = min(self.get_active_items(), len(done['answers']))
+            answers = done['answers'][:total_items]
+            score = grade(answers, data['key'], limit_items=total_items)
+            update_sheet_meta(self.session_dir, base, pages_bases=done['bases'])
+        if data['key_set']:
+            # Canonical positions of the first N printed items may lie past N: the vector keeps that width
+            answers = self.keys.to_canonical(answers[:total_items], self.keys.index(data['key_set']))
+        self._commit_result(ts, base, student_id, answers, score, total_items, data['key_set'])
+        self.log(f"Saved sheet: {out_img} • Logged to {os.path.basename(self.store.path)}")
+        return True
+
+    def _commit_result(self, ts, base, student_id, answers, score, total_items, key_set=""):
+        """
+        Record one graded student in the store, matrix and running statistics, then refresh the views.
+        `total_items` (stored as 'max') is the printed items graded; canonical `answers` may be wider.
+        """
+        student_name = self.roster.name(student_id)
+        rec = {
             'timestamp': ts,
             'filename': base,
             'exam': self.exam_name or "",
@@ -678,14 +1388,56 @@ class OMRApp:
             'student_id': student_id,
             'score': score,
             'max': total_items,
-            'answers': answers[:total_items],
-        })
+            'key_set': key_set,
+            'answers': answers,
+        }
+        self.store.add(rec)
+        row = self.matrix.append(rec.pop('answers'), rec)
+        correct_row = self.matrix.row_correct(row, self._key_vec())
+        self.stats.add(row, score, student_name)
+        self.item_stats.add(self.matrix.row_answers(row), score, correct_row)
+        if len(self.matrix) % CHECKPOINT_EVERY == 0:
+            self._write_checkpoint()
 
         self.refresh_scores()
         self.refresh_stats()
-        self.btn_retry.config(state=tk.DISABLED)
-        self.btn_confirm.config(state=tk.DISABLED)
-        self.log(f"Saved image: {out_img} • Logged to results.csv")
+
+    def on_view_sheet(self, event=None):
+        """Regenerate the annotated view of the selected Scores row and show it on the Scan tab."""
+        idx = self.tree_scores.selected_index()
+        if idx is None:
+            return
+        try:
+            base = self.matrix.meta[idx]['filename']
+            bgr = render_sheet(self.session_dir, base, key=self._sheet_key(self.matrix.meta[idx]['key_set'])[1] or None,
+                               scale=0.5)
+        except Exception as e:
+            messagebox.showerror("View Sheet", f"Could not load the stored sheet.\n\nDetails: {e}")
+            return
+        self._show_bgr_on_label(bgr, self.annot_label)
+        self.nb.select(self._tab_scan)
+        self.log(f"Viewing {base} (regenerated from stored sheet)")
+
+    def on_export_sheets(self):
+        if not len(self.matrix):
+            messagebox.showinfo("Export Sheets", "No results to export yet.")
+            return
+        out_dir = filedialog.askdirectory(title="Export annotated sheets to…", initialdir=self.session_dir)
+        if not out_dir:
+            return
+        done, failed = 0, 0
+        for r in self.matrix.meta:
+            try:
+                bgr = render_sheet(self.session_dir, r['filename'], key=self._sheet_key(r['key_set'])[1] or None)
+                name = self._make_safe(f"{r['student_id'] or 'unknown'} - {r['student_name']} - {r['filename']}")
+                save_annotated_png(os.path.join(out_dir, f"{name}.png"), bgr)
+                done += 1
+            except Exception:
+                failed += 1
+        msg = f"Exported {done} annotated sheet(s) to:\n{out_dir}"
+        if failed:
+            msg += f"\n\n{failed} sheet(s) could not be regenerated."
+        messagebox.showinfo("Export Sheets", msg)
 
     def _show_placeholder_annot(self):
         ph = np.zeros((480, 640, 3), dtype=np.uint8)
@@ -693,308 +1445,287 @@ class OMRApp:
         self._show_bgr_on_label(ph, self.annot_label)
 
     # ---------- Scores tab ----------
-    def refresh_scores(self):
-        for it in self.tree_scores.get_children():
-            self.tree_scores.delete(it)
-        for i, r in enumerate(self.results, start=1):
-            self.tree_scores.insert('', 'end', values=(i, r['student_name'], r['student_id'], r['score'], r['max']))
-        self.lbl_count.config(text=f"{len(self.results)}")
+    def _score_row(self, i):
+        r = self.matrix.meta[i]
+        return (i+1, r['student_name'], r['student_id'], r['score'], r['max'])
+
+    def refresh_scores(self, changed=()):
+        """Append rows for newly confirmed sheets; rewrite only the `changed` row indices."""
+        tree = self.tree_scores
+        if len(tree) > len(self.matrix):
+            tree.clear()
+        for i in changed:
+            if i < len(tree):
+                tree.set_row(i, self._score_row(i))
+        for i in range(len(tree), len(self.matrix)):
+            tree.append(self._score_row(i))
+        self.lbl_count.config(text=f"{len(self.matrix)}")
 
         # Lowest / Highest with names
-        if not self.results:
+        if not len(self.matrix):
             self.lbl_lowest.config(text="—"); self.lbl_highest.config(text="—")
             self.lbl_lowest_names.config(text=""); self.lbl_highest_names.config(text="")
             return
-        scores = [r['score'] for r in self.results if isinstance(r['score'], (int, float))]
-        if not scores:
-            self.lbl_lowest.config(text="—"); self.lbl_highest.config(text="—")
-            self.lbl_lowest_names.config(text=""); self.lbl_highest_names.config(text=""); return
-        mn, mx = min(scores), max(scores)
-        min_names = [r['student_name'] for r in self.results if r.get('score') == mn]
-        max_names = [r['student_name'] for r in self.results if r.get('score') == mx]
+        mn, mx, min_names, max_names = self._extremes()
         self.lbl_lowest.config(text=str(mn)); self.lbl_highest.config(text=str(mx))
         def _fmt(names, limit=3):
             return ", ".join(names) if len(names)<=limit else ", ".join(names[:limit]) + f" (+{len(names)-limit} more)"
         self.lbl_lowest_names.config(text=_fmt(min_names))
         self.lbl_highest_names.config(text=_fmt(max_names))
 
+    def _key_vec(self):
+        """Key vector for self.key, at least as wide as the answer matrix."""
+        n = max(self.matrix.n_items, max(self.key, default=0))
+        if self._kv is None or len(self._kv) != n:
+            self._kv = key_vector(self.key, n)
+        return self._kv
+
+    def _extremes(self):
+        """(lowest, highest, lowest_names, highest_names) from the running statistics."""
+        st = self.stats
+        mn, mx = st.lowest(), st.highest()
+        return mn, mx, st.names_at(mn), st.names_at(mx)
+
+    def _rebuild_stats(self):
+        """Rebuild running statistics and item analysis from the matrix (key change / session switch)."""
+        self._kv = None
+        kv = self._key_vec()
+        self.stats = RunningStats.from_matrix(self.matrix)
+        self.item_stats = ItemAnalysis.from_matrix(self.matrix, kv)
+
+    def _item_rows(self, total_items):
+        """Item-analysis rows (ITEM_COLUMNS) for the first total_items items, plus KR-20."""
+        kv = self._key_vec()
+        rep = self.item_stats.report(kv, total_items)
+        n = rep['n']
+        fmt = lambda v, spec: "—" if v != v else format(v, spec)   # NaN -> dash
+        rows = []
+        for i in range(total_items):
+            p = rep['difficulty'][i]
+            ch = rep['choice_pct'][i]
+            rows.append((i+1, LETTERS[kv[i]] if rep['keyed'][i] else "—", fmt(100.0 * p, ".1f"),
+                         "—" if p != p else int(round(p * n)),
+                         fmt(rep['discrimination'][i], ".2f"), fmt(rep['point_biserial'][i], ".2f"))
+                        + tuple(f"{v:.0f}%" for v in ch[1:]) + (f"{ch[0]:.0f}%",))
+        return rows, rep['kr20']
+
     # ---------- Statistics tab ----------
     def _redraw_trend_only(self):
-        scores = [r['score'] for r in self.results if isinstance(r['score'], (int, float))]
-        maxv = self.get_active_items() if self.results else 50
-        self.draw_trend(scores, maxv)
+        maxv = self.get_active_items() if len(self.matrix) else 50
+        self.draw_trend(self.matrix.scores, maxv)
 
     def refresh_stats(self):
-        scores = [r['score'] for r in self.results if isinstance(r['score'], (int,float))]
-        maxv = self.get_active_items() if self.results else 50
-        if scores:
-            try:
-                mean = sum(scores)/len(scores)
-                median = stats.median(scores)
-                mode = stats.mode(scores)
-            except stats.StatisticsError:
-                mode = "—"; median = stats.median(scores); mean = sum(scores)/len(scores)
-            self.stat_mean.set(f"{mean:.2f}")
-            self.stat_median.set(f"{median}")
-            self.stat_mode.set(f"{mode}")
+        st = self.stats
+        maxv = self.get_active_items() if st.n else 50
+        if st.n:
+            self.stat_mean.set(f"{st.mean():.2f}")
+            self.stat_median.set(f"{st.median()}")
+            self.stat_mode.set(f"{st.mode()}")
         else:
             self.stat_mean.set("—"); self.stat_median.set("—"); self.stat_mode.set("—")
+            self.stat_kr20.set("—")
 
         if (self.trend_canvas.winfo_width() or 0) <= 1:
             self.root.after(50, self._redraw_trend_only)
         else:
-            self.draw_trend(scores, maxv)
+            self.draw_trend(self.matrix.scores, maxv)
 
         self.fill_item_analysis(self.get_active_items())
 
     def draw_trend(self, scores, maxv):
-        c = self.trend_canvas
-        c.delete('all')
-        w = max(c.winfo_width(), c.winfo_reqwidth(), 480)
-        h = max(c.winfo_height(), c.winfo_reqheight(), 220)
-        PAD_L, PAD_R, PAD_T, PAD_B = 68, 26, 24, 44
-        plot_w = max(1, w - PAD_L - PAD_R)
-        plot_h = max(1, h - PAD_T - PAD_B)
-        c.create_rectangle(0, 0, w, h, fill="#f8f9fa", outline="")
-        c.create_line(PAD_L, h - PAD_B, w - PAD_R, h - PAD_B, fill="#8686AC", width=2)
-        c.create_line(PAD_L, h - PAD_B, PAD_L, PAD_T, fill="#8686AC", width=2)
-        if not scores:
-            c.create_text(w//2, h//2, text="📊 No data yet", fill="#6c757d", font=('Segoe UI', 16)); return
-        n = len(scores)
-        y_min, y_max = 0, max(1, maxv if maxv else max(scores))
-        def _nice_ticks(vmax, lines=5):
-            if vmax <= 0: return [0, 1]
-            raw = vmax / lines
-            mag = 10 ** int(math.floor(math.log10(raw)))
-            nice_mul = [1, 2, 2.5, 5, 10]
-            step = min(nice_mul, key=lambda m: abs(raw - m*mag)) * mag
-            k = int(math.ceil(vmax / step))
-            return [i*step for i in range(k+1)]
-        yticks = _nice_ticks(y_max, lines=5)
-        def mapx(i):
-            if n == 1: return PAD_L + plot_w / 2
-            return PAD_L + (i / (n - 1)) * plot_w
-        def mapy(s):
-            rng = max(1e-6, y_max - y_min)
-            return h - PAD_B - ((s - y_min) / rng) * plot_h
-        for val in yticks:
-            y = mapy(val)
-            c.create_line(PAD_L, y, w - PAD_R, y, fill="#505081", width=1)
-            c.create_text(PAD_L - 10, y, text=f"{int(val)}", anchor="e", fill="#8686AC", font=('Segoe UI', 12))
-        xtick_count = min(10, n)
-        if xtick_count > 1:
-            step = (n - 1) / (xtick_count - 1)
-            for j in range(xtick_count):
-                i = int(round(j * step))
-                x = mapx(i)
-                c.create_line(x, h - PAD_B, x, h - PAD_B + 4, fill="#6c757d", width=1)
-                c.create_text(x, h - PAD_B + 16, text=str(i + 1), anchor="n", fill="#6c757d", font=('Segoe UI', 12))
-        max_segments = max(10, int(plot_w))
-        idxs = list(range(n))
-        if n > max_segments:
-            stride = int(math.ceil(n / max_segments))
-            idxs = list(range(0, n, stride))
-            if idxs[-1] != n - 1:
-                idxs.append(n - 1)
-        density = len(idxs)
-        line_w = 4 if density < 200 else 3
-        r_outer = 6 if density < 200 else 3
-        r_inner = 3 if density < 200 else 2
-        pts = [(mapx(i), mapy(scores[i])) for i in idxs]
-        for i in range(1, len(pts)):
-            x0, y0 = pts[i - 1]; x1, y1 = pts[i]
-            c.create_line(x0, y0, x1, y1, fill="#8686AC", width=line_w, capstyle=tk.ROUND)
-        if density <= 600:
-            for (x, y) in pts:
-                c.create_oval(x - r_outer, y - r_outer, x + r_outer, y + r_outer,
-                                outline="#505081", fill="#0F0E47", width=2)
-                c.create_oval(x - r_inner, y - r_inner, x + r_inner, y + r_inner,
-                                outline="", fill="#8686AC")
-        latest = scores[-1]; best = max(scores)
-        x_latest, y_latest = mapx(n - 1), mapy(latest)
-        x_best, y_best = mapx(scores.index(best)), mapy(best)
-        
-        def tag(x, y, text, fill="#272757"):
-            padding = 6
-            txt = c.create_text(x, y, text=text, anchor="sw", font=('Segoe UI', 12, 'bold'), fill="#8686AC")
-            bx, by, bx2, by2 = c.bbox(txt); c.delete(txt)
-            c.create_rectangle(bx - padding, by - padding, bx2 + padding, by2 + padding, fill=fill, outline=fill)
-            c.create_text(x, y, text=text, anchor="sw", font=('Segoe UI', 12, 'bold'), fill="#8686AC")
-        tag(x_latest, y_latest - 10, f" Latest: {latest}", fill="#22c55e")
-        if best == latest: tag(x_best, y_best - 30, " Best ✓", fill="#16a34a")
-        else:              tag(x_best, y_best - 10, f" Best: {best}", fill="#16a34a")
+        self.trend_chart.draw(scores, maxv)
 
     def fill_item_analysis(self, total_items):
-        for it in self.tree_items.get_children():
-            self.tree_items.delete(it)
-        if not self.results or not self.key:
-            return
-        count = [0]*total_items
-        n = len(self.results)
-        for r in self.results:
-            ans = r['answers']
-            for i in range(total_items):
-                a = ans[i] if i < len(ans) else -1
-                k = self.key.get(i+1, None)
-                if k is not None and a == k:
-                    count[i] += 1
-        for i in range(total_items):
-            pc = (100.0 * count[i] / n) if n>0 else 0.0
-            self.tree_items.insert('', 'end', values=(i+1, f"{pc:.1f}%", count[i]))
+        """Update item rows in place; rows whose values did not change are left untouched."""
+        tree = self.tree_items
+        if not len(self.matrix) or not self.key:
+            tree.truncate(0)
+            self.stat_kr20.set("—")
+            return
+        rows, kr20 = self._item_rows(total_items)
+        self.stat_kr20.set("—" if kr20 is None else f"{kr20:.2f}")
+        tree.truncate(total_items)
+        for i, values in enumerate(rows):
+            if i < len(tree):
+                tree.set_row(i, values)
+            else:
+                tree.append(values)
 
     # ---------- Export (results & statistics) ----------
+    def _ask_export_path(self, title, base):
+        """Save dialog offering XLSX when openpyxl is installed, CSV otherwise."""
+        xlsx = have_xlsx()
+        types = ([("Excel","*.xlsx")] if xlsx else []) + [("CSV","*.csv"),("All","*.*")]
+        ext = ".xlsx" if xlsx else ".csv"
+        return filedialog.asksaveasfilename(title=title, defaultextension=ext, initialfile=f"{base}{ext}",
+                                            initialdir=self.session_dir, filetypes=types)
+
+    def _start_job(self, title, fn, on_success):
+        """Run fn(job) in the background with a status-bar progress bar and Cancel button."""
+        if self._job is not None:
+            messagebox.showinfo(title, "Another background task is still running.")
+            return
+        job = self._job = BackgroundJob(fn, name=title)
+        self.job_progress.configure(value=0)
+        self.job_frame.pack(side=tk.RIGHT, padx=12, pady=6)
+        self.log(f"{title}: starting…")
+
+        def _progress(done, total):
+            self.job_progress.configure(value=100.0 * done / max(1, total))
+            self.log(f"{title}: {done}/{total}")
+
+        def _done(job):
+            self._job = None
+            self.job_frame.pack_forget()
+            if isinstance(job.error, Cancelled):
+                self.log(f"{title}: cancelled.")
+            elif job.error is not None:
+                self.log(f"{title}: failed.")
+                messagebox.showerror(title, f"{title} failed:\n\n{job.error}")
+            else:
+                on_success(job.result)
+
+        job.start()
+        poll_job(self.root, job, _progress, _done)
+
+    def on_cancel_job(self):
+        if self._job is not None:
+            self._job.cancel()
+
     def on_export(self):
-        if not self.results:
+        if not len(self.matrix):
             messagebox.showinfo("Export", "No results to export yet.")
             return
-        session_items = max((r['max'] for r in self.results), default=self.get_active_items())
-        qcols = [f"Q{i:02d}" for i in range(1, session_items+1)]
+        session_items = self.matrix.width
         safe_section = (self.section_name or "Section").strip().replace(os.sep, ' ').replace(':','-')
         safe_exam = (self.exam_name or "Exam").strip().replace(os.sep, ' ').replace(':','-')
-        base = f"{safe_section} - {safe_exam}"
-        try:
-            import pandas as pd
-            rows = []
-            for r in self.results:
-                rec = {
-                    'timestamp': r['timestamp'], 'exam': r['exam'], 'section': r['section'],
-                    'student_name': r['student_name'], 'student_id': r['student_id'],
-                    'score': r['score'], 'max': r['max'],
-                }
-                for i in range(session_items):
-                    a = r['answers'][i] if i < len(r['answers']) else -1
-                    rec[qcols[i]] = LETTERS[a] if isinstance(a,int) and a>=0 else '-'
-                rows.append(rec)
-            df = pd.DataFrame(rows)
-            out_path = filedialog.asksaveasfilename(title="Export to Excel",
-                                                    defaultextension=".xlsx",
-                                                    initialfile=f"{base}.xlsx",
-                                                    initialdir=self.session_dir,
-                                                    filetypes=[("Excel","*.xlsx"),("All","*.*")])
-            if not out_path: return
-            df.to_excel(out_path, index=False)
-            messagebox.showinfo("Export", f"Exported to Excel:\n{out_path}")
-            return
-        except Exception:
-            pass
-        out_path = filedialog.asksaveasfilename(title="Export to CSV (fallback)",
-                                                defaultextension=".csv",
-                                                initialfile=f"{base}.csv",
-                                                initialdir=self.session_dir,
-                                                filetypes=[("CSV","*.csv"),("All","*.*")])
+        out_path = self._ask_export_path("Export Results", f"{safe_section} - {safe_exam}")
         if not out_path: return
-        with open(out_path, 'w', newline='', encoding='utf-8') as f:
-            w = csv.writer(f)
-            header = ['timestamp','exam','section','student_name','student_id','score','max'] + qcols
-            w.writerow(header)
-            for r in self.results:
-                row = [r['timestamp'], r['exam'], r['section'], r['student_name'], r['student_id'], r['score'], r['max']]
-                for i in range(session_items):
-                    a = r['answers'][i] if i < len(r['answers']) else -1
-                    row.append(LETTERS[a] if isinstance(a,int) and a>=0 else '-')
-                w.writerow(row)
-        messagebox.showinfo("Export", f"Exported to CSV:\n{out_path}")
+        matrix, n_rows = self.matrix, len(self.matrix)
+        self._start_job("Export", lambda job: export_results(out_path, matrix, n_rows, session_items, job),
+                        lambda paths: messagebox.showinfo("Export", "Exported to:\n" + "\n".join(paths)))
 
     def on_export_stats(self):
-        if not self.results:
+        if not len(self.matrix):
             messagebox.showinfo("Export Statistics", "No results to export yet.")
             return
 
         total_items = self.get_active_items()
-        scores = [r['score'] for r in self.results if isinstance(r['score'], (int, float))]
+        st = self.stats
         safe_section = (self.section_name or "Section").strip().replace(os.sep, ' ').replace(':', '-')
         safe_exam = (self.exam_name or "Exam").strip().replace(os.sep, ' ').replace(':', '-')
         base = f"{safe_section} - {safe_exam} - statistics"
 
-        if scores:
+        mean, median, mode = st.mean(), st.median(), st.mode()
+        mn, mx, min_names, max_names = self._extremes()
+        n = len(self.matrix)
+        item_rows, kr20 = self._item_rows(total_items)
+
+        summary = {
+            'Exam': self.exam_name or "",
+            'Section': self.section_name or "",
+            'N Students': n,
+            'Mean': mean, 'Median': median, 'Mode': mode,
+            'Lowest Score': mn, 'Lowest Names': "; ".join(min_names),
+            'Highest Score': mx, 'Highest Names': "; ".join(max_names),
+            'Max Items (active)': total_items,
+            'KR-20': "" if kr20 is None else round(kr20, 3),
+        }
+
+        out_path = self._ask_export_path("Export Statistics", base)
+        if not out_path: return
+        self._start_job("Export Statistics",
+                        lambda job: export_statistics(out_path, summary, list(self.ITEM_COLUMNS), item_rows, job),
+                        lambda paths: messagebox.showinfo("Export Statistics", "Exported to:\n" + "\n".join(paths)))
+
+    # ---------- Cross-session history ----------
+    def on_history(self):
+        """Refresh the OUTPUT_ROOT index (changed sessions only) in the background, then open the report."""
+        if self.store and self.store.count():
+            self.store.export_csv()   # include the live session
+
+        def _update(job):
+            idx = AnalyticsIndex(OUTPUT_ROOT)
             try:
-                mean = sum(scores) / len(scores)
-                median = stats.median(scores)
-                mode = stats.mode(scores)
-            except stats.StatisticsError:
-                median = stats.median(scores); mean = sum(scores)/len(scores); mode = "—"
-            mn = min(scores); mx = max(scores)
-            min_names = [r['student_name'] for r in self.results if r.get('score') == mn]
-            max_names = [r['student_name'] for r in self.results if r.get('score') == mx]
-        else:
-            mean = median = mode = "—"; mn = mx = "—"; min_names = max_names = []
-
-        count = [0] * total_items
-        n = len(self.results)
-        for r in self.results:
-            ans = r['answers']
-            for i in range(total_items):
-                a = ans[i] if i < len(ans) else -1
-                k = self.key.get(i+1, None)
-                if k is not None and a == k:
-                    count[i] += 1
-        pct = [(100.0 * c / n) if n > 0 else 0.0 for c in count]
+                return idx.update(job)
+            finally:
+                idx.close()
+
+        def _done(res):
+            self.log(f"History index: {res[0]} session(s) re-indexed, {res[1]} removed.")
+            self._show_history()
+
+        self._start_job("History Index", _update, _done)
+
+    def _show_history(self):
+        win = tk.Toplevel(self.root)
+        win.title("History — all sessions")
+        win.geometry("900x560")
+        nb = ttk.Notebook(win); nb.pack(fill=tk.BOTH, expand=True, padx=8, pady=8)
+
+        def _table(parent, cols, widths):
+            frame = ttk.Frame(parent); frame.pack(fill=tk.BOTH, expand=True, padx=6, pady=6)
+            tree = ttk.Treeview(frame, columns=cols, show='headings', style='Modern.Treeview')
+            for col, w in zip(cols, widths):
+                tree.heading(col, text=col); tree.column(col, width=w, anchor='center')
+            sb = ttk.Scrollbar(frame, orient='vertical', command=tree.yview)
+            tree.configure(yscrollcommand=sb.set)
+            tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True); sb.pack(side=tk.RIGHT, fill=tk.Y)
+            return tree
+
+        def _fill(tree, rows):
+            tree.delete(*tree.get_children())
+            for r in rows:
+                tree.insert('', 'end', values=[f"{v:.2f}" if isinstance(v, float) else ("" if v is None else v) for v in r])
+
+        def _query(fn, *args):
+            idx = AnalyticsIndex(OUTPUT_ROOT)
+            try:
+                return fn(idx, *args)
+            finally:
+                idx.close()
+
+        # Students
+        tab = ttk.Frame(nb); nb.add(tab, text="Student")
+        bar = ttk.Frame(tab); bar.pack(fill=tk.X, padx=6, pady=(6, 0))
+        sid_var, since_var = tk.StringVar(), tk.StringVar()
+        ttk.Label(bar, text="Student ID").pack(side=tk.LEFT)
+        ttk.Entry(bar, textvariable=sid_var, width=12).pack(side=tk.LEFT, padx=(4, 12))
+        ttk.Label(bar, text="Since (YYYY-MM-DD)").pack(side=tk.LEFT)
+        ttk.Entry(bar, textvariable=since_var, width=12).pack(side=tk.LEFT, padx=(4, 12))
+        t_student = _table(tab, ("Date", "Exam", "Section", "Name", "Score", "Max"), (100, 200, 160, 200, 70, 70))
+        ttk.Button(bar, text="🔍 Show", style='Primary.TButton',
+                   command=lambda: _fill(t_student, _query(AnalyticsIndex.student_history, sid_var.get().strip(),
+                                                            since_var.get().strip() or None)))\
+            .pack(side=tk.LEFT)
 
-        try:
-            import pandas as pd
-            df_summary = pd.DataFrame([{
-                'Exam': self.exam_name or "",
-                'Section': self.section_name or "",
-                'N Students': len(self.results),
-                'Mean': mean if isinstance(mean, (int, float)) else "",
-                'Median': median if isinstance(median, (int, float)) else "",
-                'Mode': mode if isinstance(mode, (int, float)) else str(mode),
-                'Lowest Score': mn if isinstance(mn, (int, float)) else "",
-                'Lowest Names': ", ".join(min_names),
-                'Highest Score': mx if isinstance(mx, (int, float)) else "",
-                'Highest Names': ", ".join(max_names),
-                'Max Items (active)': total_items,
-            }])
-            df_items = pd.DataFrame({
-                'Item': list(range(1, total_items+1)),
-                'Correct (n)': count,
-                '% Correct': [f"{p:.1f}%" for p in pct],
-            })
-            out_path = filedialog.asksaveasfilename(title="Export Statistics (Excel)",
-                                                    defaultextension=".xlsx",
-                                                    initialfile=f"{base}.xlsx",
-                                                    initialdir=self.session_dir,
-                                                    filetypes=[("Excel","*.xlsx"),("All","*.*")])
-            if not out_path: return
-            with pd.ExcelWriter(out_path, engine="openpyxl") as writer:
-                df_summary.to_excel(writer, sheet_name="Summary", index=False)
-                df_items.to_excel(writer, sheet_name="Item Analysis", index=False)
-            messagebox.showinfo("Export Statistics", f"Exported to Excel:\n{out_path}")
-            return
-        except Exception:
-            out_summary = filedialog.asksaveasfilename(title="Export Summary (CSV)",
-                                                       defaultextension=".csv",
-                                                       initialfile=f"{base} - summary.csv",
-                                                       initialdir=self.session_dir,
-                                                       filetypes=[("CSV","*.csv"),("All","*.*")])
-            if not out_summary: return
-            with open(out_summary, 'w', newline='', encoding='utf-8') as f:
-                w = csv.writer(f)
-                w.writerow(['Exam','Section','N Students','Mean','Median','Mode',
-                            'Lowest Score','Lowest Names','Highest Score','Highest Names','Max Items (active)'])
-                w.writerow([self.exam_name or "", self.section_name or "", len(self.results),
-                            mean if isinstance(mean, (int, float)) else "",
-                            median if isinstance(median, (int, float)) else "",
-                            mode if isinstance(mode, (int, float)) else str(mode),
-                            mn if isinstance(mn, (int, float)) else "",
-                            "; ".join(min_names),
-                            mx if isinstance(mx, (int, float)) else "",
-                            "; ".join(max_names),
-                            total_items])
-            out_items = out_summary.replace("summary.csv", "item-analysis.csv")
-            with open(out_items, 'w', newline='', encoding='utf-8') as f:
-                w = csv.writer(f)
-                w.writerow(['Item','Correct (n)','% Correct'])
-                for i in range(total_items):
-                    w.writerow([i+1, count[i], f"{pct[i]:.1f}%"])
-            messagebox.showinfo("Export Statistics", f"Exported CSV files:\n{out_summary}\n{out_items}")
+        # Items
+        tab = ttk.Frame(nb); nb.add(tab, text="Item Difficulty")
+        bar = ttk.Frame(tab); bar.pack(fill=tk.X, padx=6, pady=(6, 0))
+        exam_var = tk.StringVar(value=self.exam_name or "")
+        ttk.Label(bar, text="Exam").pack(side=tk.LEFT)
+        ttk.Entry(bar, textvariable=exam_var, width=24).pack(side=tk.LEFT, padx=(4, 12))
+        t_items = _table(tab, ("Exam", "Section", "Item", "N", "P(correct)", "P(blank)"), (200, 160, 60, 70, 100, 100))
+        ttk.Button(bar, text="🔍 Show", style='Primary.TButton',
+                   command=lambda: _fill(t_items, _query(AnalyticsIndex.item_difficulty, exam_var.get().strip() or None)))\
+            .pack(side=tk.LEFT)
+
+        # Sessions
+        tab = ttk.Frame(nb); nb.add(tab, text="Sessions")
+        t_sessions = _table(tab, ("Exam", "Section", "Date", "N", "Mean", "Lowest", "Highest", "Max"),
+                            (200, 160, 100, 60, 70, 70, 70, 60))
+        _fill(t_sessions, _query(AnalyticsIndex.sessions))
 
     # ---------- Utils ----------
     def log(self, msg):
         self.log_var.set(msg)
 
     def on_close(self):
+        if self.review_queue and not messagebox.askyesno(
+                "Review Queue", f"{len(self.review_queue)} sheet(s) still await review and will be discarded.\n\nClose anyway?"):
+            return
         self.preview_running = False
         if self.cap:
             self.cap.release()
+        self._close_store()
         self.root.destroy()
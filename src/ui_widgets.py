@@ -1,8 +1,11 @@
 # ui_widgets.py
-# Reusable Tkinter widgets (e.g., scrollable toolbar, scrollable frame).
+# Reusable Tkinter widgets (e.g., scrollable toolbar, scrollable frame, windowed table, trend chart).
 
+import math
 import tkinter as tk
 from tkinter import ttk
+import numpy as np
+from analysis import decimate_minmax
 
 class ScrollableToolbar(ttk.Frame):
     """
@@ -96,3 +99,266 @@ class ScrollableFrame(ttk.Frame):
             self.canvas.yview_scroll(-1, "units")
         elif event.num == 5:
             self.canvas.yview_scroll(1, "units")
+
+
+class WindowedTreeview(ttk.Frame):
+    """
+    Treeview backed by a list of row tuples, updated incrementally:
+      - append()/set_row()/truncate() touch only the affected rows
+      - above `window_threshold` rows only the visible window is materialized;
+        the scrollbar and mouse wheel page through the backing list
+    """
+    def __init__(self, parent, columns, height=14, window_threshold=2000, style='Modern.Treeview'):
+        super().__init__(parent, style='Modern.TFrame')
+        self.tree = ttk.Treeview(self, columns=columns, show="headings", height=height, style=style)
+        self.vbar = ttk.Scrollbar(self, orient='vertical', command=self._on_scrollbar)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.vbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.configure(yscrollcommand=self.vbar.set)
+
+        self.window_threshold = int(window_threshold)
+        self._rows = []
+        self._windowed = False
+        self._top = 0
+
+        self.tree.bind("<MouseWheel>", self._on_wheel)
+        self.tree.bind("<Button-4>", self._on_wheel)
+        self.tree.bind("<Button-5>", self._on_wheel)
+
+    # passthroughs used while building the table
+    def heading(self, *args, **kwargs):
+        return self.tree.heading(*args, **kwargs)
+
+    def column(self, *args, **kwargs):
+        return self.tree.column(*args, **kwargs)
+
+    def __len__(self):
+        return len(self._rows)
+
+    # ---- row operations ----
+    def append(self, values):
+        self._rows.append(tuple(values))
+        i = len(self._rows) - 1
+        if self._windowed:
+            self._render()
+        elif len(self._rows) > self.window_threshold:
+            self._enter_windowed()
+        else:
+            self.tree.insert('', 'end', iid=str(i), values=self._rows[i])
+
+    def set_row(self, i, values):
+        values = tuple(values)
+        if self._rows[i] == values:
+            return
+        self._rows[i] = values
+        if not self._windowed:
+            self.tree.item(str(i), values=values)
+        elif self._top <= i < self._top + self._visible():
+            self.tree.item(f"w{i - self._top}", values=values)
+
+    def truncate(self, n):
+        """Drop rows from index n on."""
+        if n >= len(self._rows):
+            return
+        if not self._windowed:
+            self.tree.delete(*[str(i) for i in range(n, len(self._rows))])
+        del self._rows[n:]
+        if self._windowed:
+            self._render()
+
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self._rows = []
+        self._windowed = False
+        self._top = 0
+        self.tree.configure(yscrollcommand=self.vbar.set)
+
+    def row_index(self, iid):
+        return self._top + int(iid[1:]) if iid.startswith("w") else int(iid)
+
+    def selected_index(self):
+        sel = self.tree.selection()
+        return self.row_index(sel[0]) if sel else None
+
+    # ---- windowed mode ----
+    def _visible(self):
+        return max(1, int(self.tree.cget('height')))
+
+    def _enter_windowed(self):
+        self.tree.delete(*self.tree.get_children())
+        self._windowed = True
+        self.tree.configure(yscrollcommand='')
+        for k in range(self._visible()):
+            self.tree.insert('', 'end', iid=f"w{k}", values=())
+        self._render()
+
+    def _render(self):
+        vis, total = self._visible(), len(self._rows)
+        self._top = max(0, min(self._top, total - vis))
+        for k in range(vis):
+            i = self._top + k
+            if i < total:
+                if not self.tree.exists(f"w{k}"):
+                    self.tree.insert('', k, iid=f"w{k}")
+                self.tree.item(f"w{k}", values=self._rows[i])
+            elif self.tree.exists(f"w{k}"):
+                self.tree.delete(f"w{k}")
+        if total:
+            self.vbar.set(self._top / total, min(1.0, (self._top + vis) / total))
+
+    def _scroll_to(self, top):
+        self._top = int(top)
+        self._render()
+
+    def _on_scrollbar(self, *args):
+        if not self._windowed:
+            return self.tree.yview(*args)
+        if args[0] == 'moveto':
+            self._scroll_to(float(args[1]) * len(self._rows))
+        elif args[0] == 'scroll':
+            step = int(args[1]) * (self._visible() if args[2] == 'pages' else 1)
+            self._scroll_to(self._top + step)
+
+    def _on_wheel(self, event):
+        if not self._windowed:
+            return None
+        if getattr(event, 'num', None) in (4, 5):
+            step = -3 if event.num == 4 else 3
+        else:
+            step = -3 if event.delta > 0 else 3
+        self._scroll_to(self._top + step)
+        return "break"
+
+
+class TrendChart:
+    """
+    Score-trend line chart drawn on a Canvas whose items are created once and then only moved
+    or re-texted: axes, grid lines, labels, one polyline for the series and a pool of point
+    markers. Long series are min/max-decimated to the plot width, so a redraw touches a
+    bounded number of items however many scores the class has.
+    """
+    PAD_L, PAD_R, PAD_T, PAD_B = 68, 26, 24, 44
+    MAX_MARKERS = 600
+
+    def __init__(self, canvas):
+        self.c = c = canvas
+        self.bg = c.create_rectangle(0, 0, 0, 0, fill="#f8f9fa", outline="")
+        self.axis_x = c.create_line(0, 0, 0, 0, fill="#8686AC", width=2)
+        self.axis_y = c.create_line(0, 0, 0, 0, fill="#8686AC", width=2)
+        self.empty = c.create_text(0, 0, text="📊 No data yet", fill="#6c757d", font=('Segoe UI', 16))
+        self.grid = []      # (line, label)
+        self.xticks = []    # (tick, label)
+        self.markers = []   # (outer, inner)
+        self.series = c.create_line(0, 0, 0, 0, fill="#8686AC", width=4, capstyle=tk.ROUND,
+                                    joinstyle=tk.ROUND, state='hidden', tags=("series",))
+        self.badges = {}
+        for name, fill in (("latest", "#22c55e"), ("best", "#16a34a")):
+            rect = c.create_rectangle(0, 0, 0, 0, fill=fill, outline=fill, state='hidden', tags=("badge",))
+            text = c.create_text(0, 0, anchor="sw", font=('Segoe UI', 12, 'bold'), fill="#8686AC",
+                                 state='hidden', tags=("badge",))
+            self.badges[name] = (rect, text)
+
+    def _pool(self, pool, count, factory):
+        """Grow `pool` to `count` entries (keeping z-order below the series) and hide the surplus."""
+        grew = False
+        while len(pool) < count:
+            pool.append(factory())
+            grew = True
+        for k, items in enumerate(pool):
+            for it in items:
+                self.c.itemconfigure(it, state='normal' if k < count else 'hidden')
+        if grew:
+            self.c.tag_raise("series"); self.c.tag_raise("marker"); self.c.tag_raise("badge")
+        return pool[:count]
+
+    @staticmethod
+    def _nice_ticks(vmax, lines=5):
+        if vmax <= 0: return [0, 1]
+        raw = vmax / lines
+        mag = 10 ** int(math.floor(math.log10(raw)))
+        step = min([1, 2, 2.5, 5, 10], key=lambda m: abs(raw - m*mag)) * mag
+        return [i*step for i in range(int(math.ceil(vmax / step)) + 1)]
+
+    def _set_badge(self, name, x, y, text, visible=True):
+        rect, txt = self.badges[name]
+        state = 'normal' if visible else 'hidden'
+        self.c.itemconfigure(rect, state=state); self.c.itemconfigure(txt, state=state)
+        if not visible:
+            return
+        self.c.coords(txt, x, y)
+        self.c.itemconfigure(txt, text=text)
+        bx, by, bx2, by2 = self.c.bbox(txt)
+        self.c.coords(rect, bx - 6, by - 6, bx2 + 6, by2 + 6)
+
+    def draw(self, scores, maxv):
+        c = self.c
+        scores = np.asarray(scores)
+        w = max(c.winfo_width(), c.winfo_reqwidth(), 480)
+        h = max(c.winfo_height(), c.winfo_reqheight(), 220)
+        L, R, T, B = self.PAD_L, self.PAD_R, self.PAD_T, self.PAD_B
+        plot_w = max(1, w - L - R)
+        plot_h = max(1, h - T - B)
+        c.coords(self.bg, 0, 0, w, h)
+        c.coords(self.axis_x, L, h - B, w - R, h - B)
+        c.coords(self.axis_y, L, h - B, L, T)
+
+        n = len(scores)
+        c.coords(self.empty, w//2, h//2)
+        c.itemconfigure(self.empty, state='hidden' if n else 'normal')
+        if not n:
+            self._pool(self.grid, 0, None); self._pool(self.xticks, 0, None); self._pool(self.markers, 0, None)
+            c.itemconfigure(self.series, state='hidden')
+            self._set_badge("latest", 0, 0, "", False); self._set_badge("best", 0, 0, "", False)
+            return
+
+        y_min, y_max = 0, max(1, maxv if maxv else int(scores.max()))
+        mapx = (lambda i: L + plot_w/2 + 0*i) if n == 1 else (lambda i: L + (i / (n - 1)) * plot_w)
+        mapy = lambda s: h - B - ((s - y_min) / max(1e-6, y_max - y_min)) * plot_h
+
+        # Grid + y labels
+        yticks = self._nice_ticks(y_max, lines=5)
+        grid = self._pool(self.grid, len(yticks), lambda: (
+            c.create_line(0, 0, 0, 0, fill="#505081", width=1),
+            c.create_text(0, 0, anchor="e", fill="#8686AC", font=('Segoe UI', 12))))
+        for (line, label), val in zip(grid, yticks):
+            y = mapy(val)
+            c.coords(line, L, y, w - R, y)
+            c.coords(label, L - 10, y); c.itemconfigure(label, text=f"{int(val)}")
+
+        # X ticks (at most 10)
+        xtick_count = min(10, n) if n > 1 else 0
+        ticks = self._pool(self.xticks, xtick_count, lambda: (
+            c.create_line(0, 0, 0, 0, fill="#6c757d", width=1),
+            c.create_text(0, 0, anchor="n", fill="#6c757d", font=('Segoe UI', 12))))
+        if xtick_count:
+            step = (n - 1) / (xtick_count - 1)
+            for j, (tick, label) in enumerate(ticks):
+                i = int(round(j * step)); x = mapx(i)
+                c.coords(tick, x, h - B, x, h - B + 4)
+                c.coords(label, x, h - B + 16); c.itemconfigure(label, text=str(i + 1))
+
+        # Series: one polyline over the decimated points
+        idxs = decimate_minmax(scores, max(10, int(plot_w)))
+        xs = mapx(idxs.astype(float))
+        ys = mapy(scores[idxs].astype(float))
+        density = len(idxs)
+        r_outer, r_inner = (6, 3) if density < 200 else (3, 2)
+        if density >= 2:
+            c.coords(self.series, *np.column_stack([xs, ys]).ravel().tolist())
+            c.itemconfigure(self.series, state='normal', width=4 if density < 200 else 3)
+        else:
+            c.itemconfigure(self.series, state='hidden')
+        markers = self._pool(self.markers, density if density <= self.MAX_MARKERS else 0, lambda: (
+            c.create_oval(0, 0, 0, 0, outline="#505081", fill="#0F0E47", width=2, tags=("marker",)),
+            c.create_oval(0, 0, 0, 0, outline="", fill="#8686AC", tags=("marker",))))
+        for (outer, inner), x, y in zip(markers, xs.tolist(), ys.tolist()):
+            c.coords(outer, x - r_outer, y - r_outer, x + r_outer, y + r_outer)
+            c.coords(inner, x - r_inner, y - r_inner, x + r_inner, y + r_inner)
+
+        # Latest / best badges
+        latest = int(scores[-1]); best_i = int(scores.argmax()); best = int(scores[best_i])
+        self._set_badge("latest", mapx(n - 1), mapy(latest) - 10, f" Latest: {latest}")
+        if best == latest:
+            self._set_badge("best", mapx(best_i), mapy(best) - 30, " Best ✓")
+        else:
+            self._set_badge("best", mapx(best_i), mapy(best) - 10, f" Best: {best}")
@@ -0,0 +1,19 @@
+# test_autocalib_truth.py
+# Ground-truth files for autocalib (CSV and JSON forms read the same way).
+
+import os, sys, json
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from autocalib import load_truth
+
+
+def test_csv_and_json_truth_agree(tmp_path):
+    csv_path = tmp_path / "truth.csv"
+    csv_path.write_text("image,student_id,Q02,Q01,Q03\nscan_1.webp,12345,B,A,\nscan_2,00001,-,E,C\n",
+                        encoding="utf-8")
+    json_path = tmp_path / "truth.json"
+    json_path.write_text(json.dumps({"scan_1.webp": {"student_id": "12345", "answers": "AB-"},
+                                     "scan_2": {"student_id": "00001", "answers": [4, -1, 2]}}), encoding="utf-8")
+    expected = {"scan_1": ([0, 1, -1], "12345"), "scan_2": ([4, -1, 2], "00001")}
+    assert load_truth(str(csv_path)) == expected
+    assert load_truth(str(json_path)) == expected
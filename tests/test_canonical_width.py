@@ -0,0 +1,65 @@
+# test_canonical_width.py
+# Canonical answers of a key set: items mapped past the graded length are kept (AnswerMatrix, store,
+# CSV) and partial item maps from a key file become one-to-one.
+
+import os, sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from analysis import AnswerMatrix, KeyMatrix
+from session_store import SessionStore, RESULT_FIELDS, read_results_csv
+from files_io import parse_answer_key_sets
+
+
+def _keys():
+    # Set B prints canonical items 3, 1, 2 as its items 1, 2, 3
+    return KeyMatrix({"A": ({1: 0, 2: 1, 3: 2}, {}), "B": ({1: 2, 2: 0, 3: 1}, {1: 3, 2: 1, 3: 2})})
+
+
+def test_limited_exam_keeps_items_mapped_past_its_length():
+    keys = _keys()
+    canon = keys.to_canonical([2, 0], keys.index("B"))   # 2 graded items, both right
+    assert canon == [0, -1, 2]
+
+    m = AnswerMatrix(n_items=2)
+    row = m.append(canon, {'score': 2, 'max': 2, 'key_set': 'B'})
+    assert m.row_answers(row) == [0, -1, 2]
+    assert m.width == 3
+    assert keys.grade(m.answers, keys.indices(["B"]), m.max_items).tolist() == [2]
+
+
+def test_store_csv_round_trip_keeps_canonical_width(tmp_path):
+    store = SessionStore(str(tmp_path))
+    rec = {k: "" for k in RESULT_FIELDS}
+    rec.update(filename="scan_b", student_id="12345", score=2, max=2, key_set="B", answers=[0, -1, 2])
+    store.add(rec)
+    path = store.export_csv()
+    store.close()
+    (back,) = list(read_results_csv(path))
+    assert back['max'] == 2 and back['answers'] == [0, -1, 2]
+
+
+def test_partial_item_map_from_key_file_is_a_swap(tmp_path):
+    path = tmp_path / "key.txt"
+    path.write_text("Midterm\n[A]\n" + "".join(f"{q}: {c}\n" for q, c in zip(range(1, 8), "ABCDEAB"))
+                    + "[B]\n1: C -> 7\n" + "".join(f"{q}: {c}\n" for q, c in zip(range(2, 8), "BCDEAA")),
+                    encoding="utf-8")
+    _, sets = parse_answer_key_sets(str(path))
+    assert sets["B"][1] == {1: 7, 7: 1}
+
+    keys = KeyMatrix(sets)
+    b = keys.index("B")
+    printed = [keys.key(b)[q] for q in range(1, 8)]       # a perfect set-B sheet
+    canon = keys.to_canonical(printed, b)
+    assert sorted(canon) == sorted(printed)                 # no answer overwritten
+    assert keys.grade(np.array([canon], np.int8), [b], [7]).tolist() == [7]
+
+
+def test_item_map_onto_one_slot_is_rejected(tmp_path):
+    path = tmp_path / "key.txt"
+    path.write_text("Quiz\n[B]\n1: A -> 3\n2: B -> 3\n3: C\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="both map to item 3"):
+        parse_answer_key_sets(str(path))
+    with pytest.raises(ValueError, match="not one-to-one"):
+        KeyMatrix({"B": ({1: 0, 2: 1, 3: 2}, {1: 3})})
@@ -0,0 +1,24 @@
+# test_decimate.py
+# analysis.decimate_minmax for every series length between the plot width and four times it.
+
+import os, sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from analysis import decimate_minmax
+
+
+def test_every_length_keeps_ends_and_extremes():
+    rng = np.random.default_rng(0)
+    for n_out in (10, 100, 386):
+        for n in range(n_out, 4 * n_out + 1):
+            y = rng.integers(0, 51, n)
+            idx = decimate_minmax(y, n_out)
+            assert idx[0] == 0 and idx[-1] == n - 1
+            assert np.all(np.diff(idx) > 0) and len(idx) <= n_out + 2
+            assert y[idx].min() == y.min() and y[idx].max() == y.max()
+
+
+def test_reported_lengths():
+    for n, n_out in ((101, 100), (801, 800), (1000, 300)):
+        assert len(decimate_minmax(np.arange(n, dtype=float), n_out)) <= n_out + 2
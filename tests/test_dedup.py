@@ -0,0 +1,36 @@
+# test_dedup.py
+# DedupIndex add / query / remove on synthetic hashes.
+
+import os, sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from dedup import DedupIndex
+
+
+def _bits(seed, n_answers=250):
+    rng = np.random.default_rng(seed)
+    ans = np.zeros((n_answers // 5, 5), bool)
+    ans[np.arange(len(ans)), rng.integers(0, 5, len(ans))] = True
+    ids = np.zeros((5, 10), bool)
+    ids[np.arange(5), rng.integers(0, 10, 5)] = True
+    return np.concatenate([ans.ravel(), ids.ravel()])
+
+
+def test_removed_sheet_is_no_longer_matched():
+    index = DedupIndex()
+    a, b = _bits(1), _bits(2)
+    index.add("std50", a, ("queued-1", "12345"))
+    index.add("std50", b, ("scan_b", "54321"))
+    rescan = a.copy()
+    rescan[3] = not rescan[3]   # one answer bit off
+    assert index.query("std50", rescan) == ("queued-1", "12345")
+
+    index.remove(("queued-1", "12345"))
+    index.remove(("queued-1", "12345"))   # unknown refs are ignored
+    assert index.query("std50", rescan) is None
+    assert index.query("std50", b) == ("scan_b", "54321")
+    assert len(index) == 1
+
+    index.add("std50", a, ("scan_a", "12345"))
+    assert index.query("std50", rescan) == ("scan_a", "12345")
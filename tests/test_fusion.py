@@ -0,0 +1,49 @@
+# test_fusion.py
+# ScoreFusion only reports a row settled when none of decide_rows' thresholds (margin, abs_min, z_min) is close.
+
+import os, sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from omr import ScoreFusion, decide_rows
+
+
+def _z(row):
+    return (row.max() - row.mean()) / (row.std() + 1e-6)
+
+
+def _fused(rows, cfg, noise, frames=6, seed=0):
+    rng = np.random.default_rng(seed)
+    f = ScoreFusion(cfg, min_frames=2, max_frames=frames + 1)
+    for _ in range(frames):
+        f.add(rows + rng.normal(0, noise, rows.shape), np.eye(10, 5) * 0.3)
+    return f
+
+
+def test_row_near_z_threshold_is_not_settled():
+    row = np.array([[0.30, 0.05, 0.10, 0.05, 0.22]])
+    cfg = {"abs_min": 0.05, "margin": 0.02, "z_min": 0.0}
+    f = _fused(row, cfg, noise=1e-3)
+    cfg["z_min"] = _z(f.mean_ans[0]) + 1e-3   # margin and abs_min are far off; z sits right at its threshold
+    assert f.row_confidence()[0] < f.z_conf
+    assert not f.confident()
+
+
+def test_clear_row_settles():
+    row = np.array([[0.30, 0.02, 0.02, 0.02, 0.02]])
+    cfg = {"abs_min": 0.05, "margin": 0.02, "z_min": 1.0}
+    f = _fused(row, cfg, noise=1e-4)
+    assert f.confident() and decide_rows(f.mean_ans, cfg) == [0]
+
+
+def test_z_standard_error_matches_finite_differences():
+    mean = np.array([[0.30, 0.05, 0.10, 0.05, 0.22], [0.1, 0.4, 0.12, 0.05, 0.3]])
+    sem = np.full_like(mean, 1e-3)
+    z, s_z = ScoreFusion._z_se(mean, sem)
+    for r in range(len(mean)):
+        grad = np.zeros(mean.shape[1])
+        for j in range(mean.shape[1]):
+            d = np.zeros(mean.shape[1]); d[j] = 1e-6
+            grad[j] = (_z(mean[r] + d) - _z(mean[r] - d)) / 2e-6
+        assert np.isclose(z[r], _z(mean[r]))
+        assert np.isclose(s_z[r], np.sqrt(((grad * sem[r]) ** 2).sum()), rtol=1e-4)
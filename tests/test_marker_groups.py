@@ -0,0 +1,63 @@
+# test_marker_groups.py
+# Synthetic multi-sheet frames for omr.find_marker_groups.
+
+import os, sys, time
+import cv2, numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from omr import find_marker_groups
+
+
+def _sheet(frame, x0, y0, w, h, angle, rng, marker=56, bubbles=40):
+    """Draw one sheet (white page, 4 solid corner squares, ringed bubble grid, filled bubbles); returns its corner centers."""
+    page = np.full((h, w), 225, np.uint8)
+    m = marker
+    corners = [(m, m), (w - 2*m, m), (w - 2*m, h - 2*m), (m, h - 2*m)]
+    for x, y in corners:
+        cv2.rectangle(page, (x, y), (x + m, y + m), 0, -1)
+    centers = [(int(w*0.15 + c*w*0.07), int(h*0.2 + r*h*0.06)) for c in range(10) for r in range(12)]
+    for x, y in centers:
+        cv2.circle(page, (x, y), 16, 90, 2)
+    for i in rng.choice(len(centers), bubbles, replace=False):
+        cv2.circle(page, centers[i], 15, 20, -1)
+    M = cv2.getRotationMatrix2D((w/2, h/2), angle, 1.0)
+    M[:, 2] += (x0, y0)
+    cv2.warpAffine(page, M, (frame.shape[1], frame.shape[0]), dst=frame, borderMode=cv2.BORDER_TRANSPARENT)
+    pts = np.array([(x + m/2, y + m/2) for x, y in corners], np.float32)
+    return cv2.transform(pts[None], M)[0]
+
+
+def _frame(layout, seed=0):
+    rng = np.random.default_rng(seed)
+    frame = np.full((2160, 3840), 70, np.uint8)   # dark table
+    truth = [_sheet(frame, x, y, 1300, 1800, a, rng) for x, y, a in layout]
+    return frame, truth
+
+
+def _matches(groups, truth, tol=12.0):
+    return all(any(np.abs(g - t).max() < tol for g in groups) for t in truth)
+
+
+def test_two_sheets_with_filled_bubbles():
+    frame, truth = _frame([(300, 180, 2.0), (2100, 160, -3.0)])
+    t0 = time.perf_counter()
+    groups = find_marker_groups(frame)
+    elapsed = time.perf_counter() - t0
+    assert len(groups) == 2
+    assert _matches(groups, truth)
+    assert elapsed < 2.0
+
+
+def test_reading_order():
+    frame, truth = _frame([(2100, 160, 0.0), (300, 180, 0.0)], seed=1)
+    groups = find_marker_groups(frame)
+    assert len(groups) == 2
+    assert groups[0][:, 0].mean() < groups[1][:, 0].mean()
+
+
+def test_bubbles_alone_are_not_sheets():
+    rng = np.random.default_rng(2)
+    frame = np.full((2160, 3840), 225, np.uint8)
+    for _ in range(300):
+        cv2.circle(frame, (int(rng.integers(50, 3790)), int(rng.integers(50, 2110))), 15, 20, -1)
+    assert find_marker_groups(frame) == []
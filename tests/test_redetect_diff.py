@@ -0,0 +1,49 @@
+# test_redetect_diff.py
+# redetect.diff_redetection keeps roster-corrected IDs instead of reverting them to the raw reading.
+
+import os, sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from analysis import AnswerMatrix
+from roster import RosterIndex
+from redetect import diff_redetection
+
+
+def _id_scores(student_id, misread=None):
+    """Clear fill at each digit of student_id; with misread=(col, digit) that digit wins narrowly."""
+    S = np.full((10, 5), 0.1)
+    rows = "1234567890"
+    for c, d in enumerate(student_id):
+        S[rows.index(d), c] = 0.9
+    if misread:
+        c, d = misread
+        S[rows.index(d), c] = 0.93
+    return S
+
+
+def _session(sid, answers):
+    m = AnswerMatrix(n_items=len(answers))
+    m.append(answers, {'filename': 'scan_a', 'student_id': sid, 'student_name': 'Ada',
+                       'score': 3, 'max': len(answers)})
+    return m
+
+
+def _det(sid, answers, S):
+    page = {'base': 'scan_a', 'answers': answers, 'student_id': sid, 'id_cols': [(0, [])] * 5, 'id_scores': S}
+    return dict(page, pages=[page], key_set='')
+
+
+def test_corrected_id_is_not_a_change():
+    answers = [0, 1, 2]
+    roster = RosterIndex.from_dict({'12345': 'Ada'})
+    det = _det('12346', answers, _id_scores('12345', misread=(4, '6')))
+    assert diff_redetection(_session('12345', answers), {'scan_a': det}, answers, roster) == []
+
+
+def test_uncorrectable_id_is_reported():
+    answers = [0, 1, 2]
+    roster = RosterIndex.from_dict({'12345': 'Ada'})
+    det = _det('98765', answers, _id_scores('98765'))
+    changes = diff_redetection(_session('12345', answers), {'scan_a': det}, answers, roster)
+    assert [(c['old_id'], c['new_id'], c['name']) for c in changes] == [('12345', '98765', '(Unknown)')]
@@ -0,0 +1,48 @@
+# test_running_stats.py
+# RunningStats / ItemAnalysis kept incrementally agree with a from-scratch computation across add/remove.
+
+import os, sys, statistics
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from analysis import RunningStats, ItemAnalysis
+
+
+def test_median_and_mode_match_statistics_across_add_remove():
+    rng = np.random.default_rng(1)
+    st, live = RunningStats(), {}          # live: row -> score, in row order
+    for step in range(600):
+        if live and rng.random() < 0.4:
+            # Re-detect style swap: a row leaves and comes back with a new score
+            row = int(rng.choice(list(live)))
+            st.remove(row, live[row])
+            if rng.random() < 0.5:
+                live[row] = int(rng.integers(0, 12))
+                st.add(row, live[row], f"s{row}")
+            else:
+                del live[row]
+        else:
+            live[step] = int(rng.integers(0, 12))
+            st.add(step, live[step], f"s{step}")
+        scores = [live[r] for r in sorted(live)]
+        assert st.n == len(scores) and st.total == sum(scores)
+        if scores:
+            assert st.median() == statistics.median(scores)
+            assert st.mode() == statistics.mode(scores)
+        else:
+            assert st.median() is None and st.mode() is None
+
+
+def test_item_analysis_remove_undoes_add():
+    kv = np.array([0, 1, 2, 3], np.int8)
+    ia = ItemAnalysis(4)
+    rows = [([0, 1, -1, 3], 3), ([0, 2, 2, 3], 3), ([4, 1, 2, -1], 2)]
+    for answers, score in rows:
+        ia.add(answers, score, np.array(answers) == kv)
+    before = (ia.choice.copy(), ia.by_score.copy(), ia.hist.copy())
+    answers, score = [1, 1, 1, 1], 1
+    ia.add(answers, score, np.array(answers) == kv)
+    ia.remove(answers, score, np.array(answers) == kv)
+    assert ia.n == 3
+    for a, b in zip(before, (ia.choice, ia.by_score, ia.hist)):
+        assert np.array_equal(a, b[:a.shape[0], :a.shape[1]] if b.ndim == 2 else b[:len(a)])
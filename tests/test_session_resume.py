@@ -0,0 +1,42 @@
+# test_session_resume.py
+# Which session folders count as resumable (session_store.has_session_data / latest_session_dir).
+
+import os, sys, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from session_store import SessionStore, RESULT_FIELDS, CSV_NAME, has_session_data, latest_session_dir
+
+
+def _rec(sid):
+    rec = {k: "" for k in RESULT_FIELDS}
+    rec.update(student_id=sid, score=3, max=5, answers=[0, 1, 2, -1, 3])
+    return rec
+
+
+def test_empty_store_and_header_only_csv_are_not_resumable(tmp_path):
+    d = tmp_path / "fresh"
+    d.mkdir()
+    SessionStore(str(d)).close()
+    (d / CSV_NAME).write_text(",".join(RESULT_FIELDS) + "\n", encoding="utf-8")
+    assert not has_session_data(str(d))
+
+
+def test_latest_skips_current_and_empty_sessions(tmp_path):
+    old = tmp_path / "old"
+    old.mkdir()
+    store = SessionStore(str(old))
+    store.add(_rec("12345"))
+    store.close()
+    assert has_session_data(str(old))
+
+    time.sleep(0.05)
+    current = tmp_path / "current"   # newer, but only an opened store
+    current.mkdir()
+    SessionStore(str(current)).close()
+    assert latest_session_dir(str(tmp_path), exclude=str(current)) == str(old)
+
+    store = SessionStore(str(current))
+    store.add(_rec("54321"))
+    store.close()
+    assert latest_session_dir(str(tmp_path), exclude=str(current)) == str(old)
+    assert latest_session_dir(str(tmp_path)) == str(current)